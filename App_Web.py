@@ -25,7 +25,8 @@ def intentar_login(email, password):
 
     # 3. Éxito: Guardamos todo en el st.session_state
     st.session_state["autenticado"] = True
-    st.session_state["sesion_auth"] = sesion
+    # Se guarda la Session (tokens), no el AuthResponse completo: es lo que usa database.py
+    st.session_state["sesion_auth"] = sesion.session
     st.session_state["perfil"] = perfil
     st.rerun() # Volver a ejecutar el script para mostrar la vista de "logueado"
 
@@ -0,0 +1,44 @@
+# almacen_cierre.py
+# Almacén local del snapshot de un cierre (el cierre y sus colecciones hijas) para
+# 5_Cierre_de_Caja.py, guardado en la sesión de Streamlit.
+#
+# Tras una escritura la página no descarta la caché ni vuelve a pedir el cierre completo:
+# las funciones de escritura de database.py devuelven las filas insertadas, actualizadas
+# o eliminadas y el almacén las aplica sobre su copia. Solo se reconcilia con el servidor
+# (database.obtener_snapshot_cierre) cuando la versión del cierre en el servidor
+# (database.version_cierre, columna cierres_caja.version) no es la esperada, es decir,
+# cuando otra sesión, de este u otro servidor de la app, escribió en el mismo cierre.
+
+class AlmacenCierre:
+    def __init__(self, cierre_id, snapshot, version):
+        self.cierre_id = cierre_id
+        self.snapshot = snapshot   # mismo formato que database.obtener_snapshot_cierre (sin pagos)
+        self.version = version     # versión del cierre que refleja el snapshot (None = desactualizado)
+
+    def vigente(self, version):
+        return self.version is not None and self.version == version
+
+    def aplicar(self, version, filas=None, eliminados=None, cierre=None):
+        """
+        Aplica una escritura propia ya confirmada por el servidor.
+        version: database.version_cierre() después de escribir. Cada petición de escritura
+        la avanza en uno (o en nada, si no tocó filas del cierre); si avanzó más, otra
+        sesión escribió en medio: el almacén queda desactualizado y devuelve False.
+        filas: {coleccion: [filas a insertar o reemplazar por id]}
+        eliminados: {coleccion: [ids a quitar]}
+        cierre: columnas actualizadas de la fila del cierre.
+        """
+        if self.version is None or version not in (self.version, self.version + 1):
+            self.version = None
+            return False
+        for coleccion in set(filas or {}) | set(eliminados or {}):
+            por_id = {str(fila['id']): fila for fila in self.snapshot[coleccion]}
+            for fila_id in (eliminados or {}).get(coleccion) or []:
+                por_id.pop(str(fila_id), None)
+            for fila in (filas or {}).get(coleccion) or []:
+                por_id[str(fila['id'])] = {**por_id.get(str(fila['id']), {}), **fila}
+            self.snapshot[coleccion] = sorted(por_id.values(), key=lambda fila: fila.get('created_at') or '')
+        if cierre:
+            self.snapshot['cierre'].update(cierre)
+        self.version = version
+        return True
@@ -0,0 +1,110 @@
+# analitica.py
+# Capa analítica mínima para los reportes: consultas declarativas de filtro, agrupación
+# y pivote sobre tablas columnares de Arrow, ejecutadas por el motor de pyarrow (Acero)
+# en lugar de groupby hechos a mano en pandas.
+#
+# Uso típico:
+#   datos = analitica.tabla(filas)                       # lista de dicts o DataFrame
+#   analitica.agrupar(datos, por=["Fuente"], medidas={"Total": ("Total", "sum")},
+#                     filtros=[("Tipo", "!=", "interno")], orden=[("Total", "descending")])
+#   analitica.pivotar(datos, indice="Fuente", columnas="Metodo", valor="Total")
+#
+# Las funciones devuelven DataFrames de pandas, listos para st.dataframe / st.bar_chart.
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+AGREGACIONES = {"sum", "mean", "min", "max", "count", "count_distinct"}
+
+_OPERADORES = {
+    "==": pc.equal,
+    "!=": pc.not_equal,
+    ">": pc.greater,
+    ">=": pc.greater_equal,
+    "<": pc.less,
+    "<=": pc.less_equal,
+}
+
+
+def tabla(datos):
+    """Convierte una lista de dicts, un DataFrame o una tabla Arrow en tabla Arrow."""
+    if isinstance(datos, pa.Table):
+        return datos
+    if isinstance(datos, pd.DataFrame):
+        return pa.Table.from_pandas(datos, preserve_index=False)
+    return pa.Table.from_pylist(list(datos))
+
+
+def columna(datos, nombre, por_defecto=None, tipo=None):
+    """
+    Columna 'nombre' convertida a 'tipo' y con los nulos reemplazados por por_defecto. Si la
+    tabla no la tiene (p. ej. un embebido aplanado que vino vacío en todas las filas), toda
+    la columna vale por_defecto.
+    """
+    datos = tabla(datos)
+    if nombre not in datos.column_names or pa.types.is_null(datos.schema.field(nombre).type):
+        return pa.array([por_defecto] * datos.num_rows, type=tipo)
+    valores = datos.column(nombre)
+    if tipo is not None:
+        valores = valores.cast(tipo)
+    return pc.fill_null(valores, por_defecto) if por_defecto is not None else valores
+
+
+def filtrar(datos, filtros=None):
+    """
+    Aplica filtros [(columna, operador, valor)] con operador en ==, !=, >, >=, <, <=, 'in'.
+    Un valor None se ignora (igual que los filtros opcionales de database.py).
+    """
+    datos = tabla(datos)
+    mascara = None
+    for columna, operador, valor in filtros or []:
+        if valor is None:
+            continue
+        if operador == "in":
+            condicion = pc.is_in(datos.column(columna), value_set=pa.array(list(valor)))
+        else:
+            condicion = _OPERADORES[operador](datos.column(columna), valor)
+        mascara = condicion if mascara is None else pc.and_(mascara, condicion)
+    return datos if mascara is None else datos.filter(mascara)
+
+
+def agrupar(datos, por, medidas, filtros=None, orden=None):
+    """
+    Agrupa por las columnas 'por' y calcula 'medidas' {nombre: (columna, agregación)}.
+    orden: [(columna, "ascending" | "descending")]. Devuelve un DataFrame.
+    """
+    datos = filtrar(datos, filtros)
+    for nombre, (_, agregacion) in medidas.items():
+        if agregacion not in AGREGACIONES:
+            raise ValueError(f"Agregación no soportada para '{nombre}': {agregacion}")
+    resultado = datos.group_by(list(por)).aggregate([(columna, agregacion) for columna, agregacion in medidas.values()])
+    # Acero nombra las medidas "columna_agregacion": se renombran a los nombres pedidos
+    nombres = {f"{columna}_{agregacion}": nombre for nombre, (columna, agregacion) in medidas.items()}
+    resultado = resultado.rename_columns([nombres.get(c, c) for c in resultado.column_names])
+    resultado = resultado.select(list(por) + list(medidas))
+    if orden:
+        resultado = resultado.sort_by(list(orden))
+    return resultado.to_pandas()
+
+
+def totales(datos, medidas, filtros=None):
+    """Medidas {nombre: (columna, agregación)} sobre toda la tabla filtrada. Devuelve {nombre: valor}."""
+    datos = filtrar(datos, filtros)
+    resultado = {}
+    for nombre, (columna, agregacion) in medidas.items():
+        if agregacion not in AGREGACIONES:
+            raise ValueError(f"Agregación no soportada para '{nombre}': {agregacion}")
+        valor = getattr(pc, agregacion)(datos.column(columna)).as_py() if datos.num_rows else None
+        resultado[nombre] = valor if valor is not None else (0 if agregacion in ("sum", "count", "count_distinct") else None)
+    return resultado
+
+
+def pivotar(datos, indice, columnas, valor, agregacion="sum", filtros=None):
+    """Tabla cruzada: una fila por 'indice', una columna por cada valor de 'columnas' (celdas vacías = 0)."""
+    agrupado = agrupar(datos, por=[indice, columnas], medidas={valor: (valor, agregacion)}, filtros=filtros)
+    if agrupado.empty:
+        return pd.DataFrame()
+    cruzada = agrupado.pivot(index=indice, columns=columnas, values=valor).fillna(0)
+    cruzada.columns.name = None
+    return cruzada
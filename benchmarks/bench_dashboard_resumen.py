@@ -0,0 +1,84 @@
+# benchmarks/bench_dashboard_resumen.py
+# Compara get_dashboard_resumen_data (consultas en paralelo) con la versión secuencial
+# anterior sobre el backend local con latencia simulada por petición.
+#
+# Uso:  python benchmarks/bench_dashboard_resumen.py [latencia_ms] [repeticiones]
+
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+LATENCIA_MS = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+REPETICIONES = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+os.environ["DB_BACKEND"] = "local"
+os.environ["LOCAL_DB_PATH"] = ":memory:"
+os.environ["LOCAL_DB_LATENCIA_MS"] = str(LATENCIA_MS)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalogos  # noqa: E402
+import database  # noqa: E402
+
+# Fuera de `streamlit run` no hay contexto de script: se silencia el aviso en cada consulta
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+
+FECHA = "2026-01-15"
+
+
+def sembrar():
+    metodos = ['Efectivo', 'Yappy', 'Tarjeta', 'Credito']
+    database._cliente_local.cargar_datos({
+        'sucursales': [{'id': 's1', 'sucursal': 'Centro'}],
+        'metodos_pago': [{'id': f'm{i}', 'nombre': m, 'tipo': 'interno' if m == 'Credito' else 'externo', 'is_activo': True}
+                         for i, m in enumerate(metodos)],
+        'socios': [{'id': 'so1', 'nombre': 'Socio A'}, {'id': 'so2', 'nombre': 'Socio B'}],
+        'cierres_caja': [{'id': 'c1', 'sucursal_id': 's1', 'fecha_operacion': FECHA, 'estado': 'ABIERTO'}],
+        'pagos': [{'sucursal': 'Centro', 'monto': 1 + i % 20, 'metodo_pago': metodos[i % 4],
+                   'created_at': f"{FECHA}T{10 + i % 12:02d}:{i % 60:02d}:00+00:00"} for i in range(500)],
+        'ingresos_adicionales': [{'cierre_id': 'c1', 'socio_id': s, 'metodo_pago': m, 'monto': 5}
+                                 for s in ('so1', 'so2') for m in metodos],
+    })
+
+
+def dashboard_secuencial(cierre_id):
+    """Las mismas consultas que get_dashboard_resumen_data, una detrás de otra (versión anterior)."""
+    supabase = database.supabase
+    metodos_data, _ = database.obtener_metodos_pago()
+    metodos_info = {m['nombre']: m['tipo'] for m in metodos_data}
+    cierre = supabase.table('cierres_caja').select('fecha_operacion, sucursales(sucursal)').eq('id', cierre_id).single().execute().data
+    fecha_inicio = datetime.strptime(cierre['fecha_operacion'], '%Y-%m-%d')
+    totales_rayo = database._totales_pagos_por_metodo(cierre['sucursales']['sucursal'], fecha_inicio, fecha_inicio + timedelta(days=1))
+    ingresos = supabase.table('ingresos_adicionales').select('metodo_pago, monto, socios(nombre)').eq('cierre_id', cierre_id).execute().data
+    totales_socios = {}
+    for ingreso in ingresos:
+        if metodos_info.get(ingreso['metodo_pago']) != 'interno':
+            por_metodo = totales_socios.setdefault(ingreso['socios']['nombre'], {})
+            por_metodo[ingreso['metodo_pago']] = por_metodo.get(ingreso['metodo_pago'], Decimal('0.0')) + Decimal(str(ingreso['monto']))
+    return {"rayo": totales_rayo, "socios": totales_socios}, None
+
+
+def medir(nombre, funcion):
+    tiempos = []
+    resultado = None
+    for _ in range(REPETICIONES):
+        catalogos.limpiar()  # sin caché de catálogos: las cuatro consultas van a la base de datos
+        inicio = time.perf_counter()
+        resultado, err = funcion('c1')
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if err:
+            raise SystemExit(f"{nombre}: {err}")
+    tiempos.sort()
+    print(f"{nombre:<12} mediana {tiempos[len(tiempos) // 2]:8.1f} ms   mín {tiempos[0]:8.1f} ms   máx {tiempos[-1]:8.1f} ms")
+    return resultado
+
+
+if __name__ == "__main__":
+    sembrar()
+    print(f"Latencia simulada: {LATENCIA_MS:g} ms por petición, {REPETICIONES} repeticiones")
+    secuencial = medir("secuencial", dashboard_secuencial)
+    concurrente = medir("concurrente", database.get_dashboard_resumen_data)
+    assert secuencial == concurrente, "Los resultados no coinciden"
+    print("Resultados idénticos.")
@@ -0,0 +1,144 @@
+# cache_compartida.py
+# Caché en proceso con protección contra estampidas, compartida por todas las sesiones del
+# servidor de Streamlit. La usan catalogos.py (catálogos) y etiquetas.cache_data (el resto
+# de las lecturas cacheadas de las páginas).
+#
+# Cada entrada se guarda con las versiones de lo que depende (tablas de catálogo o etiquetas);
+# si alguna cambió, la entrada ya no sirve. Bajo carga (muchas sesiones pidiendo la misma
+# clave a la vez) se evita repetir consultas:
+#   - single-flight: si una lectura de la misma clave ya está en curso, las demás sesiones
+#     esperan su resultado en lugar de lanzar la misma consulta.
+#   - stale-while-revalidate: una entrada expirada por TTL (no invalidada) se sigue sirviendo
+#     durante ttl_obsoleto segundos mientras una única recarga corre en segundo plano.
+# Así la base de datos ve como mucho una consulta por clave y por intervalo de refresco.
+
+import copy
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pool_clientes
+
+_ejecutor_recargas = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("CATALOGOS_HILOS_MAX", 2)),
+    thread_name_prefix="recargas_cache"
+)
+
+
+class _Vuelo:
+    """Carga en curso de una clave: quien la lanza la ejecuta; los demás esperan su resultado."""
+    def __init__(self):
+        self.listo = threading.Event()
+        self.datos = None
+        self.error = None
+        self.excepcion = None
+
+
+class CacheCompartida:
+    """
+    Entradas clave -> (versiones al cargar, instante de expiración, datos).
+    descripcion: qué se carga, para los mensajes de error ("el catálogo").
+    max_entradas: al superarlo se descartan primero las entradas que ya no se pueden servir
+    y luego las que expiran antes (None = sin límite).
+    """
+    def __init__(self, descripcion, ttl_obsoleto, max_entradas=None):
+        self.descripcion = descripcion
+        self.ttl_obsoleto = ttl_obsoleto
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas = {}
+        self._en_curso = {}   # (clave, versiones) -> _Vuelo de la carga en curso
+        self._contadores = {"aciertos": 0, "obsoletos": 0, "coalescidas": 0, "cargas": 0, "recargas": 0}
+
+    def limpiar(self):
+        """Descarta todas las entradas."""
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """
+        Contadores desde que arrancó el proceso: aciertos, entradas obsoletas servidas, lecturas
+        que esperaron una carga ajena (coalescidas), consultas a la base de datos (cargas) y,
+        de ellas, las hechas en segundo plano (recargas).
+        """
+        with self._lock:
+            return dict(self._contadores)
+
+    def _registrar_vuelo(self, clave, versiones):
+        """Con _lock tomado: devuelve (vuelo, propio); propio=False si ya había una carga en curso."""
+        vuelo = self._en_curso.get((clave, versiones))
+        if vuelo is not None:
+            return vuelo, False
+        vuelo = self._en_curso[(clave, versiones)] = _Vuelo()
+        self._contadores["cargas"] += 1
+        return vuelo, True
+
+    def _purgar(self, ahora):
+        """Con _lock tomado: aplica max_entradas."""
+        if self.max_entradas is None or len(self._entradas) <= self.max_entradas:
+            return
+        for clave, entrada in list(self._entradas.items()):
+            if entrada[1] + self.ttl_obsoleto <= ahora:
+                del self._entradas[clave]
+        sobrantes = len(self._entradas) - self.max_entradas
+        if sobrantes > 0:
+            for clave in sorted(self._entradas, key=lambda c: self._entradas[c][1])[:sobrantes]:
+                del self._entradas[clave]
+
+    def _ejecutar_vuelo(self, vuelo, clave, versiones, ttl, cargar):
+        # Si cargar() no termina normalmente (p. ej. StopException/RerunException de Streamlit,
+        # que no heredan de Exception), vuelo.error queda puesto para quienes esperan
+        vuelo.error = f"La carga de {self.descripcion} se interrumpió."
+        try:
+            vuelo.datos, vuelo.error = cargar()
+        except Exception as e:
+            vuelo.datos, vuelo.error, vuelo.excepcion = None, f"Error al cargar {self.descripcion}: {e}", e
+        finally:
+            # La limpieza y el aviso a los que esperan van siempre: si no, quedarían bloqueados
+            with self._lock:
+                if not vuelo.error:
+                    # Si hubo una escritura durante la carga, la versión ya no coincide y la
+                    # siguiente lectura volverá a consultar la base de datos.
+                    vuelo.datos = copy.deepcopy(vuelo.datos)
+                    ahora = time.monotonic()
+                    self._entradas[clave] = (versiones, ahora + ttl if ttl is not None else float("inf"), vuelo.datos)
+                    self._purgar(ahora)
+                del self._en_curso[(clave, versiones)]
+            vuelo.listo.set()
+
+    def obtener(self, clave, versiones, cargar, ttl, relanzar=False):
+        """
+        Devuelve (datos, error) para 'clave' desde la caché si no expiró (ttl None = no expira)
+        y sus versiones coinciden con 'versiones'. Si solo expiró (hace menos de ttl_obsoleto),
+        devuelve la entrada vieja y la recarga en segundo plano; si no, llama a
+        cargar() -> (datos, error), compartiendo la consulta con las lecturas simultáneas de la
+        misma clave. Los resultados con error no se guardan. Se devuelve siempre una copia.
+        relanzar: si cargar() lanzó una excepción, se relanza en lugar de devolverla como error.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            vigente = entrada is not None and entrada[0] == versiones
+            if vigente and entrada[1] > ahora:
+                self._contadores["aciertos"] += 1
+                return copy.deepcopy(entrada[2]), None
+            if vigente and entrada[1] + self.ttl_obsoleto > ahora:
+                self._contadores["obsoletos"] += 1
+                vuelo, propio = self._registrar_vuelo(clave, versiones)
+                if propio:
+                    self._contadores["recargas"] += 1
+                    _ejecutor_recargas.submit(pool_clientes.en_sesion_actual(self._ejecutar_vuelo),
+                                              vuelo, clave, versiones, ttl, cargar)
+                return copy.deepcopy(entrada[2]), None
+            vuelo, propio = self._registrar_vuelo(clave, versiones)
+            if not propio:
+                self._contadores["coalescidas"] += 1
+
+        if propio:
+            self._ejecutar_vuelo(vuelo, clave, versiones, ttl, cargar)
+        else:
+            vuelo.listo.wait()
+        if relanzar and vuelo.excepcion is not None:
+            raise vuelo.excepcion
+        return copy.deepcopy(vuelo.datos), vuelo.error
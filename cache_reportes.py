@@ -0,0 +1,241 @@
+# cache_reportes.py
+# Caché local en disco (Parquet) de los cierres CERRADOS y sus filas hijas, para los reportes.
+#
+# Un cierre cerrado casi nunca cambia, así que los reportes de 1_Reportes_Admin.py no
+# necesitan volver a descargarlo. database.sincronizar_cache_reportes() trae solo los cierres
+# cerrados desde la última sincronización (por fecha_hora_cierre_real) y los agrega aquí;
+# database.reabrir_cierre() llama a invalidar_cierre() para quitarlo de la caché.
+#
+# Cada tabla es una carpeta con archivos Parquet (una parte por sincronización, compactadas
+# cuando se acumulan) que se leen con memory map. Este módulo no consulta la base de datos.
+#
+# Las columnas embebidas de PostgREST ({"perfiles": {"nombre": ...}}) se guardan aplanadas
+# ("perfiles.nombre") y las columnas JSON como texto; filas() devuelve los dicts con la
+# misma forma que las consultas originales.
+
+import json
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+CARPETA_CACHE = os.environ.get("CACHE_REPORTES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_reportes"))
+TABLAS = ["cierres", "gastos", "ingresos_adicionales", "deliveries", "compras"]
+MAX_PARTES = 20  # al superarlo, las partes de una tabla se compactan en un solo archivo
+
+# Relaciones embebidas que se guardan aplanadas como "relacion.campo"
+RELACIONES_EMBEBIDAS = {"sucursales", "perfiles", "gastos_categorias", "socios"}
+
+_LOCK = threading.RLock()
+
+
+def _carpeta(tabla):
+    return os.path.join(CARPETA_CACHE, tabla)
+
+
+def _ruta_meta():
+    return os.path.join(CARPETA_CACHE, "meta.json")
+
+
+def _partes(tabla):
+    carpeta = _carpeta(tabla)
+    if not os.path.isdir(carpeta):
+        return []
+    return sorted(os.path.join(carpeta, nombre) for nombre in os.listdir(carpeta) if nombre.endswith(".parquet"))
+
+
+# --- Metadatos (marca de sincronización) ---
+def leer_meta():
+    """{"marca": fecha_hora_cierre_real más reciente en caché (ISO) o None, "sincronizado": epoch}."""
+    try:
+        with open(_ruta_meta(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"marca": None, "sincronizado": None}
+
+
+def guardar_meta(meta):
+    with _LOCK:
+        os.makedirs(CARPETA_CACHE, exist_ok=True)
+        temporal = f"{_ruta_meta()}.{uuid.uuid4().hex}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temporal, _ruta_meta())
+
+
+# --- Conversión filas <-> Arrow ---
+def _aplanar(fila, columnas_json):
+    plana = {}
+    for clave, valor in fila.items():
+        if clave in RELACIONES_EMBEBIDAS and (isinstance(valor, dict) or valor is None):
+            for subclave, subvalor in (valor or {}).items():
+                plana[f"{clave}.{subclave}"] = subvalor
+        elif isinstance(valor, (dict, list)):
+            plana[clave] = json.dumps(valor)
+            columnas_json.add(clave)
+        else:
+            plana[clave] = valor
+    return plana
+
+
+def a_tabla_arrow(filas):
+    """Filas de PostgREST como tabla Arrow con la misma forma que la caché (embebidos aplanados)."""
+    columnas_json = set()
+    planas = [_aplanar(fila, columnas_json) for fila in filas]
+    tabla = pa.Table.from_pylist(planas)
+    return tabla.replace_schema_metadata({"columnas_json": json.dumps(sorted(columnas_json))})
+
+
+def _anidar(fila, columnas_json):
+    anidada, relaciones = {}, {}
+    for clave, valor in fila.items():
+        if "." in clave:
+            relacion, campo = clave.split(".", 1)
+            relaciones.setdefault(relacion, {})[campo] = valor
+        elif clave in columnas_json and isinstance(valor, str):
+            anidada[clave] = json.loads(valor)
+        else:
+            anidada[clave] = valor
+    for relacion, campos in relaciones.items():
+        # Una relación sin fila (FK nula) se guardó sin campos: vuelve a ser None
+        anidada[relacion] = campos if any(v is not None for v in campos.values()) else None
+    return anidada
+
+
+# --- Lectura ---
+def leer_tabla(tabla):
+    """Tabla Arrow con todas las partes de 'tabla' (leídas con memory map), o None si está vacía."""
+    with _LOCK:
+        partes = [pq.read_table(ruta, memory_map=True) for ruta in _partes(tabla)]
+    if not partes:
+        return None
+    columnas_json = set()
+    for parte in partes:
+        columnas_json.update(json.loads((parte.schema.metadata or {}).get(b"columnas_json", b"[]")))
+    combinada = pa.concat_tables([p.replace_schema_metadata(None) for p in partes], promote_options="permissive")
+    return combinada.replace_schema_metadata({"columnas_json": json.dumps(sorted(columnas_json))})
+
+
+def leer_df(tabla):
+    """DataFrame de 'tabla' (columnas aplanadas, JSON como texto). Vacío si no hay caché."""
+    arrow = leer_tabla(tabla)
+    return arrow.to_pandas() if arrow is not None else pd.DataFrame()
+
+
+def tabla_filtrada(tabla, igual=None, en=None, desde=None, hasta=None, columna_fecha="created_at"):
+    """
+    Tabla Arrow (columnas aplanadas) de 'tabla' filtrada: igual={columna: valor},
+    en={columna: [valores]}, y columna_fecha entre desde y hasta (textos
+    'YYYY-MM-DD HH:MM:SS' en UTC, como los filtros gte/lte de las consultas).
+    Ordenada de la fila más reciente a la más antigua. None si no hay caché.
+    """
+    arrow = leer_tabla(tabla)
+    if arrow is None:
+        return None
+    df = arrow.select([c for c in arrow.column_names if c in set(igual or {}) | set(en or {}) | {columna_fecha}]).to_pandas()
+
+    mascara = pd.Series(True, index=df.index)
+    for columna, valor in (igual or {}).items():
+        if valor is not None:
+            mascara &= (df[columna] == valor) if columna in df else False
+    for columna, valores in (en or {}).items():
+        if valores:
+            mascara &= df[columna].isin(list(valores)) if columna in df else False
+    fechas = pd.to_datetime(df[columna_fecha], utc=True, format="ISO8601") if columna_fecha in df else None
+    if fechas is not None and desde:
+        mascara &= fechas >= pd.Timestamp(desde, tz="UTC")
+    if fechas is not None and hasta:
+        mascara &= fechas <= pd.Timestamp(hasta, tz="UTC")
+    seleccion = fechas[mascara].sort_values(ascending=False, kind="stable").index if fechas is not None else df.index[mascara]
+    return arrow.take(pa.array(seleccion, type=pa.int64()))
+
+
+def filas(tabla, igual=None, en=None, desde=None, hasta=None, columna_fecha="created_at"):
+    """Como tabla_filtrada(), pero como filas con la misma forma que las devuelve PostgREST."""
+    arrow = tabla_filtrada(tabla, igual, en, desde, hasta, columna_fecha)
+    if arrow is None:
+        return []
+    columnas_json = set(json.loads(arrow.schema.metadata[b"columnas_json"]))
+    return [_anidar(fila, columnas_json) for fila in arrow.to_pylist()]
+
+
+def ids_cierres():
+    """Ids de los cierres guardados en la caché."""
+    arrow = leer_tabla("cierres")
+    return set(arrow.column("id").to_pylist()) if arrow is not None else set()
+
+
+# --- Escritura ---
+def _escribir_parte(tabla, arrow):
+    os.makedirs(_carpeta(tabla), exist_ok=True)
+    nombre = f"parte-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+    temporal = os.path.join(_carpeta(tabla), f"{nombre}.tmp")
+    pq.write_table(arrow, temporal)
+    os.replace(temporal, os.path.join(_carpeta(tabla), nombre))
+
+
+def _reescribir(tabla, conservar):
+    """Reescribe 'tabla' en un solo archivo con las filas donde conservar(arrow) es True."""
+    arrow = leer_tabla(tabla)
+    partes = _partes(tabla)
+    if arrow is not None:
+        arrow = arrow.filter(conservar(arrow)) if conservar is not None else arrow
+        if arrow.num_rows:
+            _escribir_parte(tabla, arrow)
+    for ruta in partes:
+        os.remove(ruta)
+
+
+def _columna_cierre(tabla):
+    return "id" if tabla == "cierres" else "cierre_id"
+
+
+def quitar_cierres(cierre_ids):
+    """Quita de todas las tablas las filas de los cierres indicados."""
+    ids = pa.array(list(cierre_ids), type=pa.string())
+    if not len(ids):
+        return
+    with _LOCK:
+        for tabla in TABLAS:
+            columna = _columna_cierre(tabla)
+            arrow = leer_tabla(tabla)
+            if arrow is None or columna not in arrow.column_names:
+                continue
+            presentes = pc.is_in(arrow.column(columna).cast(pa.string()), value_set=ids)
+            if pc.any(presentes).as_py():
+                _reescribir(tabla, lambda t, c=columna: pc.invert(pc.is_in(t.column(c).cast(pa.string()), value_set=ids)))
+
+
+def agregar(filas_por_tabla):
+    """
+    Agrega a la caché cierres cerrados y sus filas hijas ({"cierres": [...], "gastos": [...], ...}).
+    Si algún cierre ya estaba (se reabrió y se volvió a cerrar), se reemplaza.
+    """
+    with _LOCK:
+        quitar_cierres([c['id'] for c in filas_por_tabla.get("cierres", [])])
+        for tabla in TABLAS:
+            nuevas = filas_por_tabla.get(tabla) or []
+            if nuevas:
+                _escribir_parte(tabla, a_tabla_arrow(nuevas))
+            if len(_partes(tabla)) > MAX_PARTES:
+                _reescribir(tabla, None)
+
+
+def invalidar_cierre(cierre_id):
+    """Quita un cierre de la caché (se llama al reabrirlo)."""
+    quitar_cierres([cierre_id])
+
+
+def limpiar():
+    """Borra toda la caché (la próxima sincronización la reconstruye)."""
+    with _LOCK:
+        for tabla in TABLAS:
+            for ruta in _partes(tabla):
+                os.remove(ruta)
+        if os.path.exists(_ruta_meta()):
+            os.remove(_ruta_meta())
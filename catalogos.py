@@ -0,0 +1,72 @@
+# catalogos.py
+# Caché en proceso de los catálogos (datos de referencia: sucursales, métodos de pago,
+# socios, categorías de gastos, usuarios).
+#
+# Es compartida por todas las sesiones y páginas del servidor de Streamlit. Cada tabla
+# tiene un contador de versión; las funciones de escritura de database.py llaman a
+# invalidar(tabla) tras escribir, y cualquier lectura posterior vuelve a la base de datos.
+# El TTL (CATALOGOS_TTL_S) solo cubre los cambios hechos fuera de la app (p. ej. desde el
+# panel de Supabase).
+#
+# Bajo carga se sirve con single-flight y stale-while-revalidate (ver cache_compartida.py):
+# una entrada expirada por TTL (no invalidada) se sigue sirviendo durante TTL_OBSOLETO
+# segundos mientras una única recarga corre en segundo plano. Así la base de datos ve como
+# mucho una consulta por clave y por intervalo de refresco.
+
+import functools
+import os
+import threading
+
+from cache_compartida import CacheCompartida
+
+TTL_CATALOGOS = int(os.environ.get("CATALOGOS_TTL_S", 600))
+TTL_OBSOLETO = int(os.environ.get("CATALOGOS_TTL_OBSOLETO_S", 3600))
+
+_LOCK = threading.Lock()
+_VERSIONES = {}   # tabla -> versión
+_CACHE = CacheCompartida("el catálogo", TTL_OBSOLETO)
+
+
+def version(tabla):
+    return _VERSIONES.get(tabla, 0)
+
+
+def invalidar(*tablas):
+    """Incrementa la versión de las tablas: las entradas que dependen de ellas dejan de ser válidas."""
+    with _LOCK:
+        for tabla in tablas:
+            _VERSIONES[tabla] = _VERSIONES.get(tabla, 0) + 1
+
+
+def limpiar():
+    """Descarta todas las entradas (las versiones se mantienen)."""
+    _CACHE.limpiar()
+
+
+def estadisticas():
+    """Contadores de la caché de catálogos (ver CacheCompartida.estadisticas)."""
+    return _CACHE.estadisticas()
+
+
+def obtener(clave, tablas, cargar, ttl=TTL_CATALOGOS):
+    """
+    Devuelve (datos, error) para 'clave' desde la caché si no expiró y ninguna de sus
+    'tablas' cambió de versión (ver CacheCompartida.obtener).
+    """
+    with _LOCK:
+        versiones_actuales = tuple(_VERSIONES.get(t, 0) for t in tablas)
+    return _CACHE.obtener(clave, versiones_actuales, cargar, ttl)
+
+
+def catalogo(*tablas, ttl=TTL_CATALOGOS):
+    """
+    Decorador para las funciones de lectura de catálogos de database.py (que devuelven
+    (datos, error)). La clave de caché es el nombre de la función más sus argumentos.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            clave = (funcion.__name__, args, tuple(sorted(kwargs.items())))
+            return obtener(clave, tablas, lambda: funcion(*args, **kwargs), ttl=ttl)
+        return envoltura
+    return decorador
@@ -0,0 +1,135 @@
+# cubo_ingresos.py
+# Cubo OLAP en memoria de los ingresos del resumen del día (cierres_caja.resumen_del_dia).
+#
+# Cada celda es el total de una combinación (sucursal_id, fecha, usuario_id, fuente,
+# método, tipo): fuente es 'Rayo (POS)' o el nombre del socio y tipo es interno/externo.
+# La pestaña "Análisis de Ingresos" corta el cubo según los filtros en lugar de volver a
+# agregar filas crudas. database.cargar_cubo_ingresos() lo construye una vez por proceso
+# (con las filas ya agregadas por cierre de la función SQL reporte_ingresos_desde_json) y
+# database.guardar_resumen_del_dia() lo actualiza de forma incremental: la contribución
+# anterior del cierre se resta y se suma la nueva.
+
+import threading
+import time
+from decimal import Decimal
+
+import pyarrow as pa
+
+import analitica
+
+DIMENSIONES = ("sucursal_id", "fecha", "usuario_id", "fuente", "metodo", "tipo")
+FUENTE_RAYO = "Rayo (POS)"
+
+
+def celdas_de_cierre(cierre):
+    """Contribución de un cierre al cubo: {(sucursal_id, fecha, usuario_id, fuente, método, tipo): Decimal}."""
+    resumen = cierre.get('resumen_del_dia') or {}
+    base = (cierre.get('sucursal_id'), cierre.get('fecha_operacion'), cierre.get('usuario_id'))
+    celdas = {}
+    items = [(FUENTE_RAYO, r.get('metodo'), r.get('tipo'), r.get('total')) for r in resumen.get('desglose_rayo', [])]
+    items += [(so.get('socio'), d.get('metodo'), 'externo', d.get('total'))
+              for so in resumen.get('totales_por_socio', []) for d in so.get('desglose', [])]
+    for fuente, metodo, tipo, total in items:
+        clave = base + (fuente, metodo, tipo)
+        celdas[clave] = celdas.get(clave, Decimal('0')) + Decimal(str(total or 0))
+    return celdas
+
+
+def celdas_de_totales(filas):
+    """Contribución por cierre a partir de filas ya agregadas (reporte_ingresos_desde_json por cierre): {cierre_id: celdas}."""
+    por_cierre = {}
+    for fila in filas:
+        clave = (fila.get('sucursal_id'), fila.get('fecha'), fila.get('usuario_id'), fila.get('fuente'), fila.get('metodo'), fila.get('tipo'))
+        celdas = por_cierre.setdefault(fila['cierre_id'], {})
+        celdas[clave] = celdas.get(clave, Decimal('0')) + Decimal(str(fila.get('total') or 0))
+    return por_cierre
+
+
+class CuboIngresos:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._por_cierre = {}     # cierre_id -> celdas que aporta
+        self._celdas = {}         # clave -> [total, número de cierres que aportan]
+        self._tabla = None        # tabla Arrow de las celdas (se reconstruye tras un cambio)
+        self.cargado_en = None    # instante (monotonic) de la última carga completa
+        self._pendientes = None   # cambios recibidos durante una carga completa
+
+    # --- Mantenimiento ---
+    def _sumar(self, celdas, signo):
+        for clave, total in celdas.items():
+            celda = self._celdas.setdefault(clave, [Decimal('0'), 0])
+            celda[0] += signo * total
+            celda[1] += signo
+            if celda[1] <= 0:
+                del self._celdas[clave]
+
+    def _reemplazar(self, cierre_id, celdas):
+        self._sumar(self._por_cierre.pop(cierre_id, {}), -1)
+        if celdas:
+            self._por_cierre[cierre_id] = celdas
+            self._sumar(celdas, 1)
+        self._tabla = None
+
+    def actualizar_cierre(self, cierre):
+        """Reemplaza la contribución de un cierre (p. ej. tras guardar su resumen_del_dia)."""
+        with self._lock:
+            if self._pendientes is not None:
+                self._pendientes.append(cierre)
+            if self.cargado_en is not None:
+                self._reemplazar(cierre['id'], celdas_de_cierre(cierre))
+
+    def iniciar_carga(self):
+        with self._lock:
+            self._pendientes = []
+
+    def terminar_carga(self, cierres, celdas_por_cierre=None):
+        """
+        Reconstruye el cubo con todos los cierres (y las celdas ya agregadas de otros, ver
+        celdas_de_totales) y vuelve a aplicar los cambios recibidos mientras tanto.
+        """
+        with self._lock:
+            self._por_cierre, self._celdas, self._tabla = {}, {}, None
+            for cierre_id, celdas in (celdas_por_cierre or {}).items():
+                self._reemplazar(cierre_id, celdas)
+            for cierre in cierres:
+                self._reemplazar(cierre['id'], celdas_de_cierre(cierre))
+            for cierre in self._pendientes or []:
+                self._reemplazar(cierre['id'], celdas_de_cierre(cierre))
+            self._pendientes = None
+            self.cargado_en = time.monotonic()
+
+    def cancelar_carga(self):
+        with self._lock:
+            self._pendientes = None
+
+    def vigente(self, ttl_s):
+        return self.cargado_en is not None and time.monotonic() - self.cargado_en < ttl_s
+
+    def invalidar(self):
+        """La próxima llamada a database.cargar_cubo_ingresos() lo reconstruye."""
+        with self._lock:
+            self.cargado_en = None
+
+    # --- Consulta ---
+    def tabla(self):
+        """Todas las celdas como tabla Arrow (columnas DIMENSIONES + total)."""
+        with self._lock:
+            if self._tabla is None:
+                filas = [dict(zip(DIMENSIONES, clave), total=float(total)) for clave, (total, _) in self._celdas.items()]
+                esquema = pa.schema([(d, pa.string()) for d in DIMENSIONES] + [("total", pa.float64())])
+                self._tabla = pa.Table.from_pylist(filas, schema=esquema)
+            return self._tabla
+
+    def cortar(self, fecha_inicio=None, fecha_fin=None, sucursal_ids=None, usuario_id=None, fuente=None, metodo=None):
+        """Celdas que cumplen los filtros (los None se ignoran), como tabla Arrow."""
+        return analitica.filtrar(self.tabla(), [
+            ("fecha", ">=", fecha_inicio),
+            ("fecha", "<=", fecha_fin),
+            ("sucursal_id", "in", sucursal_ids or None),
+            ("usuario_id", "==", usuario_id),
+            ("fuente", "==", fuente),
+            ("metodo", "==", metodo),
+        ])
+
+
+CUBO = CuboIngresos()
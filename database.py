@@ -2,41 +2,182 @@
 
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
 import pytz
 from datetime import datetime, timedelta
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 import streamlit as st # <-- IMPORTANTE: Añadir import de Streamlit
+import cache_reportes
+import catalogos
+import cubo_ingresos
+import etiquetas
+import pool_clientes
 
 load_dotenv()
 supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_KEY")
 
-# 1. Inicializar el cliente de Supabase
-supabase: Client = create_client(supabase_url, supabase_key)
-
-# 2. --- ¡¡¡ESTE ES EL BLOQUE DE CÓDIGO CRÍTICO QUE ARREGLA TODO!!! ---
-# Revisa si hay una sesión guardada en Streamlit y la aplica al cliente de Supabase.
-# Esto asegura que el cliente esté autenticado en CADA recarga de CADA página.
-if 'sesion_auth' in st.session_state and st.session_state.sesion_auth is not None:
+# Backend de almacenamiento: 'supabase' (por defecto) o 'local' (SQLite en proceso, ver db_local.py).
+# El backend local expone la misma interfaz que el cliente de Supabase, así que todas las
+# funciones de este módulo funcionan igual con cualquiera de los dos.
+DB_BACKEND = os.environ.get("DB_BACKEND", "supabase").strip().lower()
+
+# 1. Pool de clientes: uno por sesión de Streamlit (ver pool_clientes.py)
+# Cada sesión tiene su propio cliente (token propio con auto-refresh y conexión HTTP keep-alive)
+# en lugar de un único cliente global compartido por todos los usuarios del proceso.
+if DB_BACKEND == "local":
+    import db_local
+    _cliente_local = db_local.crear_cliente_local()
+    _crear_cliente = _cliente_local.con_sesion_propia
+else:
+    def _crear_cliente() -> Client:
+        return create_client(supabase_url, supabase_key, options=ClientOptions(auto_refresh_token=True, persist_session=True))
+
+pool_supabase = pool_clientes.PoolClientes(
+    _crear_cliente,
+    max_clientes=int(os.environ.get("SUPABASE_POOL_MAX", 50)),
+    inactividad_s=float(os.environ.get("SUPABASE_POOL_INACTIVIDAD_S", 1800))
+)
+
+# 2. --- SINCRONIZACIÓN DE LA SESIÓN DE AUTH ---
+# Aplica el token guardado en st.session_state al cliente de la sesión (solo cuando cambia)
+# y devuelve a st.session_state los tokens que el cliente refrescó en segundo plano.
+def _sincronizar_sesion_auth(clave, entrada):
+    if entrada.sesion_refrescada is not None:
+        st.session_state["sesion_auth"] = entrada.sesion_refrescada
+        entrada.sesion_refrescada = None
+
+    sesion = st.session_state.get('sesion_auth')
+    if sesion is None:
+        if entrada.token_en_estado:
+            # Logout: el próximo usuario de esta sesión recibe un cliente limpio
+            pool_supabase.descartar(clave)
+            entrada = pool_supabase.entrada(clave)
+        return entrada
     try:
+        # st.session_state["sesion_auth"] guarda una Session de supabase_auth (access/refresh token)
+        if entrada.token_aplicado == sesion.access_token:
+            entrada.token_en_estado = True
+            return entrada
         # Intenta establecer la sesión con el token guardado
-        supabase.auth.set_session(
-            st.session_state.sesion_auth.access_token,
-            st.session_state.sesion_auth.refresh_token
-        )
+        respuesta = entrada.cliente.auth.set_session(sesion.access_token, sesion.refresh_token)
+        sesion_nueva = getattr(respuesta, 'session', None) or sesion
+        entrada.token_aplicado = sesion_nueva.access_token
+        entrada.token_en_estado = True
+        if sesion_nueva is not sesion:
+            st.session_state["sesion_auth"] = sesion_nueva
     except Exception as e:
         # Si el token expira o es inválido, limpiamos la sesión
         st.error(f"Tu sesión ha expirado o es inválida. Por favor, vuelve a iniciar sesión. Error: {e}")
         st.session_state["autenticado"] = False
         st.session_state["perfil"] = None
         st.session_state["sesion_auth"] = None
-# --- FIN DEL BLOQUE CRÍTICO ---
+    return entrada
+
+def _entrada_actual():
+    clave = pool_clientes.clave_sesion_actual()
+    entrada = pool_supabase.entrada(clave)
+    # En hilos de trabajo (sin contexto de Streamlit) el cliente ya viene autenticado
+    if pool_clientes.hay_contexto_streamlit():
+        entrada = _sincronizar_sesion_auth(clave, entrada)
+    return entrada
+
+class _ClienteDeSesion:
+    """
+    Se usa igual que un cliente de Supabase, pero cada acceso se resuelve al cliente de la
+    sesión actual del pool. Así el resto del módulo sigue escribiendo supabase.table(...).
+    """
+    def _cliente_base(self):
+        return _entrada_actual().cliente
+
+    def __getattr__(self, nombre):
+        return getattr(_entrada_actual().cliente, nombre)
+
+supabase = _ClienteDeSesion()
+
+def metricas_pool_clientes():
+    """Tamaño del pool de clientes y tiempos de espera (para ajustar SUPABASE_POOL_MAX)."""
+    return pool_supabase.metricas()
+
+# Hilos para lanzar consultas independientes a la vez (cargar_catalogos, dashboard del resumen)
+_ejecutor_consultas = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("CONSULTAS_HILOS_MAX", 8)),
+    thread_name_prefix="consultas"
+)
+
+def _lanzar(funcion, *args):
+    """Ejecuta funcion(*args) en el pool de hilos con el cliente de la sesión actual. Devuelve un Future."""
+    return _ejecutor_consultas.submit(pool_clientes.en_sesion_actual(funcion), *args)
+
+# 3. --- VERSIONES DE DATOS E INVALIDACIÓN POR ETIQUETAS ---
+# Cada escritura invalida solo las etiquetas que toca (ver etiquetas.py): el cierre, la
+# sucursal y la tabla. Esas etiquetas son del proceso; la versión de un cierre, en cambio,
+# vive en el servidor (columna cierres_caja.version, migración version_cierre): avanza una
+# vez por cada petición que escribe en el cierre o en sus colecciones (gastos, ingresos
+# adicionales, delivery, compras), venga de este proceso o de otro servidor de la app.
+def version_cierre(cierre_id):
+    """Versión del cierre en el servidor, o None si no se pudo leer (el almacén se recarga)."""
+    try:
+        response = supabase.table('cierres_caja').select('version').eq('id', cierre_id).maybe_single().execute()
+        return (response.data.get('version') or 0) if response and response.data else None
+    except Exception:
+        return None
+
+def _marcar_cierre_modificado(cierre_id, *tablas):
+    """Invalida el cierre y las tablas escritas (los reportes por rango dependen de la tabla)."""
+    etiquetas.invalidar(etiquetas.cierre(cierre_id), *map(etiquetas.tabla, tablas))
+
+def _marcar_cierres_de_filas(filas, *tablas):
+    """Incrementa la versión de los cierres a los que pertenecen las filas escritas/eliminadas."""
+    etiquetas.invalidar(
+        *{etiquetas.cierre(fila.get('cierre_id')) for fila in (filas or []) if fila},
+        *(map(etiquetas.tabla, tablas) if filas else ())
+    )
+
+def _invalidar_escritura(tabla, filas, columna_cierre=None):
+    """Invalida la tabla escrita y las sucursales (y los cierres, si se indica la columna) de las filas."""
+    filas = [fila for fila in (filas or []) if fila]
+    etiquetas.invalidar(
+        etiquetas.tabla(tabla),
+        *{etiquetas.sucursal(fila.get('sucursal_id')) for fila in filas},
+        *({etiquetas.cierre(fila.get(columna_cierre)) for fila in filas} if columna_cierre else ())
+    )
+
+# --- BORRADOS MASIVOS ---
+MOTIVO_NO_ENCONTRADO = "No se encontró (ya fue eliminado o no hay permiso para borrarlo)."
+
+def _eliminar_por_ids(tabla, ids, descripcion):
+    """
+    Borra las filas de 'tabla' con esos ids en una sola llamada a la función SQL
+    'eliminar_filas_por_ids' (un savepoint por fila: si una falla, p. ej. por una FK, las
+    demás se borran igual). Devuelve ({"eliminados": [ids], "fallidos": {id: motivo}}, error).
+    """
+    ids = list(dict.fromkeys(str(i) for i in ids if i))
+    if not ids:
+        return {"eliminados": [], "fallidos": {}}, None
+    try:
+        response = supabase.rpc('eliminar_filas_por_ids', {"p_tabla": tabla, "p_ids": ids}).execute()
+        filas = response.data or []
+        _marcar_cierres_de_filas([f for f in filas if f.get('eliminado')], tabla)
+        eliminados = {str(f['id']) for f in filas if f.get('eliminado')}
+        motivos = {str(f['id']): f"Error al eliminar {descripcion}: {f['motivo']}" for f in filas if f.get('motivo')}
+        return {
+            "eliminados": [i for i in ids if i in eliminados],
+            "fallidos": {i: motivos.get(i, MOTIVO_NO_ENCONTRADO) for i in ids if i not in eliminados}
+        }, None
+    except Exception as e:
+        return None, f"Error al eliminar {descripcion}: {e}"
 
 def iniciar_sesion(email, password):
     try:
-        sesion = supabase.auth.sign_in_with_password({"email": email, "password": password})
+        entrada = _entrada_actual()
+        sesion = entrada.cliente.auth.sign_in_with_password({"email": email, "password": password})
+        # El cliente de la sesión ya quedó autenticado con este token
+        entrada.token_aplicado = sesion.session.access_token
         return sesion, None
     except Exception as e:
         return None, str(e)
@@ -51,6 +192,7 @@ def obtener_perfil_usuario(user_id):
     except Exception as e:
         return None, f"Error al buscar perfil: {str(e)}"
 
+@catalogos.catalogo('sucursales')
 def obtener_sucursales():
     try:
         response = supabase.table('sucursales').select('id, sucursal').execute()
@@ -86,10 +228,14 @@ def buscar_cierre_cerrado_hoy(usuario_id, sucursal_id):
 
 def reabrir_cierre(cierre_id):
     try:
-        datos = {"estado": "ABIERTO"}
-        supabase.table('cierres_caja').update(datos).eq('id', cierre_id).execute()
-        response = supabase.table('cierres_caja').select('*').eq('id', cierre_id).single().execute()
-        return response.data, None
+        # El estado y el borrado de sus totales_diarios van en la misma transacción (RPC)
+        response = supabase.rpc('cambiar_estado_cierre', {"p_cierre_id": cierre_id, "p_estado": "ABIERTO"}).execute()
+        if not response.data:
+            return None, "Error al reabrir el cierre: no se encontró el cierre."
+        cache_reportes.invalidar_cierre(cierre_id)
+        _invalidar_escritura('cierres_caja', response.data, 'id')
+        etiquetas.invalidar(etiquetas.tabla('totales_diarios'))
+        return response.data[0], None
     except Exception as e:
         return None, f"Error al reabrir el cierre: {e}"
 
@@ -124,6 +270,7 @@ def iniciar_cierre_en_db(usuario_id, sucursal_id, datos_saldo_inicial, marcar_di
             return None, "La inserción del nuevo cierre falló o no devolvió datos."
         
         nuevo_cierre_creado = supabase.table('cierres_caja').select('*').eq('id', insert_response.data[0]['id']).single().execute()
+        _invalidar_escritura('cierres_caja', [nuevo_cierre_creado.data])
 
         return nuevo_cierre_creado.data, discrepancia_mensaje
     except Exception as e:
@@ -146,6 +293,7 @@ def actualizar_saldo_inicial(cierre_id, datos_saldo_inicial):
     except Exception as e:
         return None, f"Error al actualizar saldo inicial: {e}"
         
+@catalogos.catalogo('gastos_categorias')
 def obtener_categorias_gastos():
     try:
         response = supabase.table('gastos_categorias').select('id, nombre').eq('is_activo', True).order('nombre').execute()
@@ -159,8 +307,9 @@ def registrar_gasto(cierre_id, categoria_id, monto, notas, usuario_id, sucursal_
             "cierre_id": cierre_id, "categoria_id": categoria_id, "monto": monto,
             "notas": notas, "usuario_id": usuario_id, "sucursal_id": sucursal_id, "sucursal": sucursal_nombre
         }
-        # ESTA ES LA SINTAXIS CORRECTA (SIN .select())
-        response = supabase.table('gastos_caja').insert(datos).execute()
+        # Devuelve la fila con el mismo select del snapshot del cierre (incluye la categoría)
+        response = supabase.table('gastos_caja').insert(datos).select(COLECCIONES_CIERRE["gastos"][1]).execute()
+        _marcar_cierre_modificado(cierre_id, 'gastos_caja')
         return response.data, None
     except Exception as e:
         return None, f"Error al registrar el gasto: {e}"
@@ -172,6 +321,96 @@ def obtener_gastos_del_cierre(cierre_id):
     except Exception as e:
         return [], f"Error al obtener los gastos: {e}"
 
+# --- SINCRONIZACIÓN INCREMENTAL DE PAGOS ---
+# Mientras un cierre está abierto, cada refresco del resumen, la caja final, la verificación
+# o los totales CDE necesita los totales del día por método. En lugar de recalcular el día
+# completo, se guarda en memoria el agregado por (sucursal, ventana) junto con una marca de
+# agua (created_at, id) del último pago sumado, y solo se piden los pagos posteriores
+# (función SQL 'totales_pagos_delta'). Los pagos de los últimos PAGOS_MARGEN_S segundos se
+# suman en cada consulta sin consolidarlos, por si el POS aún tiene transacciones abiertas.
+# Cada PAGOS_RESINCRONIZAR_S se recalcula la ventana completa (cubre ediciones y borrados en el POS).
+PAGOS_MARGEN_S = int(os.environ.get("PAGOS_MARGEN_S", 30))
+PAGOS_RESINCRONIZAR_S = float(os.environ.get("PAGOS_RESINCRONIZAR_S", 900))
+PAGOS_MAX_AGREGADOS = 200
+
+class _AgregadoPagos:
+    def __init__(self):
+        self.totales = {}            # metodo_pago -> Decimal (solo pagos consolidados)
+        self.marca = (None, None)    # (created_at, id) del último pago consolidado
+        self.sincronizado = 0.0      # instante (monotonic) del último recálculo completo
+        self.bloqueo = threading.Lock()
+
+_AGREGADOS_PAGOS = {}
+_BLOQUEO_AGREGADOS_PAGOS = threading.Lock()
+
+def _agregado_pagos(clave):
+    with _BLOQUEO_AGREGADOS_PAGOS:
+        agregado = _AGREGADOS_PAGOS.pop(clave, None) or _AgregadoPagos()
+        _AGREGADOS_PAGOS[clave] = agregado  # al final: el dict queda en orden de uso
+        while len(_AGREGADOS_PAGOS) > PAGOS_MAX_AGREGADOS:
+            del _AGREGADOS_PAGOS[next(iter(_AGREGADOS_PAGOS))]
+        return agregado
+
+def reiniciar_agregados_pagos():
+    """Descarta los agregados de pagos en memoria: la próxima consulta recalcula el día completo."""
+    with _BLOQUEO_AGREGADOS_PAGOS:
+        _AGREGADOS_PAGOS.clear()
+
+def _totales_pagos_por_metodo(nombre_sucursal, fecha_inicio, fecha_fin):
+    """
+    Suma de la tabla 'pagos' por método para una sucursal en [fecha_inicio, fecha_fin).
+    Devuelve {metodo_pago: Decimal}. Solo consulta los pagos nuevos desde el último
+    refresco (ver SINCRONIZACIÓN INCREMENTAL DE PAGOS).
+    """
+    desde, hasta = fecha_inicio.isoformat(), fecha_fin.isoformat()
+    agregado = _agregado_pagos((nombre_sucursal, desde, hasta))
+    # El bloqueo por agregado evita que dos sesiones sumen el mismo delta dos veces
+    with agregado.bloqueo:
+        if time.monotonic() - agregado.sincronizado > PAGOS_RESINCRONIZAR_S:
+            agregado.totales, agregado.marca = {}, (None, None)
+            agregado.sincronizado = time.monotonic()
+
+        response = supabase.rpc('totales_pagos_delta', {
+            'p_sucursal': nombre_sucursal,
+            'p_desde': desde,
+            'p_hasta': hasta,
+            'p_marca_created_at': agregado.marca[0],
+            'p_marca_id': agregado.marca[1],
+            'p_margen_s': PAGOS_MARGEN_S
+        }).execute()
+        filas = response.data or []
+
+        recientes = {}
+        for fila in filas:
+            monto = Decimal(str(fila.get('total', 0) or 0))
+            destino = agregado.totales if fila['consolidado'] else recientes
+            destino[fila['metodo_pago']] = destino.get(fila['metodo_pago'], Decimal('0')) + monto
+        if filas and filas[0].get('marca_created_at'):
+            agregado.marca = (filas[0]['marca_created_at'], filas[0]['marca_id'])
+
+        totales = dict(agregado.totales)
+    for metodo, monto in recientes.items():
+        totales[metodo] = totales.get(metodo, Decimal('0')) + monto
+    return totales
+
+def _obtener_pagos_dia(nombre_sucursal, fecha_operacion_str):
+    """
+    Pagos de Rayo (tabla 'pagos') de una sucursal en el día de operación, ya sumados
+    por método (una fila por método), con el formato que usan las pestañas:
+    {'monto': float, 'metodo_pago': {'nombre': ...}}.
+    """
+    fecha_inicio_dia = datetime.strptime(fecha_operacion_str, '%Y-%m-%d')
+    fecha_fin_dia = fecha_inicio_dia + timedelta(days=1)
+
+    totales = _totales_pagos_por_metodo(nombre_sucursal, fecha_inicio_dia, fecha_fin_dia)
+    return [{'monto': float(total), 'metodo_pago': {'nombre': metodo}} for metodo, total in totales.items()]
+
+def obtener_pagos_dia_sucursal(nombre_sucursal, fecha_operacion_str):
+    try:
+        return _obtener_pagos_dia(nombre_sucursal, fecha_operacion_str), None
+    except Exception as e:
+        return [], f"Error al obtener los pagos: {e}"
+
 def obtener_pagos_del_cierre(cierre_id):
     try:
         response_cierre = supabase.table('cierres_caja').select('sucursal_id, fecha_operacion').eq('id', cierre_id).single().execute()
@@ -186,22 +425,88 @@ def obtener_pagos_del_cierre(cierre_id):
         response_sucursal = supabase.table('sucursales').select('sucursal').eq('id', sucursal_id).single().execute()
         nombre_sucursal = response_sucursal.data['sucursal']
 
-        fecha_inicio_dia = datetime.strptime(fecha_operacion_str, '%Y-%m-%d')
-        fecha_fin_dia = fecha_inicio_dia + timedelta(days=1)
-        
-        response_pagos = supabase.table('pagos').select('monto, metodo_pago').eq('sucursal', nombre_sucursal).gte('created_at', fecha_inicio_dia.isoformat()).lt('created_at', fecha_fin_dia.isoformat()).execute()
-        pagos = response_pagos.data
+        return _obtener_pagos_dia(nombre_sucursal, fecha_operacion_str), None
+    except Exception as e:
+        return [], f"Error al obtener los pagos: {e}"
 
-        pagos_con_nombres = []
-        for pago in pagos:
-            monto_float = float(pago['monto'])
-            nombre_metodo = pago['metodo_pago']
-            pagos_con_nombres.append({'monto': monto_float, 'metodo_pago': {'nombre': nombre_metodo}})
+def obtener_snapshot_cierre(cierre_id, incluir_pagos=True):
+    """
+    Carga el cierre y todas sus colecciones hijas (gastos, ingresos adicionales, delivery
+    y compras) en un solo select embebido, más una consulta para los pagos del día
+    (que no cuelgan del cierre sino de la sucursal y la fecha).
+    Cada colección tiene el mismo formato que su función obtener_*_del_cierre.
+    Con incluir_pagos=False se omite la consulta de pagos (se cargan luego, si hacen falta).
+    """
+    try:
+        response = supabase.table('cierres_caja').select(
+            '*, sucursales(sucursal), '
+            'gastos_caja(*, gastos_categorias(nombre)), '
+            'ingresos_adicionales(*, socios(nombre, afecta_conteo_efectivo, requiere_verificacion_voucher)), '
+            'cierre_delivery(*), '
+            'cierre_compras(*)'
+        ).eq('id', cierre_id).single().execute()
+        cierre = response.data
+        if not cierre:
+            return None, "No se encontró el cierre de caja."
+
+        def hijos(tabla):
+            return sorted(cierre.pop(tabla, None) or [], key=lambda fila: fila.get('created_at') or '')
 
-        return pagos_con_nombres, None
+        snapshot = {
+            "gastos": hijos('gastos_caja'),
+            "ingresos_adicionales": hijos('ingresos_adicionales'),
+            "deliveries": hijos('cierre_delivery'),
+            "compras": hijos('cierre_compras'),
+        }
+        if incluir_pagos:
+            sucursal_nombre = (cierre.get('sucursales') or {}).get('sucursal')
+            snapshot["pagos"] = _obtener_pagos_dia(sucursal_nombre, cierre['fecha_operacion'])
+        snapshot["cierre"] = cierre
+        return snapshot, None
     except Exception as e:
-        return [], f"Error al obtener los pagos: {e}"
+        return None, f"Error al cargar los datos del cierre: {e}"
 
+# Colecciones hijas de un cierre: clave -> (tabla, select)
+# Ids por filtro in_('cierre_id', ...): la URL de PostgREST tiene un largo máximo
+TAMANO_LOTE_IDS = 100
+
+COLECCIONES_CIERRE = {
+    "gastos": ('gastos_caja', '*, gastos_categorias(nombre)'),
+    "ingresos_adicionales": ('ingresos_adicionales', '*, socios(nombre, afecta_conteo_efectivo, requiere_verificacion_voucher)'),
+    "deliveries": ('cierre_delivery', '*'),
+    "compras": ('cierre_compras', '*'),
+}
+
+def obtener_detalles_de_cierres(cierre_ids, tamano_lote=TAMANO_LOTE_IDS, tamano_pagina=1000, colecciones=None):
+    """
+    Carga en bloque las colecciones hijas (gastos, ingresos adicionales, delivery, compras)
+    de varios cierres: una consulta in_('cierre_id', ids) por tabla y lote de ids, en lugar
+    de una consulta por cierre y tabla. Devuelve {cierre_id: {"gastos": [...], ...}}.
+    'colecciones' permite otros selects con las mismas claves (por defecto COLECCIONES_CIERRE).
+    """
+    colecciones = colecciones or COLECCIONES_CIERRE
+    try:
+        ids = list(dict.fromkeys(cierre_ids))
+        detalles = {cierre_id: {clave: [] for clave in colecciones} for cierre_id in ids}
+        for clave, (tabla, seleccion) in colecciones.items():
+            for i in range(0, len(ids), tamano_lote):
+                lote = ids[i:i + tamano_lote]
+                desde = 0
+                while True:
+                    response = supabase.table(tabla).select(seleccion).in_('cierre_id', lote) \
+                        .order('created_at').order('id') \
+                        .range(desde, desde + tamano_pagina - 1).execute()
+                    filas = response.data or []
+                    for fila in filas:
+                        detalles[fila['cierre_id']][clave].append(fila)
+                    if len(filas) < tamano_pagina:
+                        break
+                    desde += tamano_pagina
+        return detalles, None
+    except Exception as e:
+        return {}, f"Error al cargar los detalles de los cierres: {e}"
+
+@catalogos.catalogo('metodos_pago')
 def obtener_metodos_pago_con_flags():
     try:
         # Asegúrate de que tu línea select se vea así:
@@ -234,6 +539,7 @@ def guardar_verificacion_pagos(cierre_id, datos_verificacion):
         return None, f"Error al guardar la verificación de pagos: {e}"
 
 
+@catalogos.catalogo('metodos_pago')
 def obtener_metodos_pago():
     try:
         # Añadimos 'tipo' y 'is_activo' a la consulta
@@ -242,6 +548,7 @@ def obtener_metodos_pago():
     except Exception as e:
         return [], f"Error al obtener métodos de pago: {e}"
 
+@catalogos.catalogo('socios')
 def obtener_socios():
     try:
         # (Sin filtro 'is_activo' según solicitud del usuario)
@@ -257,6 +564,7 @@ def registrar_ingreso_adicional(cierre_id, socio_id, monto, metodo_pago, notas):
             "metodo_pago": metodo_pago, "notas": notas
         }
         response = supabase.table('ingresos_adicionales').insert(datos).execute()
+        _marcar_cierre_modificado(cierre_id, 'ingresos_adicionales')
         return response.data, None
     except Exception as e:
         return None, f"Error al registrar el ingreso adicional: {e}"
@@ -265,10 +573,34 @@ def actualizar_ingreso_adicional(cierre_id, socio_id, monto, metodo_pago):
     try:
         datos = {"monto": monto}
         response = supabase.table('ingresos_adicionales').update(datos).eq('cierre_id', cierre_id).eq('socio_id', socio_id).eq('metodo_pago', metodo_pago).execute()
+        _marcar_cierre_modificado(cierre_id, 'ingresos_adicionales')
         return response.data, None
     except Exception as e:
         return None, f"Error al actualizar el ingreso adicional: {e}"
 
+def guardar_ingresos_adicionales_lote(cierre_id, cambios):
+    """
+    Guarda todos los cambios del formulario de ingresos adicionales en UN solo upsert
+    (atómico) sobre la clave única (cierre_id, socio_id, metodo_pago).
+    cambios: lista de {"socio_id", "metodo_pago", "monto", "notas"}; un monto 0 deja la celda en cero.
+    "notas" es la nota actual de la celda (las celdas nuevas se insertan con "", como el alta
+    individual); todas las filas la llevan porque un upsert en lote envía las mismas columnas.
+    """
+    if not cambios:
+        return [], None
+    try:
+        filas = [
+            {"cierre_id": cierre_id, "socio_id": c['socio_id'], "metodo_pago": c['metodo_pago'], "monto": c['monto'],
+             "notas": c.get('notas') or ""}
+            for c in cambios
+        ]
+        response = supabase.table('ingresos_adicionales').upsert(filas, on_conflict='cierre_id,socio_id,metodo_pago') \
+            .select(COLECCIONES_CIERRE["ingresos_adicionales"][1]).execute()
+        _marcar_cierre_modificado(cierre_id, 'ingresos_adicionales')
+        return response.data, None
+    except Exception as e:
+        return None, f"Error al guardar los ingresos adicionales: {e}"
+
 def obtener_ingresos_adicionales_del_cierre(cierre_id):
     try:
         response = supabase.table('ingresos_adicionales').select('*, socios(nombre, afecta_conteo_efectivo, requiere_verificacion_voucher)').eq('cierre_id', cierre_id).order('created_at').execute()
@@ -309,18 +641,22 @@ def subir_archivo_storage(cierre_id, metodo_pago_nombre, ruta_archivo_local):
     
 def finalizar_cierre_en_db(cierre_id, nota_discrepancia=None):
     try:
-        datos = {
-            "estado": "CERRADO",
-            "fecha_hora_cierre_real": datetime.now(pytz.timezone('America/Panama')).isoformat(),
-            "nota_discrepancia": nota_discrepancia
-        }
-        response = supabase.table('cierres_caja').update(datos).eq('id', cierre_id).execute()
+        # El cambio de estado y los totales_diarios del cierre se escriben en una sola transacción
+        response = supabase.rpc('cambiar_estado_cierre', {
+            "p_cierre_id": cierre_id,
+            "p_estado": "CERRADO",
+            "p_fecha_hora_cierre_real": datetime.now(pytz.timezone('America/Panama')).isoformat(),
+            "p_nota_discrepancia": nota_discrepancia
+        }).execute()
+        _invalidar_escritura('cierres_caja', response.data, 'id')
+        etiquetas.invalidar(etiquetas.tabla('totales_diarios'))
         return response.data, None
     except Exception as e:
         return None, f"Error al finalizar el cierre: {e}"
     
 # --- FUNCIONES DE ADMINISTRACIÓN PARA CATEGORÍAS DE GASTOS ---
 
+@catalogos.catalogo('gastos_categorias')
 def admin_get_todas_categorias():
     try:
         response = supabase.table('gastos_categorias').select('id, nombre, is_activo') \
@@ -337,6 +673,7 @@ def admin_crear_categoria(nombre_categoria):
     try:
         datos = {"nombre": nombre_categoria, "is_activo": True}
         response = supabase.table('gastos_categorias').insert(datos).execute()
+        catalogos.invalidar('gastos_categorias')
         return response.data, None
     except Exception as e:
         if "23505" in str(e): 
@@ -347,6 +684,7 @@ def admin_desactivar_categoria(categoria_id):
     try:
         datos = {"is_activo": False}
         response = supabase.table('gastos_categorias').update(datos).eq('id', categoria_id).execute()
+        catalogos.invalidar('gastos_categorias')
         return response.data, None
     except Exception as e:
         return None, f"Error al desactivar la categoría: {e}"
@@ -355,12 +693,14 @@ def admin_activar_categoria(categoria_id):
     try:
         datos = {"is_activo": True}
         response = supabase.table('gastos_categorias').update(datos).eq('id', categoria_id).execute()
+        catalogos.invalidar('gastos_categorias')
         return response.data, None
     except Exception as e:
         return None, f"Error al activar la categoría: {e}"
 
 # --- FUNCIONES DE ADMINISTRACIÓN PARA REPORTES DE CIERRES ---
 
+@catalogos.catalogo('perfiles')
 def admin_get_lista_usuarios():
     try:
         response = supabase.table('perfiles').select('id, nombre').order('nombre').execute()
@@ -368,10 +708,62 @@ def admin_get_lista_usuarios():
     except Exception as e:
         return [], f"Error al obtener lista de usuarios: {e}"
 
-def admin_buscar_cierres_filtrados(fecha_inicio, fecha_fin, sucursal_id=None, usuario_id=None, solo_discrepancia=False):
+# --- PAGINACIÓN KEYSET PARA REPORTES ---
+# Las búsquedas de reportes recorren los resultados por páginas ordenadas por
+# (columna de fecha, id) en orden descendente. Cada página pide las filas "anteriores"
+# a la última fila recibida, así no hay OFFSET ni truncamiento por el límite de filas de PostgREST.
+TAMANO_PAGINA_REPORTES = 500
+
+def _literal_postgrest(valor):
+    """Valor entre comillas para usarlo dentro de un filtro or_() de PostgREST."""
+    return '"' + str(valor).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _paginar_keyset(construir_query, columna_orden, tamano_pagina=TAMANO_PAGINA_REPORTES):
+    """
+    Generador de páginas (filas, total) para una consulta con paginación keyset.
+    construir_query(count) debe devolver una consulta NUEVA con su select (incluyendo 'id')
+    y sus filtros; el conteo exacto (total) solo se pide en la primera página.
+    """
+    total = None
+    ultima_fila = None
+    while True:
+        query = construir_query('exact' if total is None else None)
+        if ultima_fila is not None:
+            valor = _literal_postgrest(ultima_fila[columna_orden])
+            ultimo_id = _literal_postgrest(ultima_fila['id'])
+            query = query.or_(f"{columna_orden}.lt.{valor},and({columna_orden}.eq.{valor},id.lt.{ultimo_id})")
+        response = query.order(columna_orden, desc=True).order('id', desc=True).limit(tamano_pagina).execute()
+        filas = response.data or []
+        if total is None:
+            total = response.count if response.count is not None else len(filas)
+        if filas:
+            yield filas, total
+        if len(filas) < tamano_pagina:
+            return
+        ultima_fila = filas[-1]
+
+def _iterar_con_error(paginas, mensaje_error):
+    """Adapta un generador de páginas al formato (filas, total, error) de este módulo."""
     try:
+        for filas, total in paginas:
+            yield filas, total, None
+    except Exception as e:
+        yield [], None, f"{mensaje_error}: {e}"
+
+def _recolectar_paginas(paginas):
+    """Consume un generador (filas, total, error) y devuelve (todas_las_filas, error)."""
+    resultado = []
+    for filas, _, err in paginas:
+        if err:
+            return resultado, err
+        resultado.extend(filas)
+    return resultado, None
+
+def admin_iterar_cierres_filtrados(fecha_inicio, fecha_fin, sucursal_id=None, usuario_id=None, solo_discrepancia=False):
+    """Versión paginada (generador de (filas, total, error)) de admin_buscar_cierres_filtrados."""
+    def construir_query(count):
         query = supabase.table('cierres_caja').select(
-            '*, perfiles(nombre), sucursales(sucursal)'
+            '*, perfiles(nombre), sucursales(sucursal)', count=count
         )
         if fecha_inicio:
             query = query.gte('fecha_operacion', fecha_inicio)
@@ -383,25 +775,30 @@ def admin_buscar_cierres_filtrados(fecha_inicio, fecha_fin, sucursal_id=None, us
             query = query.eq('usuario_id', usuario_id)
         if solo_discrepancia:
             query = query.eq('discrepancia_saldo_inicial', True)
+        return query
+    return _iterar_con_error(_paginar_keyset(construir_query, 'fecha_operacion'), "Error al buscar cierres filtrados")
 
-        response = query.order('fecha_operacion', desc=True).execute()
-        return response.data, None
-
-    except Exception as e:
-        return [], f"Error al buscar cierres filtrados: {e}"
+def admin_buscar_cierres_filtrados(fecha_inicio, fecha_fin, sucursal_id=None, usuario_id=None, solo_discrepancia=False):
+    return _recolectar_paginas(admin_iterar_cierres_filtrados(fecha_inicio, fecha_fin, sucursal_id, usuario_id, solo_discrepancia))
 
 def eliminar_gasto_caja(gasto_id):
     try:
         response = supabase.table('gastos_caja').delete().eq('id', gasto_id).execute()
+        _marcar_cierres_de_filas(response.data, 'gastos_caja')
         return response.data, None
     except Exception as e:
         return None, f"Error al eliminar el gasto: {e}"
 
+def eliminar_gastos_caja(gasto_ids):
+    """Versión masiva de eliminar_gasto_caja (ver _eliminar_por_ids)."""
+    return _eliminar_por_ids('gastos_caja', gasto_ids, "el gasto")
+
 
 # --- INICIO BLOQUE: NUEVAS FUNCIONES DE MÓDULOS ---
 
 # --- FUNCIONES DE ADMINISTRACIÓN PARA SOCIOS (CON HARD DELETE) ---
 
+@catalogos.catalogo('socios')
 def admin_get_todos_socios():
     """ Obtiene todos los socios para el editor de admin (sin is_activo) """
     try:
@@ -424,6 +821,7 @@ def admin_crear_socio(nombre, afecta_efectivo, requiere_voucher):
             "requiere_verificacion_voucher": requiere_voucher
         }
         response = supabase.table('socios').insert(datos).execute()
+        catalogos.invalidar('socios')
         return response.data, None
     except Exception as e:
         if "23505" in str(e): # Error de violación de restricción única
@@ -437,6 +835,7 @@ def admin_actualizar_socio_reglas(socio_id, data_dict):
     """
     try:
         response = supabase.table('socios').update(data_dict).eq('id', socio_id).execute()
+        catalogos.invalidar('socios')
         return response.data, None
     except Exception as e:
         if "23505" in str(e):
@@ -449,6 +848,7 @@ def admin_eliminar_socio(socio_id):
     """
     try:
         response = supabase.table('socios').delete().eq('id', socio_id).execute()
+        catalogos.invalidar('socios')
         return response.data, None
     except Exception as e:
         if "23503" in str(e): # Error de Foreign Key
@@ -458,6 +858,7 @@ def admin_eliminar_socio(socio_id):
 
 # --- FUNCIONES DE GESTIÓN DE DELIVERY (CON DOBLE ESCRITURA) ---
 
+@catalogos.catalogo('gastos_categorias')
 def get_categoria_id_por_nombre(nombre_categoria):
     """
     Busca el ID de una categoría de gasto específica por su nombre exacto.
@@ -494,10 +895,34 @@ def registrar_delivery_completo(cierre_id, usuario_id, sucursal_id, monto_cobrad
             "gasto_asociado_id": gasto_asociado_id  # Será NULL si el costo fue 0
         }
         response = supabase.table('cierre_delivery').insert(datos).execute()
+        _marcar_cierre_modificado(cierre_id, 'cierre_delivery')
         return response.data, None
     except Exception as e:
         return None, f"Error al registrar en cierre_delivery: {e}"
 
+def registrar_delivery_con_gasto(cierre_id, usuario_id, sucursal_id, sucursal_nombre, monto_cobrado, costo_repartidor,
+                                origen_nombre, notas, categoria_gasto_id, nota_gasto):
+    """
+    Registra el delivery y, si costo_repartidor > 0, su gasto en efectivo en una sola
+    transacción (función SQL 'registrar_delivery_con_gasto'). Devuelve ({"delivery", "gasto"}, error).
+    """
+    try:
+        response = supabase.rpc('registrar_delivery_con_gasto', {
+            "p_cierre_id": cierre_id, "p_usuario_id": usuario_id, "p_sucursal_id": sucursal_id,
+            "p_sucursal_nombre": sucursal_nombre, "p_monto_cobrado": monto_cobrado,
+            "p_costo_repartidor": costo_repartidor, "p_origen_nombre": origen_nombre, "p_notas": notas,
+            "p_categoria_gasto_id": categoria_gasto_id, "p_nota_gasto": nota_gasto
+        }).execute()
+        _marcar_cierre_modificado(cierre_id, 'cierre_delivery', 'gastos_caja')
+        if response.data and response.data.get('gasto'):
+            # Misma forma que las filas de gastos del snapshot: la categoría sale del catálogo en caché
+            categorias, _ = obtener_categorias_gastos()
+            nombre = next((c['nombre'] for c in categorias or [] if c['id'] == categoria_gasto_id), None)
+            response.data['gasto']['gastos_categorias'] = {"nombre": nombre} if nombre else None
+        return response.data, None
+    except Exception as e:
+        return None, f"Error al registrar el delivery: {e}"
+
 def obtener_deliveries_del_cierre(cierre_id):
     """
     Obtiene todos los registros de 'cierre_delivery' para un cierre_id (para el reporte de ganancias).
@@ -516,15 +941,44 @@ def eliminar_delivery_completo(delivery_id, gasto_asociado_id):
     """
     Elimina el registro de la tabla 'cierre_delivery' Y TAMBIÉN elimina 
     el gasto correspondiente de 'gastos_caja' (si existe) para mantener la sincronía.
+    Ambos borrados van en una sola transacción (función SQL 'eliminar_delivery_con_gasto').
     """
     try:
-        supabase.table('cierre_delivery').delete().eq('id', delivery_id).execute()
-        if gasto_asociado_id:
-            supabase.table('gastos_caja').delete().eq('id', gasto_asociado_id).execute()
+        response = supabase.rpc('eliminar_delivery_con_gasto', {
+            "p_delivery_id": delivery_id, "p_gasto_asociado_id": gasto_asociado_id or None
+        }).execute()
+        borrado = response.data or {}
+        _marcar_cierres_de_filas([fila for fila in borrado.values() if fila], 'cierre_delivery', 'gastos_caja')
+        if not borrado.get('delivery'):
+            # Nada que borrar (ya eliminado o sin permiso); el gasto huérfano, si lo había, sí se borró
+            return None, f"Error al eliminar el registro completo de delivery: {MOTIVO_NO_ENCONTRADO}"
         return True, None
     except Exception as e:
         return None, f"Error al eliminar el registro completo de delivery: {e}"
 
+def eliminar_deliveries_completos(delivery_ids):
+    """
+    Versión masiva de eliminar_delivery_completo: una sola llamada a la función SQL
+    'eliminar_deliveries_con_gasto'. Devuelve ({"eliminados": [ids], "fallidos": {id: motivo},
+    "gastos_eliminados": [ids de los gastos asociados]}, error).
+    """
+    ids = list(dict.fromkeys(str(i) for i in delivery_ids if i))
+    if not ids:
+        return {"eliminados": [], "fallidos": {}, "gastos_eliminados": []}, None
+    try:
+        response = supabase.rpc('eliminar_deliveries_con_gasto', {"p_delivery_ids": ids}).execute()
+        filas = response.data or []
+        _marcar_cierres_de_filas([f for f in filas if f.get('eliminado')], 'cierre_delivery', 'gastos_caja')
+        eliminados = {str(f['delivery_id']) for f in filas if f.get('eliminado')}
+        motivos = {str(f['delivery_id']): f.get('motivo') for f in filas if not f.get('eliminado')}
+        return {
+            "eliminados": [i for i in ids if i in eliminados],
+            "fallidos": {i: motivos.get(i) or MOTIVO_NO_ENCONTRADO for i in ids if i not in eliminados},
+            "gastos_eliminados": [str(f['gasto_id']) for f in filas if f.get('eliminado') and f.get('gasto_id')]
+        }, None
+    except Exception as e:
+        return None, f"Error al eliminar los registros de delivery: {e}"
+
 
 # --- FUNCIONES DE REGISTRO DE COMPRAS (INFORMATIVO) ---
 
@@ -543,6 +997,7 @@ def registrar_compra(cierre_id, usuario_id, sucursal_id, valor_calculado, costo_
             "notas": notas
         }
         response = supabase.table('cierre_compras').insert(datos).execute()
+        _marcar_cierre_modificado(cierre_id, 'cierre_compras')
         return response.data, None
     except Exception as e:
         return None, f"Error al registrar la compra: {e}"
@@ -567,10 +1022,15 @@ def eliminar_compra_registro(compra_id):
     """
     try:
         response = supabase.table('cierre_compras').delete().eq('id', compra_id).execute()
+        _marcar_cierres_de_filas(response.data, 'cierre_compras')
         return response.data, None
     except Exception as e:
         return None, f"Error al eliminar el registro de compra: {e}"
 
+def eliminar_compras_registro(compra_ids):
+    """Versión masiva de eliminar_compra_registro (ver _eliminar_por_ids)."""
+    return _eliminar_por_ids('cierre_compras', compra_ids, "el registro de compra")
+
 
 # --- FUNCIONES DE REGISTRO DE CARGA (MÓDULO SEPARADO) ---
 
@@ -620,6 +1080,7 @@ def upsert_registro_carga(fecha_operacion, sucursal_id, usuario_id, datos_carga)
         if response is None:
              return None, "Error de API al guardar: La respuesta de la base de datos fue Nula (None)."
 
+        _invalidar_escritura('cierre_registros_carga', response.data or [registro])
         return response.data, None
     except Exception as e:
         return None, f"Error al guardar (upsert) el registro de carga: {e}"
@@ -627,6 +1088,7 @@ def upsert_registro_carga(fecha_operacion, sucursal_id, usuario_id, datos_carga)
 
 # --- BLOQUE COMPLETO DE FUNCIONES CIERRE CDE (CONSOLIDADO Y CORREGIDO) ---
 
+@catalogos.catalogo('sucursales')
 def obtener_sucursales_cde():
     """
     Obtiene solo las sucursales que están marcadas como CDE (terminan en 'CDE').
@@ -640,6 +1102,7 @@ def obtener_sucursales_cde():
     except Exception as e:
         return [], f"Error al obtener sucursales CDE: {e}"
 
+@catalogos.catalogo('metodos_pago')
 def obtener_metodos_pago_cde():
     """
     (Versión Actualizada) Obtiene los métodos de pago marcados como CDE
@@ -669,28 +1132,16 @@ def calcular_totales_pagos_dia_sucursal(fecha_str, sucursal_nombre):
         fecha_inicio_dia = tz_panama.localize(datetime.strptime(fecha_str, '%Y-%m-%d'))
         fecha_fin_dia = fecha_inicio_dia + timedelta(days=1)
         
-        response_pagos = supabase.table('pagos') \
-            .select('monto, metodo_pago') \
-            .eq('sucursal', sucursal_nombre) \
-            .gte('created_at', fecha_inicio_dia.isoformat()) \
-            .lt('created_at', fecha_fin_dia.isoformat()) \
-            .execute()
-        
-        if response_pagos is None:
-            return None, 0.0, "Error API: Respuesta Nula al calcular totales de pagos"
-            
-        pagos = response_pagos.data
-        if not pagos:
+        # Los totales por método ya vienen sumados desde la base de datos
+        totales_sistema = _totales_pagos_por_metodo(sucursal_nombre, fecha_inicio_dia, fecha_fin_dia)
+        if not totales_sistema:
             return {}, 0.0, None 
 
         # --- CORRECCIÓN: Usar Decimal para todos los contadores ---
         totales_por_metodo = {}
         total_efectivo = Decimal('0.0') # <-- CORREGIDO
         
-        for pago in pagos:
-            metodo = pago['metodo_pago']
-            monto = Decimal(str(pago.get('monto', 0) or 0)) # <-- CORREGIDO
-            
+        for metodo, monto in totales_sistema.items():
             if metodo.lower() == 'efectivo':
                 total_efectivo += monto
             else:
@@ -761,6 +1212,7 @@ def crear_nuevo_cierre_cde(fecha_str, sucursal_id, usuario_id):
         
         if response_nuevo is None:
             return None, "Error API: Respuesta Nula al CREAR cierre CDE"
+        _invalidar_escritura('cierres_cde', response_nuevo.data)
         
         # Insert devuelve una LISTA de registros, queremos el primero (y único).
         return response_nuevo.data[0], None
@@ -810,6 +1262,7 @@ def guardar_conteo_cde(cierre_cde_id, total_contado, detalle_conteo, verificacio
         response = supabase.table('cierres_cde').update(datos).eq('id', cierre_cde_id).execute()
         if response is None:
             return None, "Error API: Respuesta Nula al guardar conteo CDE"
+        _invalidar_escritura('cierres_cde', response.data)
         return response.data, None
     except Exception as e:
         return None, f"Error al guardar conteo CDE: {e}"
@@ -820,13 +1273,14 @@ def finalizar_cierre_cde(cierre_cde_id, con_discrepancia=False):
     Marca el Cierre CDE como CERRADO.
     """
     try:
-        datos = {
-            "estado": "CERRADO",
-            "discrepancia": con_discrepancia
-        }
-        response = supabase.table('cierres_cde').update(datos).eq('id', cierre_cde_id).execute()
+        # Estado y totales_diarios del cierre CDE en una sola transacción
+        response = supabase.rpc('finalizar_cierre_cde_con_totales', {
+            "p_cierre_cde_id": cierre_cde_id, "p_discrepancia": con_discrepancia
+        }).execute()
         if response is None:
             return None, "Error API: Respuesta Nula al finalizar cierre CDE"
+        _invalidar_escritura('cierres_cde', response.data)
+        etiquetas.invalidar(etiquetas.tabla('totales_diarios'))
         return response.data, None
     except Exception as e:
         return None, f"Error al finalizar cierre CDE: {e}"
@@ -869,65 +1323,100 @@ def admin_buscar_cierres_cde_filtrados(fecha_inicio, fecha_fin, sucursal_id=None
 
 # --- FUNCIONES DE REPORTES AGREGADOS (Versión Final - Lee desde JSON) ---
 
-def admin_reporte_ingresos_json(fecha_inicio=None, fecha_fin=None, sucursal_id=None, usuario_id=None, metodo_pago=None, socio_id=None):
+def admin_iterar_reporte_ingresos(fecha_inicio=None, fecha_fin=None, lista_sucursal_ids=None, usuario_id=None, fuente=None, metodo_pago=None, socio_id=None, por_cierre=False, tamano_pagina=TAMANO_PAGINA_REPORTES):
     """
-    (Versión Actualizada) Llama a la función SQL 'reporte_ingresos_desde_json' 
-    con el nuevo filtro de socio.
+    Reporte de ingresos por (fecha, sucursal, usuario, fuente, método, tipo), y por cierre si
+    por_cierre, calculado y filtrado en la función SQL 'reporte_ingresos_desde_json' (ver
+    supabase/migrations). Generador de páginas (filas, total, error) como los demás admin_iterar_*.
     """
-    try:
-        params = {
-            'fecha_inicio': fecha_inicio,
-            'fecha_fin': fecha_fin,
-            'p_sucursal_id': sucursal_id,
-            'p_usuario_id': usuario_id,
-            'p_metodo_pago': metodo_pago,
-            'p_socio_id': socio_id # <-- NUEVO
-        }
-        params = {k: v for k, v in params.items() if v is not None}
-            
-        response = supabase.rpc('reporte_ingresos_desde_json', params).execute()
-        return response.data, None
-    except Exception as e:
-        return None, f"Error al ejecutar reporte de ingresos desde JSON: {e}"
-
-def get_dashboard_resumen_data(cierre_id):
+    params = {
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'p_sucursal_ids': list(lista_sucursal_ids) if lista_sucursal_ids else None,
+        'p_usuario_id': usuario_id,
+        'p_fuente': fuente,
+        'p_metodo_pago': metodo_pago,
+        'p_socio_id': socio_id,
+        'p_por_cierre': por_cierre or None
+    }
+    params = {k: v for k, v in params.items() if v is not None}
+
+    def paginas():
+        desplazamiento = 0
+        while True:
+            response = supabase.rpc('reporte_ingresos_desde_json', {
+                **params, 'p_limite': tamano_pagina, 'p_desplazamiento': desplazamiento
+            }).execute()
+            filas = response.data or []
+            if filas:
+                yield filas, filas[0]['total_filas']
+            if len(filas) < tamano_pagina:
+                return
+            desplazamiento += len(filas)
+    return _iterar_con_error(paginas(), "Error al ejecutar reporte de ingresos desde JSON")
+
+def admin_reporte_ingresos_json(fecha_inicio=None, fecha_fin=None, sucursal_id=None, usuario_id=None, metodo_pago=None, socio_id=None, lista_sucursal_ids=None, fuente=None):
+    """
+    Llama a la función SQL 'reporte_ingresos_desde_json' con todos los filtros
+    y devuelve todas las filas agregadas.
+    """
+    if sucursal_id and not lista_sucursal_ids:
+        lista_sucursal_ids = [sucursal_id]
+    datos, err = _recolectar_paginas(admin_iterar_reporte_ingresos(
+        fecha_inicio, fecha_fin, lista_sucursal_ids, usuario_id, fuente, metodo_pago, socio_id
+    ))
+    if err:
+        return None, err
+    return datos, None
+
+def get_dashboard_resumen_data(cierre_id, snapshot=None):
     """
     Recolecta y organiza todos los datos para el nuevo Dashboard del Resumen.
+    Si se recibe el snapshot del cierre (obtener_snapshot_cierre) se reutilizan sus
+    pagos e ingresos y solo se consulta el catálogo de métodos de pago.
+    Sin snapshot, los métodos de pago y los ingresos de socios se consultan en paralelo
+    con la búsqueda del cierre; solo los pagos esperan a conocer la sucursal.
     """
     try:
-        # 1. Obtener la información básica del cierre (fecha, sucursal)
-        cierre_resp = supabase.table('cierres_caja').select('fecha_operacion, sucursales(sucursal)').eq('id', cierre_id).single().execute()
-        if not cierre_resp.data:
-            return None, "No se encontró el cierre de caja."
-        
-        fecha_str = cierre_resp.data['fecha_operacion']
-        sucursal_nombre = cierre_resp.data['sucursales']['sucursal']
-
-        # 2. Obtener todos los métodos de pago con su tipo
-        metodos_resp = supabase.table('metodos_pago').select('nombre, tipo').execute()
-        metodos_info = {m['nombre']: m['tipo'] for m in metodos_resp.data}
-
-        # 3. Obtener todos los pagos de "Rayo" (tabla pagos) para el día y sucursal
-        fecha_inicio = datetime.strptime(fecha_str, '%Y-%m-%d')
-        fecha_fin = fecha_inicio + timedelta(days=1)
-        pagos_resp = supabase.table('pagos') \
-            .select('metodo_pago, monto') \
-            .eq('sucursal', sucursal_nombre) \
-            .gte('created_at', fecha_inicio.isoformat()) \
-            .lt('created_at', fecha_fin.isoformat()) \
-            .execute()
-
-        # 4. Obtener todos los ingresos de socios para este cierre
-        ingresos_socios_resp = supabase.table('ingresos_adicionales') \
-            .select('metodo_pago, monto, socios(nombre)') \
-            .eq('cierre_id', cierre_id) \
-            .execute()
+        if snapshot is not None:
+            metodos_data, err_metodos = obtener_metodos_pago()
+            pagos = [{'metodo_pago': p['metodo_pago']['nombre'], 'monto': p['monto']} for p in snapshot['pagos']]
+            ingresos_socios = snapshot['ingresos_adicionales']
+        else:
+            _entrada_actual()  # sincroniza el token antes de repartir las consultas entre hilos
+            # 1. Métodos de pago (catálogo en caché) e ingresos de socios: no dependen del cierre
+            futuro_metodos = _lanzar(obtener_metodos_pago)
+            futuro_ingresos = _lanzar(lambda: supabase.table('ingresos_adicionales') \
+                .select('metodo_pago, monto, socios(nombre)') \
+                .eq('cierre_id', cierre_id) \
+                .execute())
+
+            # 2. Obtener la información básica del cierre (fecha, sucursal)
+            cierre_resp = supabase.table('cierres_caja').select('fecha_operacion, sucursales(sucursal)').eq('id', cierre_id).single().execute()
+            if not cierre_resp.data:
+                return None, "No se encontró el cierre de caja."
             
+            fecha_str = cierre_resp.data['fecha_operacion']
+            sucursal_nombre = cierre_resp.data['sucursales']['sucursal']
+
+            # 3. Obtener los totales de "Rayo" (tabla pagos) por método para el día y sucursal
+            fecha_inicio = datetime.strptime(fecha_str, '%Y-%m-%d')
+            fecha_fin = fecha_inicio + timedelta(days=1)
+            pagos = [{'metodo_pago': metodo, 'monto': total} for metodo, total in _totales_pagos_por_metodo(sucursal_nombre, fecha_inicio, fecha_fin).items()]
+
+            # 4. Recoger las consultas lanzadas en paralelo
+            ingresos_socios = futuro_ingresos.result().data
+            metodos_data, err_metodos = futuro_metodos.result()
+
+        if err_metodos:
+            return None, err_metodos
+        metodos_info = {m['nombre']: m['tipo'] for m in metodos_data}
+
         # 5. Procesar los datos para el dashboard
         
         # Totales de Rayo (incluyendo internos y externos)
         totales_rayo = {}
-        for pago in pagos_resp.data:
+        for pago in pagos:
             metodo = pago['metodo_pago']
             monto = Decimal(str(pago.get('monto', 0) or 0))
             if metodo not in totales_rayo:
@@ -936,9 +1425,9 @@ def get_dashboard_resumen_data(cierre_id):
 
         # Totales de Socios (filtrando solo los externos)
         totales_socios = {}
-        for ingreso in ingresos_socios_resp.data:
+        for ingreso in ingresos_socios:
             metodo = ingreso['metodo_pago']
-            socio_nombre = ingreso.get('socios', {}).get('nombre', 'Socio Desconocido')
+            socio_nombre = (ingreso.get('socios') or {}).get('nombre', 'Socio Desconocido')
             
             # Aplicar la regla: Solo incluir si el método NO es de tipo 'interno'
             if metodos_info.get(metodo) != 'interno':
@@ -966,14 +1455,45 @@ def guardar_resumen_del_dia(cierre_id, resumen_json):
     try:
         datos = {"resumen_del_dia": resumen_json}
         response = supabase.table('cierres_caja').update(datos).eq('id', cierre_id).execute()
+        if response.data:
+            cubo_ingresos.CUBO.actualizar_cierre(response.data[0])
         return response.data, None
     except Exception as e:
         return None, f"Error al guardar el resumen del día: {e}"
 
-def admin_buscar_gastos_filtrados(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, categoria_id=None, usuario_id=None):
-    try:
+
+# --- CUBO DE INGRESOS (ver cubo_ingresos.py) ---
+CUBO_INGRESOS_TTL_S = float(os.environ.get("CUBO_INGRESOS_TTL_S", 1800))
+_bloqueo_carga_cubo = threading.Lock()
+
+def cargar_cubo_ingresos(forzar=False, al_progresar=None):
+    """
+    Devuelve (cubo, error). El cubo se construye la primera vez (o al vencer
+    CUBO_INGRESOS_TTL_S, que cubre cambios hechos desde otros servidores) con las filas ya
+    agregadas por cierre de reporte_ingresos_desde_json; después lo mantiene
+    guardar_resumen_del_dia. al_progresar(recibidos, total) es opcional.
+    """
+    cubo = cubo_ingresos.CUBO
+    with _bloqueo_carga_cubo:
+        if not forzar and cubo.vigente(CUBO_INGRESOS_TTL_S):
+            return cubo, None
+        cubo.iniciar_carga()
+        totales = []
+        for filas, total, err in admin_iterar_reporte_ingresos(por_cierre=True):
+            if err:
+                cubo.cancelar_carga()
+                return None, err
+            totales.extend(filas)
+            if al_progresar:
+                al_progresar(len(totales), total)
+        cubo.terminar_carga([], cubo_ingresos.celdas_de_totales(totales))
+        return cubo, None
+
+def admin_iterar_gastos_filtrados(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, categoria_id=None, usuario_id=None, cierre_ids=None):
+    """Versión paginada (generador de (filas, total, error)) de admin_buscar_gastos_filtrados."""
+    def construir_query(count):
         query = supabase.table('gastos_caja').select(
-            'created_at, monto, notas, sucursal, gastos_categorias(nombre), perfiles(nombre)'
+            'id, created_at, monto, notas, sucursal, gastos_categorias(nombre), perfiles(nombre)', count=count
         )
         if lista_sucursal_ids:
             query = query.in_('sucursal_id', lista_sucursal_ids)
@@ -985,16 +1505,19 @@ def admin_buscar_gastos_filtrados(lista_sucursal_ids=None, fecha_inicio=None, fe
             query = query.eq('categoria_id', categoria_id)
         if usuario_id:
             query = query.eq('usuario_id', usuario_id)
+        if cierre_ids is not None:
+            query = query.in_('cierre_id', list(cierre_ids))
+        return query
+    return _iterar_con_error(_paginar_keyset(construir_query, 'created_at'), "Error al buscar gastos filtrados")
 
-        response = query.order('created_at', desc=True).execute()
-        return response.data, None
-    except Exception as e:
-        return [], f"Error al buscar gastos filtrados: {e}"
+def admin_buscar_gastos_filtrados(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, categoria_id=None, usuario_id=None):
+    return _recolectar_paginas(admin_iterar_gastos_filtrados(lista_sucursal_ids, fecha_inicio, fecha_fin, categoria_id, usuario_id))
 
-def admin_buscar_deliveries_filtrados(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, origen_nombre=None, usuario_id=None):
-    try:
+def admin_iterar_deliveries_filtrados(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, origen_nombre=None, usuario_id=None, cierre_ids=None):
+    """Versión paginada (generador de (filas, total, error)) de admin_buscar_deliveries_filtrados."""
+    def construir_query(count):
         query = supabase.table('cierre_delivery').select(
-            'created_at, monto_cobrado, costo_repartidor, origen_nombre, notas, perfiles(nombre), sucursales(sucursal)'
+            'id, created_at, monto_cobrado, costo_repartidor, origen_nombre, notas, perfiles(nombre), sucursales(sucursal)', count=count
         )
         if lista_sucursal_ids:
             query = query.in_('sucursal_id', lista_sucursal_ids)
@@ -1006,16 +1529,19 @@ def admin_buscar_deliveries_filtrados(lista_sucursal_ids=None, fecha_inicio=None
             query = query.eq('origen_nombre', origen_nombre)
         if usuario_id:
             query = query.eq('usuario_id', usuario_id)
+        if cierre_ids is not None:
+            query = query.in_('cierre_id', list(cierre_ids))
+        return query
+    return _iterar_con_error(_paginar_keyset(construir_query, 'created_at'), "Error al buscar deliveries filtrados")
 
-        response = query.order('created_at', desc=True).execute()
-        return response.data, None
-    except Exception as e:
-        return [], f"Error al buscar deliveries filtrados: {e}"
+def admin_buscar_deliveries_filtrados(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, origen_nombre=None, usuario_id=None):
+    return _recolectar_paginas(admin_iterar_deliveries_filtrados(lista_sucursal_ids, fecha_inicio, fecha_fin, origen_nombre, usuario_id))
 
-def admin_buscar_resumenes_para_analisis(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, usuario_id=None):
-    try:
+def admin_iterar_resumenes_para_analisis(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, usuario_id=None):
+    """Versión paginada (generador de (filas, total, error)) de admin_buscar_resumenes_para_analisis."""
+    def construir_query(count):
         query = supabase.table('cierres_caja').select(
-            'fecha_operacion, resumen_del_dia, sucursales(sucursal), perfiles(nombre)'
+            'id, fecha_operacion, sucursal_id, usuario_id, resumen_del_dia, sucursales(sucursal), perfiles(nombre)', count=count
         ).not_.is_('resumen_del_dia', None)
 
         if lista_sucursal_ids:
@@ -1026,20 +1552,21 @@ def admin_buscar_resumenes_para_analisis(lista_sucursal_ids=None, fecha_inicio=N
             query = query.lte('fecha_operacion', fecha_fin)
         if usuario_id:
             query = query.eq('usuario_id', usuario_id)
+        return query
+    return _iterar_con_error(_paginar_keyset(construir_query, 'fecha_operacion'), "Error al buscar resúmenes para análisis")
 
-        response = query.order('fecha_operacion', desc=True).execute()
-        return response.data, None
-    except Exception as e:
-        return None, f"Error al buscar resúmenes para análisis: {e}"
+def admin_buscar_resumenes_para_analisis(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, usuario_id=None):
+    datos, err = _recolectar_paginas(admin_iterar_resumenes_para_analisis(lista_sucursal_ids, fecha_inicio, fecha_fin, usuario_id))
+    if err:
+        return None, err
+    return datos, None
 
 
-def get_registros_carga_rango(lista_sucursal_ids, fecha_inicio=None, fecha_fin=None):
-    """
-    Obtiene el historial de registros de carga para una o varias sucursales en un rango de fechas.
-    """
-    try:
+def iterar_registros_carga_rango(lista_sucursal_ids, fecha_inicio=None, fecha_fin=None):
+    """Versión paginada (generador de (filas, total, error)) de get_registros_carga_rango."""
+    def construir_query(count):
         query = supabase.table('cierre_registros_carga').select(
-            'id, fecha_operacion, carga_facturada, carga_retirada, carga_sin_retirar, perfiles(nombre), sucursales(sucursal)'
+            'id, fecha_operacion, carga_facturada, carga_retirada, carga_sin_retirar, perfiles(nombre), sucursales(sucursal)', count=count
         )
         
         # Usa el filtro .in_() para aceptar una lista de IDs
@@ -1050,11 +1577,17 @@ def get_registros_carga_rango(lista_sucursal_ids, fecha_inicio=None, fecha_fin=N
             query = query.gte('fecha_operacion', fecha_inicio)
         if fecha_fin:
             query = query.lte('fecha_operacion', fecha_fin)
-            
-        response = query.order('fecha_operacion', desc=True).execute()
-        return response.data, None
-    except Exception as e:
-        return None, f"Error al obtener historial de carga: {e}"
+        return query
+    return _iterar_con_error(_paginar_keyset(construir_query, 'fecha_operacion'), "Error al obtener historial de carga")
+
+def get_registros_carga_rango(lista_sucursal_ids, fecha_inicio=None, fecha_fin=None):
+    """
+    Obtiene el historial de registros de carga para una o varias sucursales en un rango de fechas.
+    """
+    datos, err = _recolectar_paginas(iterar_registros_carga_rango(lista_sucursal_ids, fecha_inicio, fecha_fin))
+    if err:
+        return None, err
+    return datos, None
 
 def admin_actualizar_registro_carga(registro_id, datos_actualizados):
     """
@@ -1062,7 +1595,199 @@ def admin_actualizar_registro_carga(registro_id, datos_actualizados):
     """
     try:
         response = supabase.table('cierre_registros_carga').update(datos_actualizados).eq('id', registro_id).execute()
+        _invalidar_escritura('cierre_registros_carga', response.data)
         return response.data, None
     except Exception as e:
         return None, f"Error al actualizar el registro de carga: {e}"
 
+# --- CARGA CONCURRENTE DE CATÁLOGOS ---
+# Las lecturas de catálogos son independientes entre sí: en lugar de encadenar una
+# consulta tras otra (la latencia se suma), se lanzan a la vez en un pool de hilos
+# y la espera total es la de la consulta más lenta.
+CATALOGOS = {
+    'sucursales': obtener_sucursales,
+    'sucursales_cde': obtener_sucursales_cde,
+    'usuarios': admin_get_lista_usuarios,
+    'metodos_pago': obtener_metodos_pago,
+    'metodos_pago_con_flags': obtener_metodos_pago_con_flags,
+    'metodos_pago_cde': obtener_metodos_pago_cde,
+    'socios': admin_get_todos_socios,
+    'socios_activos': obtener_socios,
+    'categorias': admin_get_todas_categorias,
+    'categorias_activas': obtener_categorias_gastos,
+}
+
+def cargar_catalogos(nombres):
+    """
+    Carga en paralelo los catálogos indicados (claves de CATALOGOS).
+    Devuelve ({nombre: datos}, error). Un catálogo que falla queda como lista vacía
+    y su error se incluye en el mensaje; el resto se devuelve igual.
+    """
+    desconocidos = [n for n in nombres if n not in CATALOGOS]
+    if desconocidos:
+        return {}, f"Catálogos desconocidos: {', '.join(desconocidos)}"
+
+    # Sincroniza el token de la sesión en este hilo: los hilos de trabajo no tienen
+    # contexto de Streamlit y usan el cliente de la sesión tal como está.
+    _entrada_actual()
+    futuros = {
+        nombre: _lanzar(CATALOGOS[nombre])
+        for nombre in nombres
+    }
+
+    datos, errores = {}, []
+    for nombre, futuro in futuros.items():
+        try:
+            resultado, err = futuro.result()
+        except Exception as e:
+            resultado, err = None, e
+        if err:
+            errores.append(f"{nombre}: {err}")
+        datos[nombre] = resultado or []
+    return datos, ("; ".join(errores) if errores else None)
+
+# --- CACHÉ LOCAL DE CIERRES CERRADOS (ver cache_reportes.py) ---
+# Los reportes leen los cierres CERRADOS (y sus filas hijas) de la caché en disco y solo
+# consultan por red las filas de los cierres que aún no están cerrados.
+COLECCIONES_CACHE_REPORTES = {
+    "gastos": ('gastos_caja', '*, gastos_categorias(nombre), perfiles(nombre)'),
+    "ingresos_adicionales": ('ingresos_adicionales', '*, socios(nombre)'),
+    "deliveries": ('cierre_delivery', '*, perfiles(nombre), sucursales(sucursal)'),
+    "compras": ('cierre_compras', '*'),
+}
+_SELECT_CIERRES_CACHE = '*, sucursales(sucursal), perfiles(nombre)'
+_bloqueo_sincronizacion_cache = threading.Lock()
+
+def _instante(valor):
+    return datetime.fromisoformat(valor.replace('Z', '+00:00')) if valor else None
+
+def _cargar_cierres_en_cache(construir_query):
+    """Descarga (paginados) los cierres de la consulta con sus filas hijas y los agrega a la caché. Devuelve (cantidad, marca)."""
+    cantidad, marca = 0, None
+    for cierres, _ in _paginar_keyset(construir_query, 'fecha_operacion'):
+        detalles, err = obtener_detalles_de_cierres([c['id'] for c in cierres], colecciones=COLECCIONES_CACHE_REPORTES)
+        if err:
+            raise RuntimeError(err)
+        filas = {"cierres": cierres}
+        for clave in COLECCIONES_CACHE_REPORTES:
+            filas[clave] = [fila for c in cierres for fila in detalles[c['id']][clave]]
+        cache_reportes.agregar(filas)
+        cantidad += len(cierres)
+        for c in cierres:
+            if c.get('fecha_hora_cierre_real') and (marca is None or _instante(c['fecha_hora_cierre_real']) > _instante(marca)):
+                marca = c['fecha_hora_cierre_real']
+    return cantidad, marca
+
+def _reconciliar_cache_reportes():
+    """Compara los ids de cierres cerrados de la BD con los de la caché: quita los sobrantes y carga los faltantes."""
+    def ids_cerrados(count):
+        return supabase.table('cierres_caja').select('id, fecha_operacion', count=count).eq('estado', 'CERRADO')
+    ids_bd = {c['id'] for filas, _ in _paginar_keyset(ids_cerrados, 'fecha_operacion') for c in filas}
+    en_cache = cache_reportes.ids_cierres()
+    cache_reportes.quitar_cierres(en_cache - ids_bd)
+    faltantes = list(ids_bd - en_cache)
+    cantidad, marca = 0, None
+    for i in range(0, len(faltantes), 100):
+        lote = faltantes[i:i + 100]
+        n, m = _cargar_cierres_en_cache(lambda count, lote=lote: supabase.table('cierres_caja').select(_SELECT_CIERRES_CACHE, count=count).in_('id', lote))
+        cantidad += n
+        if m and (marca is None or _instante(m) > _instante(marca)):
+            marca = m
+    return cantidad, marca
+
+def sincronizar_cache_reportes():
+    """
+    Trae a la caché local los cierres cerrados después de la última sincronización
+    (por fecha_hora_cierre_real). Luego compara el número de cierres cerrados en la BD con
+    el de la caché; si no coincide (p. ej. un cierre reabierto desde otro servidor) se
+    reconcilian por id. Devuelve ({"nuevos": n, "en_cache": m}, error).
+    """
+    with _bloqueo_sincronizacion_cache:
+        try:
+            meta = cache_reportes.leer_meta()
+
+            def cierres_nuevos(count):
+                query = supabase.table('cierres_caja').select(_SELECT_CIERRES_CACHE, count=count).eq('estado', 'CERRADO')
+                if meta.get('marca'):
+                    query = query.gt('fecha_hora_cierre_real', meta['marca'])
+                return query
+            nuevos, marca = _cargar_cierres_en_cache(cierres_nuevos)
+
+            total_bd = supabase.table('cierres_caja').select('id', count='exact').eq('estado', 'CERRADO').limit(1).execute().count
+            en_cache = len(cache_reportes.ids_cierres())
+            if total_bd is not None and total_bd != en_cache:
+                reconciliados, marca_reconciliados = _reconciliar_cache_reportes()
+                nuevos += reconciliados
+                marca = max(filter(None, [marca, marca_reconciliados]), key=_instante, default=None)
+                en_cache = len(cache_reportes.ids_cierres())
+
+            marcas = [m for m in (meta.get('marca'), marca) if m]
+            cache_reportes.guardar_meta({"marca": max(marcas, key=_instante) if marcas else None, "sincronizado": time.time()})
+            return {"nuevos": nuevos, "en_cache": en_cache}, None
+        except Exception as e:
+            return None, f"Error al sincronizar la caché de reportes: {e}"
+
+def _ids_cierres_no_cerrados(lista_sucursal_ids=None):
+    """Ids de los cierres no cerrados, paginados (un select suelto se corta en el max-rows de PostgREST)."""
+    def construir_query(count):
+        query = supabase.table('cierres_caja').select('id, fecha_operacion', count=count).neq('estado', 'CERRADO')
+        if lista_sucursal_ids:
+            query = query.in_('sucursal_id', lista_sucursal_ids)
+        return query
+    return [c['id'] for filas, _ in _paginar_keyset(construir_query, 'fecha_operacion') for c in filas]
+
+def _iterar_con_cache(tabla_cache, filtros_cache, iterar_red, mensaje_error, lista_sucursal_ids=None):
+    """
+    Generador (tabla, total, error) de tablas Arrow con las columnas aplanadas de
+    cache_reportes: primero las filas de cierres no cerrados (por red, iterar_red(cierre_ids))
+    y luego las de cierres cerrados, leídas de la caché local sin pasar a listas de dicts.
+    """
+    try:
+        # Los ids abiertos se leen antes de sincronizar: si un cierre se cierra entre medio,
+        # sus filas llegan por ambos lados y se descartan las repetidas.
+        abiertos = _ids_cierres_no_cerrados(lista_sucursal_ids)
+        _, err = sincronizar_cache_reportes()
+        if err:
+            raise RuntimeError(err)
+        cacheadas = cache_reportes.tabla_filtrada(tabla_cache, **filtros_cache)
+    except Exception as e:
+        yield None, None, f"{mensaje_error}: {e}"
+        return
+    en_cache = cacheadas.num_rows if cacheadas is not None else 0
+    vistas = set(cacheadas.column('id').to_pylist()) if en_cache else set()
+    total_red = 0
+    # Los ids abiertos van por lotes, como en obtener_detalles_de_cierres
+    for i in range(0, len(abiertos), TAMANO_LOTE_IDS):
+        total_lote = 0
+        for filas, total, err in iterar_red(abiertos[i:i + TAMANO_LOTE_IDS]):
+            if err:
+                yield None, None, err
+                return
+            total_lote = total or 0
+            nuevas = [f for f in filas if f['id'] not in vistas]
+            if nuevas:
+                yield cache_reportes.a_tabla_arrow(nuevas), en_cache + total_red + total_lote, None
+        total_red += total_lote
+    if en_cache:
+        yield cacheadas, en_cache + total_red, None
+
+def _filtros_fecha_cache(fecha_inicio, fecha_fin):
+    return {"desde": f"{fecha_inicio} 00:00:00" if fecha_inicio else None, "hasta": f"{fecha_fin} 23:59:59" if fecha_fin else None}
+
+def admin_iterar_gastos_reporte(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, categoria_id=None, usuario_id=None):
+    """Como admin_iterar_gastos_filtrados, pero en tablas Arrow y con los gastos de cierres cerrados leídos de la caché local."""
+    filtros = {"en": {"sucursal_id": lista_sucursal_ids}, "igual": {"categoria_id": categoria_id, "usuario_id": usuario_id}, **_filtros_fecha_cache(fecha_inicio, fecha_fin)}
+    return _iterar_con_cache(
+        "gastos", filtros,
+        lambda ids: admin_iterar_gastos_filtrados(lista_sucursal_ids, fecha_inicio, fecha_fin, categoria_id, usuario_id, cierre_ids=ids),
+        "Error al buscar gastos filtrados", lista_sucursal_ids
+    )
+
+def admin_iterar_deliveries_reporte(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, origen_nombre=None, usuario_id=None):
+    """Como admin_iterar_deliveries_filtrados, pero en tablas Arrow y con los deliveries de cierres cerrados leídos de la caché local."""
+    filtros = {"en": {"sucursal_id": lista_sucursal_ids}, "igual": {"origen_nombre": origen_nombre, "usuario_id": usuario_id}, **_filtros_fecha_cache(fecha_inicio, fecha_fin)}
+    return _iterar_con_cache(
+        "deliveries", filtros,
+        lambda ids: admin_iterar_deliveries_filtrados(lista_sucursal_ids, fecha_inicio, fecha_fin, origen_nombre, usuario_id, cierre_ids=ids),
+        "Error al buscar deliveries filtrados", lista_sucursal_ids
+    )
@@ -0,0 +1,938 @@
+# db_local.py - Backend de almacenamiento local (SQLite en proceso)
+#
+# Implementa el subconjunto de la interfaz del cliente de Supabase que usa database.py
+# (table/select/insert/update/upsert/delete, filtros, order, limit, single, rpc, storage y auth)
+# sobre una base SQLite en memoria o en archivo. Cada fila se guarda como un documento JSON,
+# así que no hace falta declarar el esquema de cada tabla.
+#
+# Se activa con DB_BACKEND=local. Variables opcionales:
+#   LOCAL_DB_PATH         Archivo SQLite (por defecto ':memory:').
+#   LOCAL_DB_SEED         Archivo JSON {"tabla": [filas...]} para poblar las tablas vacías.
+#   LOCAL_DB_LATENCIA_MS  Latencia simulada por petición (para medir round trips).
+#   LOCAL_STORAGE_DIR     Carpeta donde se guardan los archivos subidos a Storage.
+
+import copy
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+from supabase_auth.types import AuthResponse, Session, User
+
+# Tablas que usa la app (se crean vacías al iniciar)
+TABLAS = [
+    'perfiles', 'sucursales', 'metodos_pago', 'socios', 'gastos_categorias',
+    'cierres_caja', 'pagos', 'gastos_caja', 'ingresos_adicionales',
+    'cierre_delivery', 'cierre_compras', 'cierres_cde', 'cierre_registros_carga',
+    'auth_usuarios', 'totales_diarios',
+]
+
+# Relaciones para los selects embebidos: tabla embebida -> columna FK en la tabla padre
+RELACIONES_A_UNO = {
+    'perfiles': 'usuario_id',
+    'sucursales': 'sucursal_id',
+    'gastos_categorias': 'categoria_id',
+    'socios': 'socio_id',
+}
+
+# Tablas hijas de un cierre: tabla embebida -> columna FK en la tabla hija
+RELACIONES_A_MUCHOS = {
+    'gastos_caja': 'cierre_id',
+    'ingresos_adicionales': 'cierre_id',
+    'cierre_delivery': 'cierre_id',
+    'cierre_compras': 'cierre_id',
+}
+
+# Restricciones únicas (equivalen a los índices únicos de Postgres, error 23505)
+CLAVES_UNICAS = {
+    'cierre_registros_carga': [('fecha_operacion', 'sucursal_id')],
+    'cierres_cde': [('fecha_operacion', 'sucursal_id')],
+    'gastos_categorias': [('nombre',)],
+    'ingresos_adicionales': [('cierre_id', 'socio_id', 'metodo_pago')],
+    'socios': [('nombre',)],
+    'totales_diarios': [('cierre_id', 'fuente', 'metodo_pago', 'tipo'), ('cierre_cde_id', 'fuente', 'metodo_pago', 'tipo')],
+}
+
+# Referencias que impiden borrar una fila (equivalen a FK con RESTRICT, error 23503)
+REFERENCIAS = {
+    'socios': [('ingresos_adicionales', 'socio_id')],
+    'gastos_categorias': [('gastos_caja', 'categoria_id')],
+}
+
+COLUMNAS_TIMESTAMP = {'created_at', 'fecha_hora_cierre_real'}
+
+# Versión de los cierres (migración version_cierre): avanza una vez por petición que escribe
+# en el cierre o en sus hijas. Cada petición es una "transacción" con su número
+# (transaccion_actual() en SQL), como el txid que guarda version_transaccion en Postgres.
+_SQL_AVANZAR_VERSION = (
+    'UPDATE "cierres_caja" SET data = json_set(data, '
+    '\'$.version\', coalesce(json_extract(data, \'$.version\'), 0) + 1, '
+    '\'$.version_transaccion\', transaccion_actual()) '
+    'WHERE id IN ({ids}) AND coalesce(json_extract(data, \'$.version_transaccion\'), -1) <> transaccion_actual();'
+)
+
+# Funciones RPC disponibles en el backend local: nombre -> función(cliente, **params)
+FUNCIONES_RPC = {}
+
+_PATRON_COLUMNA = re.compile(r'^\w+$')
+_PATRON_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}')
+
+
+class ErrorLocal(Exception):
+    """Error con el mismo formato (code/message) que los errores de PostgREST."""
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+        super().__init__(str({'code': code, 'message': message}))
+
+
+def funcion_rpc(nombre):
+    """Decorador para registrar la implementación local de una función SQL."""
+    def registrar(funcion):
+        FUNCIONES_RPC[nombre] = funcion
+        return funcion
+    return registrar
+
+
+def normalizar_timestamp(valor):
+    """
+    Lleva un timestamp ISO a UTC con un formato fijo para que las comparaciones
+    de texto en SQLite se comporten como las de un timestamptz en Postgres.
+    Los valores sin zona horaria se interpretan como UTC (igual que Supabase).
+    """
+    if not isinstance(valor, str) or not _PATRON_TIMESTAMP.match(valor):
+        return valor
+    try:
+        fecha = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    except ValueError:
+        return valor
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha.strftime('%Y-%m-%d %H:%M:%S.%f') + '+00:00'
+
+
+def _ahora():
+    return normalizar_timestamp(datetime.now(timezone.utc).isoformat())
+
+
+def _columna(nombre):
+    if not _PATRON_COLUMNA.match(nombre or ''):
+        raise ErrorLocal('42703', f"Columna inválida: {nombre}")
+    return f"json_extract(data, '$.\"{nombre}\"')"
+
+
+def _valor_sql(valor):
+    if isinstance(valor, bool):
+        return 1 if valor else 0
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor)
+    return normalizar_timestamp(valor)
+
+
+def _dividir_nivel_superior(texto, separador=','):
+    """Divide por el separador ignorando lo que está entre paréntesis o comillas."""
+    partes, actual, nivel, en_comillas = [], '', 0, False
+    for caracter in texto:
+        if caracter == '"':
+            en_comillas = not en_comillas
+        elif not en_comillas and caracter == '(':
+            nivel += 1
+        elif not en_comillas and caracter == ')':
+            nivel -= 1
+        if caracter == separador and nivel == 0 and not en_comillas:
+            partes.append(actual.strip())
+            actual = ''
+        else:
+            actual += caracter
+    if actual.strip():
+        partes.append(actual.strip())
+    return partes
+
+
+def _parsear_seleccion(seleccion):
+    """
+    Convierte '*, perfiles(nombre), sucursales(sucursal)' en
+    (['*'], [('perfiles', 'perfiles', 'nombre'), ('sucursales', 'sucursales', 'sucursal')]).
+    """
+    columnas, embebidos = [], []
+    for parte in _dividir_nivel_superior(seleccion or '*'):
+        if '(' in parte and parte.endswith(')'):
+            cabecera, interior = parte[:-1].split('(', 1)
+            alias, _, tabla = cabecera.rpartition(':')
+            tabla = tabla.split('!')[0].strip()
+            embebidos.append((alias.strip() or tabla, tabla, interior))
+        else:
+            columnas.append(parte)
+    return columnas or ['*'], embebidos
+
+
+def _quitar_comillas(valor):
+    if len(valor) >= 2 and valor[0] == valor[-1] == '"':
+        return valor[1:-1]
+    return valor
+
+
+class _Respuesta:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Consulta:
+    """Constructor de consultas con la misma forma encadenable que postgrest-py."""
+
+    def __init__(self, cliente, tabla):
+        self._cliente = cliente
+        self._tabla = tabla
+        self._operacion = 'select'
+        self._seleccion = '*'
+        self._conteo = None
+        self._datos = None
+        self._on_conflict = None
+        self._filtros = []
+        self._negar = False
+        self._orden = []
+        self._limite = None
+        self._desplazamiento = None
+        self._unico = None
+
+    # --- Operaciones ---
+    def select(self, *columnas, count=None, head=None):
+        self._seleccion = ','.join(columnas) if columnas else '*'
+        self._conteo = count
+        return self
+
+    def insert(self, datos, **_):
+        self._operacion, self._datos = 'insert', datos
+        return self
+
+    def update(self, datos, **_):
+        self._operacion, self._datos = 'update', datos
+        return self
+
+    def upsert(self, datos, on_conflict='', **_):
+        self._operacion, self._datos = 'upsert', datos
+        self._on_conflict = [c.strip() for c in on_conflict.split(',') if c.strip()] or ['id']
+        return self
+
+    def delete(self, **_):
+        self._operacion = 'delete'
+        return self
+
+    # --- Filtros ---
+    @property
+    def not_(self):
+        self._negar = True
+        return self
+
+    def _filtro(self, sql, params):
+        if self._negar:
+            sql, self._negar = f"NOT ({sql})", False
+        self._filtros.append((sql, params))
+        return self
+
+    def eq(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} = ?", [_valor_sql(valor)])
+
+    def neq(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} != ?", [_valor_sql(valor)])
+
+    def gt(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} > ?", [_valor_sql(valor)])
+
+    def gte(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} >= ?", [_valor_sql(valor)])
+
+    def lt(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} < ?", [_valor_sql(valor)])
+
+    def lte(self, columna, valor):
+        return self._filtro(f"{_columna(columna)} <= ?", [_valor_sql(valor)])
+
+    def like(self, columna, patron):
+        return self._filtro(f"{_columna(columna)} LIKE ? ESCAPE '\\'", [patron.replace('*', '%')])
+
+    def ilike(self, columna, patron):
+        return self._filtro(f"LOWER({_columna(columna)}) LIKE LOWER(?) ESCAPE '\\'", [patron.replace('*', '%')])
+
+    def in_(self, columna, valores):
+        valores = list(valores)
+        if not valores:
+            return self._filtro("0", [])
+        marcadores = ', '.join('?' for _ in valores)
+        return self._filtro(f"{_columna(columna)} IN ({marcadores})", [_valor_sql(v) for v in valores])
+
+    def is_(self, columna, valor):
+        if valor is None or str(valor).lower() == 'null':
+            return self._filtro(f"{_columna(columna)} IS NULL", [])
+        return self._filtro(f"{_columna(columna)} = ?", [1 if str(valor).lower() == 'true' else 0])
+
+    def or_(self, filtros):
+        sql, params = self._traducir_logico('or', filtros)
+        return self._filtro(sql, params)
+
+    def _traducir_logico(self, operador, texto):
+        """Traduce la sintaxis de filtros de PostgREST ('col.op.valor,and(...)') a SQL."""
+        partes_sql, params = [], []
+        for termino in _dividir_nivel_superior(texto):
+            negado = termino.startswith('not.')
+            if negado:
+                termino = termino[4:]
+            if termino.startswith(('and(', 'or(')) and termino.endswith(')'):
+                sub_operador, interior = termino[:-1].split('(', 1)
+                sql, sub_params = self._traducir_logico(sub_operador, interior)
+            else:
+                columna, op, valor = termino.split('.', 2)
+                valor = _quitar_comillas(valor)
+                sql, sub_params = self._traducir_comparacion(columna, op, valor)
+            partes_sql.append(f"NOT ({sql})" if negado else f"({sql})")
+            params.extend(sub_params)
+        return f" {operador.upper()} ".join(partes_sql), params
+
+    def _traducir_comparacion(self, columna, op, valor):
+        operadores = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+        if op in operadores:
+            return f"{_columna(columna)} {operadores[op]} ?", [_valor_sql(valor)]
+        if op == 'is':
+            return (f"{_columna(columna)} IS NULL", []) if valor == 'null' else (f"{_columna(columna)} = ?", [1 if valor == 'true' else 0])
+        if op == 'in':
+            valores = [_quitar_comillas(v) for v in _dividir_nivel_superior(valor.strip('()'))]
+            return f"{_columna(columna)} IN ({', '.join('?' for _ in valores)})", [_valor_sql(v) for v in valores]
+        if op in ('like', 'ilike'):
+            return f"{_columna(columna)} LIKE ?", [valor.replace('*', '%')]
+        raise ErrorLocal('PGRST100', f"Operador no soportado en backend local: {op}")
+
+    # --- Modificadores ---
+    def order(self, columna, desc=False, nullsfirst=None, **_):
+        self._orden.append((columna, desc))
+        return self
+
+    def limit(self, cantidad, **_):
+        self._limite = cantidad
+        return self
+
+    def offset(self, cantidad):
+        self._desplazamiento = cantidad
+        return self
+
+    def range(self, inicio, fin, **_):
+        self._desplazamiento, self._limite = inicio, fin - inicio + 1
+        return self
+
+    def single(self):
+        self._unico = 'single'
+        return self
+
+    def maybe_single(self):
+        self._unico = 'maybe'
+        return self
+
+    # --- Ejecución ---
+    def _where(self):
+        if not self._filtros:
+            return '', []
+        sql = ' AND '.join(f"({f})" for f, _ in self._filtros)
+        params = [p for _, ps in self._filtros for p in ps]
+        return f" WHERE {sql}", params
+
+    def _seleccionar_documentos(self, conexion):
+        where, params = self._where()
+        sql = f'SELECT data FROM "{self._tabla}"{where}'
+        if self._orden:
+            sql += ' ORDER BY ' + ', '.join(f"{_columna(c)} {'DESC' if d else 'ASC'}" for c, d in self._orden)
+        if self._limite is not None or self._desplazamiento is not None:
+            sql += f" LIMIT {int(self._limite if self._limite is not None else -1)} OFFSET {int(self._desplazamiento or 0)}"
+        return [json.loads(fila[0]) for fila in conexion.execute(sql, params)]
+
+    def execute(self):
+        self._cliente._registrar_peticion(self._tabla, self._operacion)
+        with self._cliente._bloqueo:
+            conexion = self._cliente._conexion
+            try:
+                if self._operacion == 'select':
+                    respuesta = self._ejecutar_select(conexion)
+                else:
+                    self._cliente._nueva_transaccion()
+                    with conexion:
+                        respuesta = getattr(self, f"_ejecutar_{self._operacion}")(conexion)
+            except sqlite3.IntegrityError as e:
+                raise ErrorLocal('23505', f"duplicate key value violates unique constraint ({e})")
+        if self._unico == 'maybe' and not respuesta.data:
+            return None
+        return respuesta
+
+    def _ejecutar_select(self, conexion):
+        documentos = self._seleccionar_documentos(conexion)
+        conteo = None
+        if self._conteo:
+            where, params = self._where()
+            conteo = conexion.execute(f'SELECT COUNT(*) FROM "{self._tabla}"{where}', params).fetchone()[0]
+        filas = self._cliente._proyectar(self._tabla, documentos, self._seleccion)
+        return self._resultado(filas, conteo)
+
+    def _resultado(self, filas, conteo=None):
+        if self._unico:
+            if len(filas) > 1 or (self._unico == 'single' and len(filas) == 0):
+                raise ErrorLocal('PGRST116', f"JSON object requested, multiple (or no) rows returned ({len(filas)})")
+            return _Respuesta(filas[0] if filas else None, conteo)
+        return _Respuesta(filas, conteo)
+
+    def _ejecutar_insert(self, conexion):
+        filas = self._datos if isinstance(self._datos, list) else [self._datos]
+        insertados = [self._cliente._insertar_documento(conexion, self._tabla, fila) for fila in filas]
+        return self._resultado(self._cliente._proyectar(self._tabla, insertados, self._seleccion))
+
+    def _ejecutar_update(self, conexion):
+        actualizados = []
+        for documento in self._seleccionar_documentos(conexion):
+            documento.update({k: normalizar_timestamp(v) if k in COLUMNAS_TIMESTAMP else v for k, v in self._datos.items()})
+            self._cliente._guardar_documento(conexion, self._tabla, documento)
+            actualizados.append(documento)
+        return self._resultado(self._cliente._proyectar(self._tabla, actualizados, self._seleccion))
+
+    def _ejecutar_upsert(self, conexion):
+        filas = self._datos if isinstance(self._datos, list) else [self._datos]
+        resultado = []
+        for fila in filas:
+            condicion = ' AND '.join(f"{_columna(c)} IS ?" for c in self._on_conflict)
+            existente = conexion.execute(
+                f'SELECT data FROM "{self._tabla}" WHERE {condicion}',
+                [_valor_sql(fila.get(c)) for c in self._on_conflict]
+            ).fetchone()
+            if existente:
+                documento = json.loads(existente[0])
+                documento.update({k: normalizar_timestamp(v) if k in COLUMNAS_TIMESTAMP else v for k, v in fila.items()})
+                self._cliente._guardar_documento(conexion, self._tabla, documento)
+            else:
+                documento = self._cliente._insertar_documento(conexion, self._tabla, fila)
+            resultado.append(documento)
+        return self._resultado(self._cliente._proyectar(self._tabla, resultado, self._seleccion))
+
+    def _ejecutar_delete(self, conexion):
+        eliminados = self._seleccionar_documentos(conexion)
+        ids = [d['id'] for d in eliminados]
+        _verificar_referencias(conexion, self._tabla, ids)
+        for id_documento in ids:
+            conexion.execute(f'DELETE FROM "{self._tabla}" WHERE id = ?', [str(id_documento)])
+        return self._resultado(self._cliente._proyectar(self._tabla, eliminados, self._seleccion))
+
+
+def _verificar_referencias(conexion, tabla, ids):
+    """Lanza el 23503 de Postgres si alguna fila de REFERENCIAS apunta a esos ids."""
+    for tabla_hija, columna in REFERENCIAS.get(tabla, []):
+        if ids and conexion.execute(
+            f'SELECT 1 FROM "{tabla_hija}" WHERE {_columna(columna)} IN ({", ".join("?" for _ in ids)}) LIMIT 1',
+            [_valor_sql(i) for i in ids]
+        ).fetchone():
+            raise ErrorLocal('23503', f'update or delete on table "{tabla}" violates foreign key constraint on table "{tabla_hija}"')
+
+
+class _LlamadaRPC:
+    def __init__(self, cliente, nombre, params):
+        self._cliente, self._nombre, self._params = cliente, nombre, params or {}
+
+    def execute(self):
+        funcion = FUNCIONES_RPC.get(self._nombre)
+        if funcion is None:
+            raise ErrorLocal('PGRST202', f"La función '{self._nombre}' no existe en el backend local.")
+        self._cliente._registrar_peticion(f"rpc:{self._nombre}", 'rpc')
+        with self._cliente._bloqueo:
+            self._cliente._nueva_transaccion()
+            return _Respuesta(funcion(self._cliente, **self._params))
+
+
+class _BucketLocal:
+    def __init__(self, carpeta):
+        self._carpeta = carpeta
+
+    def upload(self, path, file, **_):
+        destino = os.path.join(self._carpeta, path)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, 'wb') as f:
+            f.write(file)
+        return SimpleNamespace(path=path, full_path=destino)
+
+    def get_public_url(self, path, **_):
+        return f"file://{os.path.join(self._carpeta, path)}"
+
+
+class _StorageLocal:
+    def __init__(self, carpeta):
+        self._carpeta = carpeta
+
+    def from_(self, bucket):
+        return _BucketLocal(os.path.join(self._carpeta, bucket))
+
+
+class _AuthLocal:
+    """Autenticación mínima contra la tabla 'auth_usuarios' (id, email, password)."""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self.sesion_actual = None
+
+    def sign_in_with_password(self, credenciales):
+        """Devuelve un AuthResponse (user, session) igual que supabase_auth."""
+        respuesta = self._cliente.table('auth_usuarios').select('id, email, password') \
+            .eq('email', credenciales.get('email')).maybe_single().execute()
+        if respuesta is None or respuesta.data['password'] != credenciales.get('password'):
+            raise ErrorLocal('invalid_credentials', 'Invalid login credentials')
+        usuario = User(id=respuesta.data['id'], email=respuesta.data['email'], app_metadata={}, user_metadata={},
+                       aud='authenticated', created_at=datetime.now(timezone.utc))
+        token = uuid.uuid4().hex
+        sesion = Session(access_token=token, refresh_token=token, expires_in=3600, token_type='bearer', user=usuario)
+        self.sesion_actual = AuthResponse(user=usuario, session=sesion)
+        return self.sesion_actual
+
+    def set_session(self, access_token, refresh_token):
+        return self.sesion_actual
+
+    def get_session(self):
+        return self.sesion_actual.session if self.sesion_actual else None
+
+    def refresh_session(self, refresh_token=None):
+        return self.sesion_actual
+
+    def on_auth_state_change(self, callback):
+        return SimpleNamespace(unsubscribe=lambda: None)
+
+    def sign_out(self, *_):
+        self.sesion_actual = None
+
+
+class ClienteLocal:
+    """Cliente con la misma interfaz que supabase.Client, respaldado por SQLite."""
+
+    def __init__(self, ruta=':memory:', latencia_ms=0, carpeta_storage=None):
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._bloqueo = threading.RLock()
+        self._transaccion = [0]   # lista: compartida con las vistas de con_sesion_propia
+        self._conexion.create_function('transaccion_actual', 0, lambda: self._transaccion[0])
+        self.latencia_ms = float(latencia_ms or 0)
+        self._peticiones = {}
+        self._bloqueo_estadisticas = threading.Lock()
+        self.storage = _StorageLocal(carpeta_storage or os.path.join(tempfile.gettempdir(), 'app_cierres_storage'))
+        self.auth = _AuthLocal(self)
+        self._crear_tablas()
+
+    def _crear_tablas(self):
+        with self._bloqueo, self._conexion:
+            for tabla in TABLAS:
+                self._conexion.execute(f'CREATE TABLE IF NOT EXISTS "{tabla}" (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            for tabla, claves in CLAVES_UNICAS.items():
+                for columnas in claves:
+                    nombre_indice = f"ux_{tabla}_{'_'.join(columnas)}"
+                    expresiones = ', '.join(_columna(c) for c in columnas)
+                    self._conexion.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{nombre_indice}" ON "{tabla}" ({expresiones})')
+            # Triggers de version_cierre en las tablas hijas (la fila del cierre: _guardar_documento)
+            cierre_nuevo, cierre_viejo = "json_extract(NEW.data, '$.cierre_id')", "json_extract(OLD.data, '$.cierre_id')"
+            for tabla in RELACIONES_A_MUCHOS:
+                for evento, ids in (('INSERT', cierre_nuevo), ('UPDATE', f'{cierre_viejo}, {cierre_nuevo}'), ('DELETE', cierre_viejo)):
+                    self._conexion.execute(
+                        f'CREATE TRIGGER IF NOT EXISTS "{tabla}_version_cierre_{evento.lower()}" AFTER {evento} ON "{tabla}" '
+                        f'BEGIN {_SQL_AVANZAR_VERSION.format(ids=ids)} END'
+                    )
+
+    # --- Interfaz pública (igual que supabase.Client) ---
+    def table(self, nombre):
+        if nombre not in TABLAS:
+            with self._bloqueo, self._conexion:
+                self._conexion.execute(f'CREATE TABLE IF NOT EXISTS "{nombre}" (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            TABLAS.append(nombre)
+        return _Consulta(self, nombre)
+
+    from_ = table
+
+    def rpc(self, nombre, params=None, **_):
+        return _LlamadaRPC(self, nombre, params)
+
+    def _nueva_transaccion(self):
+        """Cada petición de escritura (o RPC) es una transacción para la versión de los cierres."""
+        self._transaccion[0] += 1
+
+    # --- Medición ---
+    def _registrar_peticion(self, tabla, operacion):
+        with self._bloqueo_estadisticas:
+            clave = (tabla, operacion)
+            self._peticiones[clave] = self._peticiones.get(clave, 0) + 1
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000.0)
+
+    def estadisticas(self):
+        """Devuelve el número de peticiones (round trips) por (tabla, operación) y el total."""
+        with self._bloqueo_estadisticas:
+            detalle = dict(self._peticiones)
+        return {"total": sum(detalle.values()), "detalle": detalle}
+
+    def con_sesion_propia(self):
+        """
+        Otro cliente contra la MISMA base de datos (conexión, bloqueo y estadísticas compartidas)
+        pero con su propio estado de auth, como dos clientes de Supabase del mismo proyecto.
+        """
+        vista = copy.copy(self)
+        vista.auth = _AuthLocal(vista)
+        return vista
+
+    def reiniciar_estadisticas(self):
+        with self._bloqueo_estadisticas:
+            self._peticiones.clear()
+
+    # --- Datos ---
+    def cargar_datos(self, datos_por_tabla):
+        """Inserta filas iniciales ({"tabla": [filas...]}) sin contar peticiones."""
+        with self._bloqueo, self._conexion:
+            for tabla, filas in datos_por_tabla.items():
+                if tabla not in TABLAS:
+                    self._conexion.execute(f'CREATE TABLE IF NOT EXISTS "{tabla}" (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+                    TABLAS.append(tabla)
+                for fila in filas:
+                    self._insertar_documento(self._conexion, tabla, fila)
+
+    def _insertar_documento(self, conexion, tabla, fila):
+        documento = {k: normalizar_timestamp(v) if k in COLUMNAS_TIMESTAMP else v for k, v in fila.items()}
+        documento.setdefault('id', str(uuid.uuid4()))
+        documento.setdefault('created_at', _ahora())
+        if tabla == 'cierres_caja':
+            documento.setdefault('version', 0)
+        conexion.execute(f'INSERT INTO "{tabla}" (id, data) VALUES (?, ?)', [str(documento['id']), json.dumps(documento)])
+        return documento
+
+    def _guardar_documento(self, conexion, tabla, documento):
+        if tabla == 'cierres_caja':
+            # Como el trigger cierres_caja_version: una vez por transacción, salvo que ya la avanzara una hija
+            fila = conexion.execute('SELECT data FROM "cierres_caja" WHERE id = ?', [str(documento['id'])]).fetchone()
+            actual = json.loads(fila[0]) if fila else {}
+            if documento.get('version') == actual.get('version') and actual.get('version_transaccion') != self._transaccion[0]:
+                documento['version'] = (actual.get('version') or 0) + 1
+                documento['version_transaccion'] = self._transaccion[0]
+        conexion.execute(f'UPDATE "{tabla}" SET data = ? WHERE id = ?', [json.dumps(documento), str(documento['id'])])
+
+    def _buscar_por_columna(self, tabla, columna, valores, orden=None):
+        valores = [v for v in dict.fromkeys(valores) if v is not None]
+        if not valores:
+            return []
+        sql = f'SELECT data FROM "{tabla}" WHERE {_columna(columna)} IN ({", ".join("?" for _ in valores)})'
+        if orden:
+            sql += f" ORDER BY {_columna(orden)}"
+        return [json.loads(f[0]) for f in self._conexion.execute(sql, [_valor_sql(v) for v in valores])]
+
+    def _proyectar(self, tabla, documentos, seleccion):
+        """Aplica la lista de columnas y resuelve los embebidos con una consulta por relación."""
+        columnas, embebidos = _parsear_seleccion(seleccion)
+        filas = []
+        for documento in documentos:
+            if '*' in columnas:
+                fila = dict(documento)
+            else:
+                fila = {c: documento.get(c) for c in columnas}
+            filas.append(fila)
+
+        for alias, tabla_embebida, sub_seleccion in embebidos:
+            if tabla_embebida in RELACIONES_A_MUCHOS and tabla in ('cierres_caja',):
+                columna_fk = RELACIONES_A_MUCHOS[tabla_embebida]
+                hijos = self._buscar_por_columna(tabla_embebida, columna_fk, [d.get('id') for d in documentos], orden='created_at')
+                agrupados = {}
+                for hijo, proyectado in zip(hijos, self._proyectar(tabla_embebida, hijos, sub_seleccion)):
+                    agrupados.setdefault(hijo.get(columna_fk), []).append(proyectado)
+                for documento, fila in zip(documentos, filas):
+                    fila[alias] = agrupados.get(documento.get('id'), [])
+            else:
+                columna_fk = RELACIONES_A_UNO.get(tabla_embebida)
+                if columna_fk is None:
+                    raise ErrorLocal('PGRST200', f"No hay relación entre '{tabla}' y '{tabla_embebida}' en el backend local.")
+                relacionados = self._buscar_por_columna(tabla_embebida, 'id', [d.get(columna_fk) for d in documentos])
+                por_id = {
+                    relacionado['id']: proyectado
+                    for relacionado, proyectado in zip(relacionados, self._proyectar(tabla_embebida, relacionados, sub_seleccion))
+                }
+                for documento, fila in zip(documentos, filas):
+                    fila[alias] = por_id.get(documento.get(columna_fk))
+        return filas
+
+
+# --- FUNCIONES RPC LOCALES ---
+# Equivalentes en Python de las funciones SQL de supabase/migrations/.
+
+@funcion_rpc('totales_pagos_delta')
+def _rpc_totales_pagos_delta(cliente, p_sucursal, p_desde, p_hasta, p_marca_created_at=None, p_marca_id=None, p_margen_s=30):
+    desde = normalizar_timestamp(p_desde)
+    marca = normalizar_timestamp(p_marca_created_at) if p_marca_created_at else None
+    corte = normalizar_timestamp((datetime.now(timezone.utc) - timedelta(seconds=p_margen_s)).isoformat())
+    with cliente._bloqueo:
+        filas = cliente._conexion.execute(
+            f'SELECT {_columna("metodo_pago")}, {_columna("monto")}, {_columna("created_at")}, id FROM "pagos" '
+            f'WHERE {_columna("sucursal")} = ? AND {_columna("created_at")} >= ? AND {_columna("created_at")} < ?',
+            [p_sucursal, max(desde, marca or desde), normalizar_timestamp(p_hasta)]
+        ).fetchall()
+    if marca:
+        filas = [f for f in filas if (f[2], f[3]) > (marca, p_marca_id)]
+
+    totales, ultima = {}, None
+    for metodo, monto, created_at, id_pago in filas:
+        consolidado = created_at < corte
+        if consolidado and (ultima is None or (created_at, id_pago) > ultima):
+            ultima = (created_at, id_pago)
+        total, cantidad = totales.get((metodo, consolidado), (Decimal('0'), 0))
+        totales[(metodo, consolidado)] = (total + Decimal(str(monto or 0)), cantidad + 1)
+    return [
+        {"metodo_pago": metodo, "consolidado": consolidado, "total": float(total), "cantidad": cantidad,
+         "marca_created_at": ultima[0] if ultima else None, "marca_id": ultima[1] if ultima else None}
+        for (metodo, consolidado), (total, cantidad) in sorted(totales.items(), key=lambda item: (item[0][0] or '', item[0][1]))
+    ]
+
+
+@funcion_rpc('reporte_ingresos_desde_json')
+def _rpc_reporte_ingresos_desde_json(cliente, fecha_inicio=None, fecha_fin=None, p_sucursal_id=None, p_usuario_id=None,
+                                     p_metodo_pago=None, p_socio_id=None, p_sucursal_ids=None, p_fuente=None,
+                                     p_por_cierre=False, p_limite=None, p_desplazamiento=0):
+    condiciones, params = [f'{_columna("resumen_del_dia")} IS NOT NULL'], []
+    for sql, valor in ((f'{_columna("fecha_operacion")} >= ?', fecha_inicio), (f'{_columna("fecha_operacion")} <= ?', fecha_fin),
+                       (f'{_columna("sucursal_id")} = ?', p_sucursal_id), (f'{_columna("usuario_id")} = ?', p_usuario_id)):
+        if valor is not None:
+            condiciones.append(sql)
+            params.append(valor)
+    if p_sucursal_ids is not None:
+        condiciones.append(f'{_columna("sucursal_id")} IN ({", ".join("?" for _ in p_sucursal_ids) or "NULL"})')
+        params.extend(p_sucursal_ids)
+
+    with cliente._bloqueo:
+        cierres = [json.loads(data) for (data,) in cliente._conexion.execute(
+            f'SELECT data FROM "cierres_caja" WHERE {" AND ".join(condiciones)}', params
+        ).fetchall()]
+        totales_cerrados = {}
+        for fila in cliente._buscar_por_columna('totales_diarios', 'cierre_id', [c['id'] for c in cierres if c.get('estado') == 'CERRADO']):
+            totales_cerrados.setdefault(fila['cierre_id'], []).append(fila)
+        sucursales = dict(cliente._conexion.execute(f'SELECT id, {_columna("sucursal")} FROM "sucursales"').fetchall())
+        usuarios = dict(cliente._conexion.execute(f'SELECT id, {_columna("nombre")} FROM "perfiles"').fetchall())
+        socios = dict(cliente._conexion.execute(f'SELECT id, {_columna("nombre")} FROM "socios"').fetchall())
+
+    fuente_socio = socios.get(p_socio_id) if p_socio_id is not None else None
+    totales = {}
+    for cierre in cierres:
+        # Los cierres cerrados se leen de totales_diarios; el resto, de su resumen
+        if cierre.get('estado') == 'CERRADO':
+            items = [(t['fuente'], t['metodo_pago'], t['tipo'], t['total']) for t in totales_cerrados.get(cierre['id'], [])]
+        else:
+            resumen = cierre['resumen_del_dia'] or {}
+            items = [('Rayo (POS)', r.get('metodo'), r.get('tipo'), r.get('total')) for r in resumen.get('desglose_rayo', [])]
+            items += [(so.get('socio'), d.get('metodo'), 'externo', d.get('total'))
+                      for so in resumen.get('totales_por_socio', []) for d in so.get('desglose', [])]
+        base = (cierre['fecha_operacion'], cierre.get('sucursal_id'), cierre.get('usuario_id'), cierre['id'] if p_por_cierre else None)
+        for fuente, metodo, tipo, total in items:
+            if (p_metodo_pago is not None and metodo != p_metodo_pago) or (p_fuente is not None and fuente != p_fuente) \
+                    or (p_socio_id is not None and fuente != fuente_socio):
+                continue
+            clave = base + (fuente, metodo, tipo)
+            totales[clave] = totales.get(clave, Decimal('0')) + Decimal(str(total or 0))
+
+    # Mismo orden que la función SQL: fecha desc y luego sucursal, usuario, fuente, método, tipo e ids asc
+    def orden(c):
+        return (sucursales.get(c[1]) or '', usuarios.get(c[2]) or '', c[4] or '', c[5] or '', c[6] or '', c[1] or '', c[2] or '', c[3] or '')
+    claves = sorted(totales, key=orden)
+    claves.sort(key=lambda c: c[0], reverse=True)
+    fin = None if p_limite is None else p_desplazamiento + p_limite
+    return [
+        {"fecha": c[0], "sucursal_id": c[1], "sucursal": sucursales.get(c[1]) or 'N/A', "usuario_id": c[2],
+         "usuario": usuarios.get(c[2]) or 'N/A', "cierre_id": c[3], "fuente": c[4], "metodo": c[5], "tipo": c[6],
+         "total": float(totales[c]), "total_filas": len(claves)}
+        for c in claves[p_desplazamiento:fin]
+    ]
+
+
+@funcion_rpc('registrar_delivery_con_gasto')
+def _rpc_registrar_delivery_con_gasto(cliente, p_cierre_id, p_usuario_id, p_sucursal_id, p_sucursal_nombre, p_monto_cobrado,
+                                      p_costo_repartidor, p_origen_nombre, p_notas, p_categoria_gasto_id, p_nota_gasto):
+    # Una sola transacción de SQLite: si falla el delivery, el gasto tampoco queda
+    with cliente._bloqueo, cliente._conexion:
+        gasto = None
+        if (p_costo_repartidor or 0) > 0:
+            gasto = cliente._insertar_documento(cliente._conexion, 'gastos_caja', {
+                "cierre_id": p_cierre_id, "categoria_id": p_categoria_gasto_id, "monto": p_costo_repartidor,
+                "notas": p_nota_gasto, "usuario_id": p_usuario_id, "sucursal_id": p_sucursal_id, "sucursal": p_sucursal_nombre
+            })
+        delivery = cliente._insertar_documento(cliente._conexion, 'cierre_delivery', {
+            "cierre_id": p_cierre_id, "usuario_id": p_usuario_id, "sucursal_id": p_sucursal_id,
+            "monto_cobrado": p_monto_cobrado, "costo_repartidor": p_costo_repartidor, "origen_nombre": p_origen_nombre,
+            "notas": p_notas, "gasto_asociado_id": gasto['id'] if gasto else None
+        })
+    return {"delivery": delivery, "gasto": gasto}
+
+
+@funcion_rpc('eliminar_delivery_con_gasto')
+def _rpc_eliminar_delivery_con_gasto(cliente, p_delivery_id, p_gasto_asociado_id=None):
+    def borrar(tabla, id_documento):
+        if id_documento is None:
+            return None
+        fila = cliente._conexion.execute(f'SELECT data FROM "{tabla}" WHERE id = ?', [str(id_documento)]).fetchone()
+        if fila is None:
+            return None
+        cliente._conexion.execute(f'DELETE FROM "{tabla}" WHERE id = ?', [str(id_documento)])
+        return json.loads(fila[0])
+
+    with cliente._bloqueo, cliente._conexion:
+        delivery = borrar('cierre_delivery', p_delivery_id)
+        gasto = borrar('gastos_caja', (delivery or {}).get('gasto_asociado_id') or p_gasto_asociado_id)
+    return {"delivery": delivery, "gasto": gasto}
+
+
+@funcion_rpc('eliminar_deliveries_con_gasto')
+def _rpc_eliminar_deliveries_con_gasto(cliente, p_delivery_ids):
+    resultado = []
+    with cliente._bloqueo, cliente._conexion:
+        for delivery_id in p_delivery_ids or []:
+            fila = {"delivery_id": delivery_id, "cierre_id": None, "gasto_id": None, "eliminado": False, "motivo": None}
+            # Un savepoint por delivery, como el subbloque con exception de la función SQL
+            cliente._conexion.execute('SAVEPOINT borrado_delivery')
+            try:
+                existente = cliente._conexion.execute('SELECT data FROM "cierre_delivery" WHERE id = ?', [str(delivery_id)]).fetchone()
+                if existente:
+                    delivery = json.loads(existente[0])
+                    cliente._conexion.execute('DELETE FROM "cierre_delivery" WHERE id = ?', [str(delivery_id)])
+                    if delivery.get('gasto_asociado_id'):
+                        cliente._conexion.execute('DELETE FROM "gastos_caja" WHERE id = ?', [str(delivery['gasto_asociado_id'])])
+                    fila.update(cierre_id=delivery.get('cierre_id'), gasto_id=delivery.get('gasto_asociado_id'), eliminado=True)
+                cliente._conexion.execute('RELEASE SAVEPOINT borrado_delivery')
+            except sqlite3.Error as e:
+                cliente._conexion.execute('ROLLBACK TO SAVEPOINT borrado_delivery')
+                cliente._conexion.execute('RELEASE SAVEPOINT borrado_delivery')
+                fila["motivo"] = str(e)
+            resultado.append(fila)
+    return resultado
+
+
+@funcion_rpc('eliminar_filas_por_ids')
+def _rpc_eliminar_filas_por_ids(cliente, p_tabla, p_ids):
+    if p_tabla not in ('gastos_caja', 'cierre_compras'):
+        raise ErrorLocal('P0001', f'eliminar_filas_por_ids: tabla no permitida: {p_tabla}')
+    resultado = []
+    with cliente._bloqueo, cliente._conexion:
+        for id_fila in p_ids or []:
+            fila = {"id": id_fila, "cierre_id": None, "eliminado": False, "motivo": None}
+            # Un savepoint por fila, como el subbloque con exception de la función SQL
+            cliente._conexion.execute('SAVEPOINT borrado_fila')
+            try:
+                existente = cliente._conexion.execute(f'SELECT data FROM "{p_tabla}" WHERE id = ?', [str(id_fila)]).fetchone()
+                if existente:
+                    _verificar_referencias(cliente._conexion, p_tabla, [id_fila])
+                    cliente._conexion.execute(f'DELETE FROM "{p_tabla}" WHERE id = ?', [str(id_fila)])
+                    fila.update(cierre_id=json.loads(existente[0]).get('cierre_id'), eliminado=True)
+                cliente._conexion.execute('RELEASE SAVEPOINT borrado_fila')
+            except (sqlite3.Error, ErrorLocal) as e:
+                cliente._conexion.execute('ROLLBACK TO SAVEPOINT borrado_fila')
+                cliente._conexion.execute('RELEASE SAVEPOINT borrado_fila')
+                fila["motivo"] = e.message if isinstance(e, ErrorLocal) else str(e)
+            resultado.append(fila)
+    return resultado
+
+
+def _escribir_totales_cierre(cliente, cierre_id):
+    """Como escribir_totales_diarios_cierre; se llama con el bloqueo y la transacción abiertos."""
+    conexion = cliente._conexion
+    conexion.execute(f'DELETE FROM "totales_diarios" WHERE {_columna("cierre_id")} = ?', [cierre_id])
+    fila = conexion.execute('SELECT data FROM "cierres_caja" WHERE id = ?', [str(cierre_id)]).fetchone()
+    cierre = json.loads(fila[0]) if fila else {}
+    if cierre.get('estado') != 'CERRADO':
+        return
+    resumen = cierre.get('resumen_del_dia') or {}
+    items = [('Rayo (POS)', r.get('metodo'), r.get('tipo'), r.get('total')) for r in resumen.get('desglose_rayo', [])]
+    items += [(so.get('socio'), d.get('metodo'), 'externo', d.get('total'))
+              for so in resumen.get('totales_por_socio', []) for d in so.get('desglose', [])]
+    totales = {}
+    for fuente, metodo, tipo, total in items:
+        if fuente is not None and metodo is not None:
+            totales[(fuente, metodo, tipo)] = totales.get((fuente, metodo, tipo), Decimal('0')) + Decimal(str(total or 0))
+    actualizado_en = _ahora()
+    for (fuente, metodo, tipo), total in totales.items():
+        cliente._insertar_documento(conexion, 'totales_diarios', {
+            "fecha": cierre['fecha_operacion'], "sucursal_id": cierre['sucursal_id'], "usuario_id": cierre.get('usuario_id'),
+            "fuente": fuente, "metodo_pago": metodo, "tipo": tipo, "total": float(total), "total_reportado": None,
+            "cierre_id": cierre_id, "cierre_cde_id": None, "actualizado_en": actualizado_en
+        })
+
+
+def _escribir_totales_cierre_cde(cliente, cierre_cde_id):
+    """Como escribir_totales_diarios_cierre_cde; se llama con el bloqueo y la transacción abiertos."""
+    conexion = cliente._conexion
+    conexion.execute(f'DELETE FROM "totales_diarios" WHERE {_columna("cierre_cde_id")} = ?', [cierre_cde_id])
+    fila = conexion.execute('SELECT data FROM "cierres_cde" WHERE id = ?', [str(cierre_cde_id)]).fetchone()
+    cierre = json.loads(fila[0]) if fila else {}
+    if cierre.get('estado') != 'CERRADO':
+        return
+    filas = [("Efectivo", "efectivo", cierre.get('total_efectivo_sistema') or 0, cierre.get('total_efectivo_contado'))]
+    filas += [(metodo, (datos or {}).get('tipo'), (datos or {}).get('total_sistema') or 0, (datos or {}).get('total_manual'))
+              for metodo, datos in (cierre.get('verificacion_metodos') or {}).items() if metodo != "Efectivo"]
+    actualizado_en = _ahora()
+    for metodo, tipo, total, total_reportado in filas:
+        cliente._insertar_documento(conexion, 'totales_diarios', {
+            "fecha": cierre['fecha_operacion'], "sucursal_id": cierre['sucursal_id'], "usuario_id": cierre.get('usuario_id'),
+            "fuente": "CDE", "metodo_pago": metodo, "tipo": tipo, "total": total, "total_reportado": total_reportado,
+            "cierre_id": None, "cierre_cde_id": cierre_cde_id, "actualizado_en": actualizado_en
+        })
+
+
+@funcion_rpc('escribir_totales_diarios_cierre')
+def _rpc_escribir_totales_diarios_cierre(cliente, p_cierre_id):
+    with cliente._bloqueo, cliente._conexion:
+        _escribir_totales_cierre(cliente, p_cierre_id)
+
+
+@funcion_rpc('escribir_totales_diarios_cierre_cde')
+def _rpc_escribir_totales_diarios_cierre_cde(cliente, p_cierre_cde_id):
+    with cliente._bloqueo, cliente._conexion:
+        _escribir_totales_cierre_cde(cliente, p_cierre_cde_id)
+
+
+def _actualizar_documento(cliente, tabla, id_documento, cambios):
+    """Aplica 'cambios' a un documento y lo devuelve (None si no existe)."""
+    fila = cliente._conexion.execute(f'SELECT data FROM "{tabla}" WHERE id = ?', [str(id_documento)]).fetchone()
+    if fila is None:
+        return None
+    documento = json.loads(fila[0])
+    documento.update({k: normalizar_timestamp(v) if k in COLUMNAS_TIMESTAMP else v for k, v in cambios.items()})
+    cliente._guardar_documento(cliente._conexion, tabla, documento)
+    return documento
+
+
+@funcion_rpc('cambiar_estado_cierre')
+def _rpc_cambiar_estado_cierre(cliente, p_cierre_id, p_estado, p_fecha_hora_cierre_real=None, p_nota_discrepancia=None):
+    cambios = {"estado": p_estado}
+    if p_estado == 'CERRADO':
+        cambios.update(fecha_hora_cierre_real=p_fecha_hora_cierre_real, nota_discrepancia=p_nota_discrepancia)
+    # Una sola transacción de SQLite: el estado y los totales se escriben juntos o ninguno
+    with cliente._bloqueo, cliente._conexion:
+        cierre = _actualizar_documento(cliente, 'cierres_caja', p_cierre_id, cambios)
+        if cierre is not None:
+            _escribir_totales_cierre(cliente, p_cierre_id)
+    return [cierre] if cierre else []
+
+
+@funcion_rpc('finalizar_cierre_cde_con_totales')
+def _rpc_finalizar_cierre_cde_con_totales(cliente, p_cierre_cde_id, p_discrepancia=False):
+    with cliente._bloqueo, cliente._conexion:
+        cierre = _actualizar_documento(cliente, 'cierres_cde', p_cierre_cde_id, {"estado": "CERRADO", "discrepancia": p_discrepancia})
+        if cierre is not None:
+            _escribir_totales_cierre_cde(cliente, p_cierre_cde_id)
+    return [cierre] if cierre else []
+
+
+def crear_cliente_local(ruta=None, latencia_ms=None, semilla=None):
+    """Crea el cliente local leyendo la configuración de las variables de entorno."""
+    cliente = ClienteLocal(
+        ruta=ruta or os.environ.get("LOCAL_DB_PATH", ":memory:"),
+        latencia_ms=latencia_ms if latencia_ms is not None else os.environ.get("LOCAL_DB_LATENCIA_MS", 0),
+        carpeta_storage=os.environ.get("LOCAL_STORAGE_DIR"),
+    )
+    ruta_semilla = semilla or os.environ.get("LOCAL_DB_SEED")
+    if ruta_semilla:
+        vacia = cliente._conexion.execute('SELECT COUNT(*) FROM "sucursales"').fetchone()[0] == 0
+        if vacia:
+            with open(ruta_semilla, encoding='utf-8') as f:
+                cliente.cargar_datos(json.load(f))
+    return cliente
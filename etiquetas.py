@@ -0,0 +1,111 @@
+# etiquetas.py
+# Invalidación de cachés por etiquetas, compartida por todas las sesiones del servidor.
+#
+# Cada dato cacheado declara de qué depende con etiquetas: "cierre:<id>", "sucursal:<id>"
+# o "tabla:<nombre>". Cada etiqueta tiene un contador de versión; las funciones de
+# escritura de database.py invalidan solo las etiquetas que tocan y las entradas que
+# dependen de ellas dejan de coincidir. Reemplaza a st.cache_data.clear(), que vaciaba
+# todas las cachés de todos los usuarios del proceso (incluidos catálogos y otras sucursales).
+#
+# El contador de cada etiqueta es también el número de invalidaciones: ver estadisticas().
+#
+# Las entradas de cache_data viven en una CacheCompartida (cache_compartida.py): como los
+# catálogos, tienen single-flight y stale-while-revalidate (ETIQUETAS_TTL_OBSOLETO_S).
+
+import functools
+import os
+import threading
+
+from cache_compartida import CacheCompartida
+
+TTL_OBSOLETO = int(os.environ.get("ETIQUETAS_TTL_OBSOLETO_S", 600))
+MAX_ENTRADAS = int(os.environ.get("ETIQUETAS_MAX_ENTRADAS", 256))   # por función
+
+_LOCK = threading.Lock()
+_VERSIONES = {}   # etiqueta -> versión (= número de invalidaciones)
+_CACHES = {}      # (archivo, nombre) de la función -> CacheCompartida
+
+
+def cierre(cierre_id):
+    return f"cierre:{cierre_id}" if cierre_id else None
+
+
+def sucursal(sucursal_id):
+    return f"sucursal:{sucursal_id}" if sucursal_id else None
+
+
+def tabla(nombre):
+    return f"tabla:{nombre}"
+
+
+def version(etiqueta):
+    return _VERSIONES.get(etiqueta, 0)
+
+
+def versiones(etiquetas):
+    """Versiones actuales de un conjunto de etiquetas (tupla ordenada, usable como clave de caché)."""
+    with _LOCK:
+        return tuple(sorted((e, _VERSIONES.get(e, 0)) for e in set(etiquetas) if e))
+
+
+def invalidar(*etiquetas):
+    """Incrementa la versión de las etiquetas (se ignoran las None)."""
+    with _LOCK:
+        for etiqueta in etiquetas:
+            if etiqueta:
+                _VERSIONES[etiqueta] = _VERSIONES.get(etiqueta, 0) + 1
+
+
+def estadisticas():
+    """Invalidaciones por etiqueta desde que arrancó el proceso, de mayor a menor."""
+    with _LOCK:
+        return dict(sorted(_VERSIONES.items(), key=lambda item: (-item[1], item[0])))
+
+
+def _congelar(valor):
+    """Argumentos como clave de caché: listas, conjuntos y dicts pasan a tuplas."""
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _congelar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_congelar(v) for v in valor)
+    if isinstance(valor, (set, frozenset)):
+        return tuple(sorted(map(_congelar, valor), key=repr))
+    return valor
+
+
+def _error_de(resultado):
+    """Las funciones de database.py devuelven tuplas cuyo último elemento es el error."""
+    return resultado[-1] if isinstance(resultado, tuple) and resultado else None
+
+
+def cache_data(etiquetas_de, ttl=None, ttl_obsoleto=TTL_OBSOLETO, max_entries=MAX_ENTRADAS):
+    """
+    Caché compartida de una función de lectura: cada entrada depende de sus etiquetas
+    (etiquetas_de(*args, **kwargs) devuelve las de la llamada) y se descarta cuando alguna se
+    invalida. Expira a los ttl segundos (None = nunca) y, expirada, se sigue sirviendo
+    ttl_obsoleto segundos mientras se recarga en segundo plano. Los resultados con error
+    (ver _error_de) no se guardan. .clear() vacía solo la caché de esa función.
+    """
+    def decorar(funcion):
+        # Las páginas se vuelven a ejecutar en cada rerun: la caché se identifica por archivo
+        # y nombre de la función (como st.cache_data) para sobrevivir entre reruns
+        with _LOCK:
+            cache = _CACHES.setdefault(
+                (funcion.__code__.co_filename, funcion.__qualname__),
+                CacheCompartida(funcion.__qualname__, ttl_obsoleto, max_entradas=max_entries)
+            )
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            def cargar():
+                resultado = funcion(*args, **kwargs)
+                return resultado, _error_de(resultado)
+            clave = (_congelar(args), _congelar(kwargs))
+            resultado, error = cache.obtener(clave, versiones(etiquetas_de(*args, **kwargs)), cargar, ttl, relanzar=True)
+            if resultado is None and error:
+                raise RuntimeError(error)   # la carga ajena que esperábamos se interrumpió
+            return resultado
+        envoltura.clear = cache.limpiar
+        envoltura.estadisticas = cache.estadisticas
+        return envoltura
+    return decorar
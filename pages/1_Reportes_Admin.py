@@ -5,7 +5,13 @@ import streamlit as st
 import sys
 import os
 import database
+import catalogos
+import etiquetas
+import analitica
+import trabajos
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from datetime import datetime
 from decimal import Decimal
 import json
@@ -40,21 +46,111 @@ if not st.session_state.get("autenticado") or st.session_state.get("perfil", {})
 st.set_page_config(page_title="Reportes de Cierre", layout="wide")
 st.title("Panel de Reportes Administrativos")
 
-# --- FUNCIONES DE CACHÉ PARA CARGAR DATOS DE FILTROS ---
-@st.cache_data(ttl=600) 
+# --- FUNCIONES PARA CARGAR DATOS DE FILTROS ---
+# (los catálogos ya vienen de la caché compartida de catalogos.py)
 def cargar_filtros_data_basicos():
-    sucursales, _ = database.obtener_sucursales()
-    usuarios, _ = database.admin_get_lista_usuarios()
-    metodos, _ = database.obtener_metodos_pago()
-    socios, _ = database.admin_get_todos_socios()
-    categorias, _ = database.admin_get_todas_categorias()
-    return sucursales, usuarios, metodos, socios, categorias
-
-@st.cache_data(ttl=600) 
+    # Las cinco lecturas se hacen en paralelo (ver database.cargar_catalogos)
+    catalogos_db, _ = database.cargar_catalogos(['sucursales', 'usuarios', 'metodos_pago', 'socios', 'categorias'])
+    return catalogos_db['sucursales'], catalogos_db['usuarios'], catalogos_db['metodos_pago'], catalogos_db['socios'], catalogos_db['categorias']
+
 def cargar_filtros_data_cde():
-    sucursales, _ = database.obtener_sucursales_cde()
-    usuarios, _ = database.admin_get_lista_usuarios()
-    return sucursales, usuarios
+    catalogos_db, _ = database.cargar_catalogos(['sucursales_cde', 'usuarios'])
+    return catalogos_db['sucursales_cde'], catalogos_db['usuarios']
+
+# --- CONSUMO DE BÚSQUEDAS PAGINADAS (database.admin_iterar_*) ---
+def consumir_paginas(paginas, texto, procesar_pagina=None):
+    """
+    Recorre un generador de páginas (filas, total, error) mostrando una barra de progreso.
+    Si se pasa procesar_pagina, cada página se transforma al llegar y se acumula el resultado.
+    Devuelve (filas_acumuladas, error).
+    """
+    barra = st.progress(0.0, text=texto)
+    resultado, recibidas = [], 0
+    for filas, total, err in paginas:
+        if err:
+            barra.empty()
+            return resultado, err
+        recibidas += len(filas)
+        resultado.extend(procesar_pagina(filas) if procesar_pagina else filas)
+        barra.progress(min(recibidas / total, 1.0) if total else 1.0, text=f"{texto} {recibidas} de {total}")
+    barra.empty()
+    return resultado, None
+
+# --- TRABAJOS EN SEGUNDO PLANO (ver trabajos.py) ---
+# Los reportes pesados se lanzan con trabajos.lanzar*; la página guarda el id del trabajo en
+# st.session_state y, mientras corre, solo sondea su progreso (no repite la consulta al rerun).
+@st.fragment(run_every=1.0)
+def sondear_trabajo(trabajo_id):
+    """Muestra el progreso de un trabajo y recarga la página cuando termina."""
+    trabajo = trabajos.obtener(trabajo_id)
+    if trabajo is None or trabajo.terminado:
+        st.rerun()
+    detalle = f" {trabajo.recibidos} de {trabajo.total}" if trabajo.total else ""
+    st.progress(trabajo.progreso, text=f"{trabajo.texto}{detalle}")
+
+def trabajo_terminado(clave_estado):
+    """
+    Trabajo guardado en st.session_state[clave_estado]: si sigue corriendo muestra su
+    progreso y devuelve None; si terminó, lo devuelve (con .resultado o .error).
+    """
+    trabajo = trabajos.obtener(st.session_state.get(clave_estado))
+    if trabajo is None:
+        return None
+    if not trabajo.terminado:
+        sondear_trabajo(trabajo.id)
+        return None
+    return trabajo
+
+# --- CORTES DE LOS REPORTES (ver analitica.py) ---
+# Cada corte es una agrupación declarativa: columnas 'por', medidas y orden.
+CORTES_INGRESOS = {
+    "fuente": {"por": ["Fuente"], "medidas": {"Total": ("Total", "sum")}, "orden": [("Total", "descending")]},
+    "metodo": {"por": ["Metodo"], "medidas": {"Total": ("Total", "sum")}, "orden": [("Total", "descending")]},
+    "dia": {"por": ["Fecha"], "medidas": {"Total": ("Total", "sum")}, "orden": [("Fecha", "ascending")]},
+}
+CORTES_GASTOS = {
+    "categoria": {"por": ["Categoría"], "medidas": {"Monto": ("Monto", "sum")}, "orden": [("Monto", "descending")]},
+}
+CORTES_DELIVERY = {
+    "origen": {"por": ["Origen"], "medidas": {"Ganancia Neta": ("Ganancia Neta", "sum")}, "orden": [("Ganancia Neta", "descending")]},
+}
+
+def serie_corte(datos, corte, filtros=None):
+    """Ejecuta un corte de un solo nivel y lo devuelve como Serie (índice = columna agrupada)."""
+    resultado = analitica.agrupar(datos, corte["por"], corte["medidas"], filtros=filtros, orden=corte.get("orden"))
+    return resultado.set_index(corte["por"][0])[next(iter(corte["medidas"]))]
+
+def fechas_reporte(datos, columna="created_at"):
+    """Columna de timestamps ISO de una tabla de la caché de reportes, como texto 'YYYY-MM-DD HH:MM'."""
+    return pa.array(pd.to_datetime(datos.column(columna).to_pandas(), utc=True, format="ISO8601").dt.strftime('%Y-%m-%d %H:%M'))
+
+# --- DIAGNÓSTICO DE CACHÉS Y CONEXIONES (contadores del proceso del servidor) ---
+def mostrar_diagnostico():
+    with st.expander("🔧 Diagnóstico de cachés y conexiones"):
+        st.caption("Contadores desde que arrancó el servidor; los comparten todas las sesiones.")
+        st.markdown("**Pool de clientes de Supabase**")
+        pool = database.metricas_pool_clientes()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Clientes en uso", f"{pool['tamano']} / {pool['max_clientes']}")
+        col2.metric("Creados / Reutilizados", f"{pool['creados']} / {pool['reutilizados']}")
+        col3.metric("Descartados", pool['descartados'])
+        col4.metric("Espera prom. / máx.", f"{pool['espera_promedio_ms']:.1f} / {pool['espera_max_ms']:.1f} ms")
+
+        st.markdown("**Caché de catálogos**")
+        contadores = catalogos.estadisticas()
+        columnas = st.columns(len(contadores))
+        for columna, (nombre, valor) in zip(columnas, contadores.items()):
+            columna.metric(nombre.capitalize(), valor)
+
+        st.markdown("**Invalidaciones por etiqueta**")
+        invalidaciones = etiquetas.estadisticas()
+        if not invalidaciones:
+            st.info("Todavía no hubo invalidaciones.")
+        else:
+            df_invalidaciones = pd.DataFrame(list(invalidaciones.items()), columns=["Etiqueta", "Invalidaciones"])
+            st.dataframe(df_invalidaciones, hide_index=True, width='stretch')
+
+mostrar_diagnostico()
 
 # --- PESTAÑAS PRINCIPALES ---
 tab_op, tab_cde, tab_analisis, tab_gastos, tab_delivery = st.tabs([
@@ -83,12 +179,15 @@ with tab_op:
         st.dataframe(df, hide_index=True, width='stretch') # CORREGIDO
         st.metric(label=f"TOTAL CONTADO ({titulo})", value=f"${float(data_dict.get('total', 0)):,.2f}")
 
-    def op_mostrar_reporte_ingresos_adic(cierre_id):
+    # Las colecciones de cada cierre llegan precargadas en bloque (cargar_detalles_cierres);
+    # la entrada se descarta cuando se escribe en alguno de esos cierres
+    @etiquetas.cache_data(lambda cierre_ids: [etiquetas.cierre(i) for i in cierre_ids], ttl=300)
+    def cargar_detalles_cierres(cierre_ids):
+        return database.obtener_detalles_de_cierres(list(cierre_ids))
+
+    def op_mostrar_reporte_ingresos_adic(ingresos_lista):
         st.subheader("Reporte de Ingresos Adicionales")
-        ingresos_lista, err = database.obtener_ingresos_adicionales_del_cierre(cierre_id)
-        if err:
-            st.error(f"Error: {err}")
-        elif not ingresos_lista:
+        if not ingresos_lista:
             st.info("No se registraron ingresos adicionales.")
         else:
             df_data = [{
@@ -101,12 +200,9 @@ with tab_op:
             st.metric("TOTAL INGRESOS ADICIONALES", f"${df['Monto'].sum():,.2f}")
             st.dataframe(df.style.format({"Monto": "${:,.2f}"}), hide_index=True, width='stretch') # CORREGIDO
 
-    def op_mostrar_reporte_delivery(cierre_id):
+    def op_mostrar_reporte_delivery(deliveries_lista):
         st.subheader("Reporte de Deliveries")
-        deliveries_lista, err = database.obtener_deliveries_del_cierre(cierre_id)
-        if err:
-            st.error(f"Error: {err}")
-        elif not deliveries_lista:
+        if not deliveries_lista:
             st.info("No se registraron deliveries.")
         else:
             df_data = []
@@ -133,7 +229,7 @@ with tab_op:
                 "Ganancia Neta": "${:,.2f}"
              }), hide_index=True, width='stretch') # CORREGIDO     
 
-    def op_mostrar_tab_resumen(cierre_dict):
+    def op_mostrar_tab_resumen(cierre_dict, gastos_lista):
        st.subheader("Resumen del Cierre")
     
        nota_discrepancia = cierre_dict.get('nota_discrepancia')
@@ -157,7 +253,6 @@ with tab_op:
        saldo_siguiente = float(cierre_dict.get('saldo_para_siguiente_dia') or 0)
        total_rayo = float(resumen_guardado.get('total_rayo_externo', 0))
     
-       gastos_lista, _ = database.obtener_gastos_del_cierre(cierre_dict['id'])
        total_gastos = sum(float(g.get('monto', 0)) for g in gastos_lista) if gastos_lista else 0
     
        total_del_dia = total_rayo - total_gastos
@@ -259,13 +354,10 @@ with tab_op:
             with st.expander("Ver desglose informativo detallado"):
                 st.json(reporte_info)
 
-    def op_mostrar_reporte_compras(cierre_id):
+    def op_mostrar_reporte_compras(compras_lista):
        """Muestra la tabla de compras informativas registradas en el cierre."""
        st.subheader("Reporte de Compras (Informativo)")
-       compras_lista, err = database.obtener_compras_del_cierre(cierre_id)
-       if err:
-        st.error(f"Error cargando compras: {err}")
-       elif not compras_lista:
+       if not compras_lista:
         st.info("No se registraron compras en este cierre.")
        else:
           df_data = []
@@ -291,11 +383,9 @@ with tab_op:
               "Ahorro/Ganancia": "${:,.2f}"
            }), hide_index=True, width='stretch')
 
-    def op_mostrar_reporte_gastos(cierre_id):
+    def op_mostrar_reporte_gastos(gastos_lista):
         st.subheader("Reporte de Gastos")
-        gastos_lista, err_g = database.obtener_gastos_del_cierre(cierre_id)
-        if err_g: st.error(f"Error: {err_g}")
-        elif not gastos_lista: st.info("No se registraron gastos.")
+        if not gastos_lista: st.info("No se registraron gastos.")
         else:
             df_data = [{"Categoría": g.get('gastos_categorias', {}).get('nombre', 'N/A'), "Monto": g.get('monto', 0), "Notas": g.get('notas', '')} for g in gastos_lista]
             df = pd.DataFrame(df_data)
@@ -328,12 +418,14 @@ with tab_op:
         sucursal_id_filtrar_op = opciones_sucursal_op[sel_sucursal_nombre_op]
         usuario_id_filtrar_op = opciones_usuario_op[sel_usuario_nombre_op]
         
-        with st.spinner("Buscando..."):
-            cierres_op, error_op = database.admin_buscar_cierres_filtrados(
+        cierres_op, error_op = consumir_paginas(
+            database.admin_iterar_cierres_filtrados(
                 fecha_inicio=str_ini_op, fecha_fin=str_fin_op,
                 sucursal_id=sucursal_id_filtrar_op, usuario_id=usuario_id_filtrar_op,
                 solo_discrepancia=solo_disc_op
-            )
+            ),
+            "Buscando cierres..."
+        )
         
         if error_op:
             st.error(f"Error de DB: {error_op}")
@@ -348,12 +440,18 @@ with tab_op:
             st.warning("No se encontraron cierres operativos con esos filtros.")
         else:
             # Ahora este bucle se dibujará incluso después de presionar "Supervisar"
+            # Los expanders son "lazy": su contenido solo se ejecuta si están abiertos. Al abrir el
+            # primero se precargan en bloque las colecciones de TODOS los cierres del resultado.
+            ids_resultados = tuple(c['id'] for c in st.session_state.cierres_operativos_resultados)
             for cierre in st.session_state.cierres_operativos_resultados:
                 user_nombre = cierre.get('perfiles', {}).get('nombre', 'N/A')
                 suc_nombre = cierre.get('sucursales', {}).get('sucursal', 'N/A')
                 titulo_expander = f"📅 {cierre['fecha_operacion']} | 👤 {user_nombre} | 🏠 {suc_nombre} | ({cierre['estado']})"
                 
-                with st.expander(titulo_expander):
+                expander_cierre = st.expander(titulo_expander, key=f"op_exp_{cierre['id']}", on_change="rerun")
+                if not expander_cierre.open:
+                    continue
+                with expander_cierre:
                     st.markdown("**Acciones de Administrador:**")
                     if st.button("📝 Supervisar / Editar este Cierre", key=f"edit_{cierre['id']}"):
                         cierre_a_cargar = cierre
@@ -373,6 +471,12 @@ with tab_op:
 
                     st.divider()
 
+                    detalles_por_cierre, err_det = cargar_detalles_cierres(ids_resultados)
+                    if err_det:
+                        st.error(f"Error: {err_det}")
+                        continue
+                    detalle_cierre = detalles_por_cierre.get(cierre['id'], {})
+
                     # Las pestañas de visualización del reporte se mantienen igual
                     # 1. Añadimos la nueva pestaña "Compras"
                     t_res, t_ini, t_fin, t_verif, t_gastos, t_ing_adic, t_del, t_comp = st.tabs([
@@ -380,7 +484,7 @@ with tab_op:
                         "Ingresos Adic.", "Delivery", "Compras"
                     ])
 
-                    with t_res: op_mostrar_tab_resumen(cierre)
+                    with t_res: op_mostrar_tab_resumen(cierre, detalle_cierre.get('gastos', []))
                     with t_ini: op_mostrar_reporte_denominaciones("Detalle Caja Inicial", cierre.get('saldo_inicial_detalle'))
                     
                     # 2. Modificamos la pestaña "Caja Final" para añadir la nueva información
@@ -415,12 +519,12 @@ with tab_op:
                             st.metric("Total Saldo Día Siguiente", f"${float(total_saldo_siguiente):,.2f}")
 
                     with t_verif: op_mostrar_reporte_verificacion(cierre.get('verificacion_pagos_detalle'))
-                    with t_gastos: op_mostrar_reporte_gastos(cierre['id'])
-                    with t_ing_adic: op_mostrar_reporte_ingresos_adic(cierre['id'])
-                    with t_del: op_mostrar_reporte_delivery(cierre['id'])
+                    with t_gastos: op_mostrar_reporte_gastos(detalle_cierre.get('gastos', []))
+                    with t_ing_adic: op_mostrar_reporte_ingresos_adic(detalle_cierre.get('ingresos_adicionales', []))
+                    with t_del: op_mostrar_reporte_delivery(detalle_cierre.get('deliveries', []))
                     
                     # 3. Llamamos a la nueva función en la nueva pestaña
-                    with t_comp: op_mostrar_reporte_compras(cierre['id'])
+                    with t_comp: op_mostrar_reporte_compras(detalle_cierre.get('compras', []))
 
 # ==========================================================
 # PESTAÑA 2: REPORTE CDE (NUEVO MÓDULO)
@@ -549,23 +653,21 @@ with tab_cde:
 # ==========================================================
 with tab_analisis:
     st.header("Análisis de Ingresos Detallado")
-    @st.cache_data(ttl=300)
-    def cargar_y_procesar_datos_ingresos(lista_sucursal_ids=None, fecha_inicio=None, fecha_fin=None, usuario_id=None):
-        cierres, err = database.admin_buscar_resumenes_para_analisis(lista_sucursal_ids=lista_sucursal_ids, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, usuario_id=usuario_id)
-        if err: st.error(f"No se pudieron cargar los datos de ingresos: {err}"); return pd.DataFrame()
-        if not cierres: return pd.DataFrame()
-        flat_data = []
-        for cierre in cierres:
-            resumen = cierre.get('resumen_del_dia', {})
-            info_base = {"Fecha": cierre['fecha_operacion'], "Sucursal": cierre.get('sucursales', {}).get('sucursal', 'N/A'), "Usuario": cierre.get('perfiles', {}).get('nombre', 'N/A')}
-            for item in resumen.get('desglose_rayo', []): flat_data.append({**info_base, "Fuente": "Rayo (POS)", "Metodo": item['metodo'], "Tipo": item['tipo'], "Total": item['total']})
-            for socio in resumen.get('totales_por_socio', []):
-                for desglose in socio.get('desglose', []): flat_data.append({**info_base, "Fuente": socio['socio'], "Metodo": desglose['metodo'], "Tipo": "externo", "Total": desglose['total']})
-        df = pd.DataFrame(flat_data)
-        if not df.empty:
-            df['Fecha'] = pd.to_datetime(df['Fecha']).dt.date
-            df['Total'] = pd.to_numeric(df['Total'])
-        return df
+    def construir_cubo_ingresos(trabajo):
+        # Solo la primera construcción (o al vencer su TTL) va a la red; ver database.cargar_cubo_ingresos
+        return database.cargar_cubo_ingresos(al_progresar=trabajo.informar)
+
+    def cargar_y_procesar_datos_ingresos(cubo, filtros, nombres_sucursal=None, nombres_usuario=None):
+        # Los totales se cortan del cubo de ingresos en memoria: cada filtro es un corte local
+        celdas = cubo.cortar(**filtros).to_pandas()
+        if celdas.empty: return pd.DataFrame()
+        df = pd.DataFrame({
+            "Fecha": pd.to_datetime(celdas['fecha']).dt.date,
+            "Sucursal": celdas['sucursal_id'].map(nombres_sucursal or {}).fillna('N/A'),
+            "Usuario": celdas['usuario_id'].map(nombres_usuario or {}).fillna('N/A'),
+            "Fuente": celdas['fuente'], "Metodo": celdas['metodo'], "Tipo": celdas['tipo'], "Total": celdas['total']
+        })
+        return df.sort_values(["Fecha", "Sucursal", "Fuente", "Metodo"], ascending=[False, True, True, True], ignore_index=True)
 
     sucursales_db, usuarios_db, metodos_db, socios_db, _ = cargar_filtros_data_basicos()
     op_suc = {s['sucursal']: s['id'] for s in sucursales_db}
@@ -586,41 +688,53 @@ with tab_analisis:
         sel_metodo = st.selectbox("Método de Pago", options=["TODOS"] + [m['nombre'] for m in metodos_db], key="analisis_metodo_final")
 
     if st.button("Generar Reporte de Ingresos", type="primary"):
-        str_ini = fecha_ini.strftime('%Y-%m-%d') if fecha_ini else None
-        str_fin = fecha_fin.strftime('%Y-%m-%d') if fecha_fin else None
-        sucursal_ids_filtrar = [op_suc[nombre] for nombre in sel_sucursales_nombres] if sel_sucursales_nombres else None
-        usuario_id_filtrar = op_user[sel_usuario_nombre]
-        df_ingresos = cargar_y_procesar_datos_ingresos(lista_sucursal_ids=sucursal_ids_filtrar, fecha_inicio=str_ini, fecha_fin=str_fin, usuario_id=usuario_id_filtrar)
-        if df_ingresos.empty:
-            st.warning("No se encontraron ingresos con los filtros primarios seleccionados.")
+        st.session_state.filtros_ingresos = {
+            "fecha_inicio": fecha_ini.strftime('%Y-%m-%d') if fecha_ini else None,
+            "fecha_fin": fecha_fin.strftime('%Y-%m-%d') if fecha_fin else None,
+            "sucursal_ids": [op_suc[nombre] for nombre in sel_sucursales_nombres] if sel_sucursales_nombres else None,
+            "usuario_id": op_user[sel_usuario_nombre],
+            "fuente": None if sel_fuente == "TODAS" else sel_fuente,
+            "metodo": None if sel_metodo == "TODOS" else sel_metodo,
+        }
+        st.session_state.trabajo_cubo_ingresos = trabajos.lanzar(
+            "cubo_ingresos", {}, construir_cubo_ingresos, texto="Construyendo cubo de ingresos...",
+            depende_de=[etiquetas.tabla('cierres_caja'), etiquetas.tabla('cierres_cde'), etiquetas.tabla('totales_diarios')]
+        ).id
+
+    trabajo_cubo = trabajo_terminado("trabajo_cubo_ingresos")
+    if trabajo_cubo and trabajo_cubo.error:
+        st.error(f"No se pudieron cargar los datos de ingresos: {trabajo_cubo.error}")
+    elif trabajo_cubo and st.session_state.get("filtros_ingresos"):
+        df_filtrado = cargar_y_procesar_datos_ingresos(
+            trabajo_cubo.resultado, st.session_state.filtros_ingresos,
+            nombres_sucursal={s['id']: s['sucursal'] for s in sucursales_db}, nombres_usuario={u['id']: u['nombre'] for u in usuarios_db}
+        )
+        st.divider()
+        st.subheader("Resultados del Análisis")
+        if df_filtrado.empty:
+            st.warning("La combinación de filtros no arrojó resultados.")
         else:
-            df_filtrado = df_ingresos.copy()
-            if sel_fuente != "TODAS": df_filtrado = df_filtrado[df_filtrado['Fuente'] == sel_fuente]
-            if sel_metodo != "TODOS": df_filtrado = df_filtrado[df_filtrado['Metodo'] == sel_metodo]
-            st.divider()
-            st.subheader("Resultados del Análisis")
-            if df_filtrado.empty:
-                st.warning("La combinación de filtros no arrojó resultados.")
-            else:
-                ingreso_total = df_filtrado['Total'].sum()
-                total_interno = df_filtrado[df_filtrado['Tipo'] == 'interno']['Total'].sum()
-                total_real = ingreso_total - total_interno
-                col_m1, col_m2, col_m3 = st.columns(3)
-                col_m1.metric("Ingreso Total (Bruto)", f"${ingreso_total:,.2f}")
-                col_m2.metric("Total Interno (Informativo)", f"${total_interno:,.2f}")
-                col_m3.metric("Total Real (Externo)", f"${total_real:,.2f}")
-                col_t1, col_t2 = st.columns(2)
-                with col_t1:
-                    st.markdown("**Totales por Fuente de Ingreso**")
-                    st.dataframe(df_filtrado.groupby('Fuente')['Total'].sum().sort_values(ascending=False).map('${:,.2f}'.format))
-                with col_t2:
-                    st.markdown("**Totales por Método de Pago**")
-                    st.dataframe(df_filtrado.groupby('Metodo')['Total'].sum().sort_values(ascending=False).map('${:,.2f}'.format))
-                st.subheader("Ingresos por Día")
-                ingresos_por_dia = df_filtrado.groupby('Fecha')['Total'].sum()
-                st.bar_chart(ingresos_por_dia)
-                with st.expander("Ver detalle completo de ingresos"):
-                    st.dataframe(df_filtrado.style.format({"Total": "${:,.2f}"}), hide_index=True, use_container_width=True)
+            datos_ingresos = analitica.tabla(df_filtrado)
+            ingreso_total = analitica.totales(datos_ingresos, {"Total": ("Total", "sum")})["Total"]
+            total_interno = analitica.totales(datos_ingresos, {"Total": ("Total", "sum")}, filtros=[("Tipo", "==", "interno")])["Total"]
+            total_real = ingreso_total - total_interno
+            col_m1, col_m2, col_m3 = st.columns(3)
+            col_m1.metric("Ingreso Total (Bruto)", f"${ingreso_total:,.2f}")
+            col_m2.metric("Total Interno (Informativo)", f"${total_interno:,.2f}")
+            col_m3.metric("Total Real (Externo)", f"${total_real:,.2f}")
+            col_t1, col_t2 = st.columns(2)
+            with col_t1:
+                st.markdown("**Totales por Fuente de Ingreso**")
+                st.dataframe(serie_corte(datos_ingresos, CORTES_INGRESOS["fuente"]).map('${:,.2f}'.format))
+            with col_t2:
+                st.markdown("**Totales por Método de Pago**")
+                st.dataframe(serie_corte(datos_ingresos, CORTES_INGRESOS["metodo"]).map('${:,.2f}'.format))
+            st.subheader("Ingresos por Día")
+            st.bar_chart(serie_corte(datos_ingresos, CORTES_INGRESOS["dia"]))
+            with st.expander("Ver matriz Fuente × Método"):
+                st.dataframe(analitica.pivotar(datos_ingresos, indice="Fuente", columnas="Metodo", valor="Total").style.format("${:,.2f}"), width='stretch')
+            with st.expander("Ver detalle completo de ingresos"):
+                st.dataframe(df_filtrado.style.format({"Total": "${:,.2f}"}), hide_index=True, width='stretch')
 
 # ==========================================================
 # PESTAÑA 4: REPORTE DE GASTOS
@@ -640,37 +754,40 @@ with tab_gastos:
         fecha_fin_g = st.date_input("Fecha Hasta", value=None, key="gastos_ff")
         sel_usuario_g = st.selectbox("Usuario", options=op_user_g.keys(), key="gastos_u")
     sel_categoria_g = st.selectbox("Categoría de Gasto", options=op_cat_g.keys(), key="gastos_c")
+    def tabla_gastos(datos):
+        # Tablas Arrow de database.admin_iterar_gastos_reporte (columnas aplanadas de la caché)
+        return pa.table({
+            "Fecha": fechas_reporte(datos),
+            "Usuario": analitica.columna(datos, "perfiles.nombre", "N/A", pa.string()),
+            "Sucursal": analitica.columna(datos, "sucursal", "N/A", pa.string()),
+            "Categoría": analitica.columna(datos, "gastos_categorias.nombre", "N/A", pa.string()),
+            "Monto": analitica.columna(datos, "monto", 0.0, pa.float64()),
+            "Notas": analitica.columna(datos, "notas", "", pa.string()),
+        })
     if st.button("Buscar Gastos", type="primary"):
-        str_ini_g = fecha_ini_g.strftime("%Y-%m-%d") if fecha_ini_g else None
-        str_fin_g = fecha_fin_g.strftime("%Y-%m-%d") if fecha_fin_g else None
-        sucursal_ids_g = [op_suc_g[nombre] for nombre in sel_sucursales_g] if sel_sucursales_g else None
-        usuario_id_g = op_user_g[sel_usuario_g]
-        categoria_id_g = op_cat_g[sel_categoria_g]
-        with st.spinner("Buscando gastos..."):
-            gastos, err = database.admin_buscar_gastos_filtrados(
-                lista_sucursal_ids=sucursal_ids_g, fecha_inicio=str_ini_g, fecha_fin=str_fin_g,
-                usuario_id=usuario_id_g, categoria_id=categoria_id_g
-            )
+        filtros_g = {
+            "lista_sucursal_ids": [op_suc_g[nombre] for nombre in sel_sucursales_g] if sel_sucursales_g else None,
+            "fecha_inicio": fecha_ini_g.strftime("%Y-%m-%d") if fecha_ini_g else None,
+            "fecha_fin": fecha_fin_g.strftime("%Y-%m-%d") if fecha_fin_g else None,
+            "usuario_id": op_user_g[sel_usuario_g],
+            "categoria_id": op_cat_g[sel_categoria_g],
+        }
+        st.session_state.trabajo_gastos = trabajos.lanzar_paginado(
+            "gastos", filtros_g, database.admin_iterar_gastos_reporte, procesar_pagina=tabla_gastos, texto="Buscando gastos...",
+            depende_de=[etiquetas.tabla('gastos_caja'), etiquetas.tabla('cierres_caja')]
+        ).id
+    trabajo_g = trabajo_terminado("trabajo_gastos")
+    if trabajo_g:
+        resultado_g, err = trabajo_g.resultado, trabajo_g.error
         if err: st.error(f"Error al buscar gastos: {err}")
-        elif not gastos: st.warning("No se encontraron gastos con los filtros seleccionados.")
+        elif not resultado_g: st.warning("No se encontraron gastos con los filtros seleccionados.")
         else:
             st.subheader("Resultados de la Búsqueda")
-            df_data = []
-            for g in gastos:
-                df_data.append({
-                    "Fecha": pd.to_datetime(g['created_at']).strftime('%Y-%m-%d %H:%M'),
-                    "Usuario": g.get('perfiles', {}).get('nombre', 'N/A') if g.get('perfiles') else 'N/A',
-                    "Sucursal": g.get('sucursal', 'N/A'),
-                    "Categoría": g.get('gastos_categorias', {}).get('nombre', 'N/A') if g.get('gastos_categorias') else 'N/A',
-                    "Monto": float(g.get('monto', 0)),
-                    "Notas": g.get('notas', '')
-                })
-            df = pd.DataFrame(df_data)
-            st.metric("Total Gastado (según filtros)", f"${df['Monto'].sum():,.2f}")
-            st.dataframe(df.style.format({"Monto": "${:,.2f}"}), use_container_width=True)
+            datos_gastos = analitica.tabla(resultado_g)
+            st.metric("Total Gastado (según filtros)", f"${analitica.totales(datos_gastos, {'Monto': ('Monto', 'sum')})['Monto']:,.2f}")
+            st.dataframe(datos_gastos.to_pandas().style.format({"Monto": "${:,.2f}"}), width='stretch')
             st.subheader("Total de Gastos por Categoría")
-            df_grouped = df.groupby("Categoría")["Monto"].sum().sort_values(ascending=False)
-            st.bar_chart(df_grouped)
+            st.bar_chart(serie_corte(datos_gastos, CORTES_GASTOS["categoria"]))
 
 # ==========================================================
 # PESTAÑA 5: REPORTE DE DELIVERY
@@ -691,41 +808,45 @@ with tab_delivery:
         fecha_fin_d = st.date_input("Fecha Hasta", value=None, key="delivery_ff")
         sel_usuario_d = st.selectbox("Usuario", options=op_user_d.keys(), key="delivery_u")
     sel_origen_d = st.selectbox("Origen del Pedido", options=op_origen_d.keys(), key="delivery_o")
+    def tabla_deliveries(datos):
+        # Tablas Arrow de database.admin_iterar_deliveries_reporte (columnas aplanadas de la caché)
+        cobrado = analitica.columna(datos, "monto_cobrado", 0.0, pa.float64())
+        costo = analitica.columna(datos, "costo_repartidor", 0.0, pa.float64())
+        return pa.table({
+            "Fecha": fechas_reporte(datos),
+            "Usuario": analitica.columna(datos, "perfiles.nombre", "N/A", pa.string()),
+            "Sucursal": analitica.columna(datos, "sucursales.sucursal", "N/A", pa.string()),
+            "Origen": analitica.columna(datos, "origen_nombre", "N/A", pa.string()),
+            "Monto Cobrado": cobrado,
+            "Costo Repartidor": costo,
+            "Ganancia Neta": pc.subtract(cobrado, costo),
+            "Notas": analitica.columna(datos, "notas", "", pa.string()),
+        })
     if st.button("Buscar Deliveries", type="primary"):
-        str_ini_d = fecha_ini_d.strftime("%Y-%m-%d") if fecha_ini_d else None
-        str_fin_d = fecha_fin_d.strftime("%Y-%m-%d") if fecha_fin_d else None
-        sucursal_ids_d = [op_suc_d[nombre] for nombre in sel_sucursales_d] if sel_sucursales_d else None
-        usuario_id_d = op_user_d[sel_usuario_d]
-        origen_nombre_d = op_origen_d[sel_origen_d]
-        with st.spinner("Buscando deliveries..."):
-            deliveries, err = database.admin_buscar_deliveries_filtrados(
-                lista_sucursal_ids=sucursal_ids_d, fecha_inicio=str_ini_d, fecha_fin=str_fin_d,
-                usuario_id=usuario_id_d, origen_nombre=origen_nombre_d
-            )
+        filtros_d = {
+            "lista_sucursal_ids": [op_suc_d[nombre] for nombre in sel_sucursales_d] if sel_sucursales_d else None,
+            "fecha_inicio": fecha_ini_d.strftime("%Y-%m-%d") if fecha_ini_d else None,
+            "fecha_fin": fecha_fin_d.strftime("%Y-%m-%d") if fecha_fin_d else None,
+            "usuario_id": op_user_d[sel_usuario_d],
+            "origen_nombre": op_origen_d[sel_origen_d],
+        }
+        st.session_state.trabajo_deliveries = trabajos.lanzar_paginado(
+            "deliveries", filtros_d, database.admin_iterar_deliveries_reporte, procesar_pagina=tabla_deliveries, texto="Buscando deliveries...",
+            depende_de=[etiquetas.tabla('cierre_delivery'), etiquetas.tabla('cierres_caja')]
+        ).id
+    trabajo_d = trabajo_terminado("trabajo_deliveries")
+    if trabajo_d:
+        resultado_d, err = trabajo_d.resultado, trabajo_d.error
         if err: st.error(f"Error al buscar deliveries: {err}")
-        elif not deliveries: st.warning("No se encontraron deliveries con los filtros seleccionados.")
+        elif not resultado_d: st.warning("No se encontraron deliveries con los filtros seleccionados.")
         else:
             st.subheader("Resultados de la Búsqueda")
-            df_data = []
-            for d in deliveries:
-                cobrado = float(d.get('monto_cobrado', 0))
-                costo = float(d.get('costo_repartidor', 0))
-                df_data.append({
-                    "Fecha": pd.to_datetime(d['created_at']).strftime('%Y-%m-%d %H:%M'),
-                    "Usuario": d.get('perfiles', {}).get('nombre', 'N/A') if d.get('perfiles') else 'N/A',
-                    "Sucursal": d.get('sucursales', {}).get('sucursal', 'N/A') if d.get('sucursales') else 'N/A',
-                    "Origen": d.get('origen_nombre', 'N/A'),
-                    "Monto Cobrado": cobrado,
-                    "Costo Repartidor": costo,
-                    "Ganancia Neta": cobrado - costo,
-                    "Notas": d.get('notas', '')
-                })
-            df = pd.DataFrame(df_data)
+            datos_delivery = analitica.tabla(resultado_d)
+            totales_d = analitica.totales(datos_delivery, {c: (c, "sum") for c in ("Monto Cobrado", "Costo Repartidor", "Ganancia Neta")})
             col_t1, col_t2, col_t3 = st.columns(3)
-            col_t1.metric("Total Cobrado", f"${df['Monto Cobrado'].sum():,.2f}")
-            col_t2.metric("Total Costo Repartidores", f"${df['Costo Repartidor'].sum():,.2f}")
-            col_t3.metric("Ganancia Neta Total", f"${df['Ganancia Neta'].sum():,.2f}")
-            st.dataframe(df.style.format({"Monto Cobrado": "${:,.2f}", "Costo Repartidor": "${:,.2f}", "Ganancia Neta": "${:,.2f}"}), use_container_width=True)
+            col_t1.metric("Total Cobrado", f"${totales_d['Monto Cobrado']:,.2f}")
+            col_t2.metric("Total Costo Repartidores", f"${totales_d['Costo Repartidor']:,.2f}")
+            col_t3.metric("Ganancia Neta Total", f"${totales_d['Ganancia Neta']:,.2f}")
+            st.dataframe(datos_delivery.to_pandas().style.format({"Monto Cobrado": "${:,.2f}", "Costo Repartidor": "${:,.2f}", "Ganancia Neta": "${:,.2f}"}), width='stretch')
             st.subheader("Ganancia Neta por Origen")
-            df_grouped = df.groupby("Origen")["Ganancia Neta"].sum().sort_values(ascending=False)
-            st.bar_chart(df_grouped)
+            st.bar_chart(serie_corte(datos_delivery, CORTES_DELIVERY["origen"]))
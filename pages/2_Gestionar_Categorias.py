@@ -4,6 +4,7 @@ import streamlit as st
 import sys
 import os
 import database
+import catalogos
 import pandas as pd
 
 # --- BLOQUE DE CORRECCIÓN DE IMPORTPATH ---
@@ -29,9 +30,8 @@ st.set_page_config(page_title="Categorías de Gastos", layout="centered")
 st.title("Administrar Categorías de Gastos 🗂️")
 
 def recargar_categorias():
-    cargar_data_categorias.clear()
+    catalogos.invalidar('gastos_categorias')
 
-@st.cache_data(ttl=10) 
 def cargar_data_categorias():
     categorias, error = database.admin_get_todas_categorias()
     if error:
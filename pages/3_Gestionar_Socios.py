@@ -5,6 +5,7 @@ import streamlit as st
 import sys
 import os
 import database
+import catalogos
 import time
 
 # --- BLOQUE DE CORRECCIÓN DE IMPORTPATH ---
@@ -29,9 +30,8 @@ st.set_page_config(page_title="Gestión de Socios", layout="centered")
 st.title("Administrar Socios de Negocio 🤝")
 
 def recargar_socios():
-    cargar_lista_socios.clear()
+    catalogos.invalidar('socios')
 
-@st.cache_data(ttl=10) 
 def cargar_lista_socios():
     """ Carga todos los socios (como lista de dicts) para los formularios """
     socios, error = database.admin_get_todos_socios()
@@ -3,6 +3,7 @@
 
 import streamlit as st
 import database
+import etiquetas
 import pytz
 from datetime import datetime, timedelta
 import pandas as pd
@@ -21,7 +22,6 @@ usuario_id_actual = st.session_state['perfil']['id']
 rol_usuario = st.session_state['perfil']['rol']
 
 # 1. SELECCIÓN DE SUCURSAL PARA VISTA RÁPIDA Y REGISTRO
-@st.cache_data(ttl=600)
 def cargar_sucursales_data():
     sucursales_data, err = database.obtener_sucursales()
     if err:
@@ -38,6 +38,11 @@ sucursal_id_sel = opciones_sucursal[sucursal_nombre_sel]
 
 st.divider()
 
+# El historial de la sucursal se cachea hasta que se escriba un registro de carga de esa sucursal
+@etiquetas.cache_data(lambda sucursal_id: [etiquetas.sucursal(sucursal_id)], ttl=600)
+def cargar_historial_sucursal(sucursal_id):
+    return database.get_registros_carga_rango([sucursal_id])
+
 # 2. FORMULARIO Y PANEL EN VIVO (PARA SUCURSAL SELECCIONADA)
 col_form, col_panel = st.columns([1, 2])
 
@@ -46,7 +51,7 @@ with col_form:
     fecha_operacion_sel = datetime.now(pytz.timezone('America/Panama')).strftime('%Y-%m-%d')
     st.caption(f"Fecha de operación: {fecha_operacion_sel}")
 
-    historial_completo_para_ref, _ = database.get_registros_carga_rango([sucursal_id_sel])
+    historial_completo_para_ref, _ = cargar_historial_sucursal(sucursal_id_sel)
     ultimo_sin_retirar = 0.0
     if historial_completo_para_ref:
         df_ref = pd.DataFrame(historial_completo_para_ref).sort_values(by='fecha_operacion', ascending=False)
@@ -70,7 +75,7 @@ with col_form:
         )
         if err_upsert: st.error(f"Error al guardar: {err_upsert}")
         else:
-            st.success("¡Registro guardado con éxito!"); st.cache_data.clear(); st.rerun()
+            st.success("¡Registro guardado con éxito!"); st.rerun()
 
 with col_panel:
     st.header(f"Panel de Control (Total Histórico - {sucursal_nombre_sel})")
@@ -196,7 +201,6 @@ if 'historial_carga_df' in st.session_state and not st.session_state['historial_
                 st.json(errores)
             else:
                 st.success("¡Cambios guardados con éxito!")
-                st.cache_data.clear()
                 del st.session_state['historial_carga_df']
                 st.rerun()
 
@@ -3,6 +3,8 @@
 
 import streamlit as st
 import database
+import etiquetas
+import almacen_cierre
 import pandas as pd
 from decimal import Decimal
 import tempfile
@@ -49,6 +51,68 @@ def live_update_cash_count(session_state_key_prefix, session_state_target_total)
         total += Decimal(str(cantidad)) * Decimal(str(den['valor']))
     st.session_state[session_state_target_total] = total
 
+# --- CONTEXTO DEL CIERRE (POR RERUN) ---
+# Todas las pestañas leen los datos del cierre desde este contexto: el cierre y sus colecciones
+# hijas se cargan UNA vez por rerun con database.obtener_snapshot_cierre, en lugar de que
+# cada pestaña haga sus propias consultas. El dict se crea de nuevo en cada ejecución del script.
+# Los pagos del día solo se cargan si el paso visible los necesita (con_pagos=True).
+# El snapshot vive en un almacén local de la sesión (almacen_cierre.py): las escrituras de
+# esta página le aplican las filas que devuelve database (aplicar_escritura) y solo se
+# vuelve a pedir al servidor si la versión del cierre en el servidor (database.version_cierre)
+# indica que otra sesión escribió.
+_CONTEXTO_RERUN = {}
+
+# Los pagos vienen del POS (la app no los escribe): sin etiquetas, solo TTL y recarga en segundo plano
+@etiquetas.cache_data(lambda *_: [], ttl=15, ttl_obsoleto=60)
+def cargar_pagos_dia(sucursal_nombre, fecha_operacion):
+    return database.obtener_pagos_dia_sucursal(sucursal_nombre, fecha_operacion)
+
+def almacen_del_cierre(cierre_id):
+    """Almacén local del cierre; se recarga desde el servidor solo si su versión no coincide."""
+    version = database.version_cierre(cierre_id)
+    almacen = st.session_state.get('almacen_cierre')
+    if almacen is None or almacen.cierre_id != cierre_id or not almacen.vigente(version):
+        snapshot, err = database.obtener_snapshot_cierre(cierre_id, incluir_pagos=False)
+        if err:
+            st.error(f"Error cargando los datos del cierre: {err}")
+            st.stop()
+        almacen = almacen_cierre.AlmacenCierre(cierre_id, snapshot, version)
+        st.session_state['almacen_cierre'] = almacen
+    return almacen
+
+def obtener_contexto_cierre(cierre_id, con_pagos=False):
+    if _CONTEXTO_RERUN.get('cierre_id') != cierre_id:
+        _CONTEXTO_RERUN.clear()
+        # Copia superficial: los pagos se agregan solo al contexto de este rerun, no al almacén
+        _CONTEXTO_RERUN.update({'cierre_id': cierre_id, 'snapshot': dict(almacen_del_cierre(cierre_id).snapshot)})
+    snapshot = _CONTEXTO_RERUN['snapshot']
+    if con_pagos and 'pagos' not in snapshot:
+        cierre = snapshot['cierre']
+        pagos, err = cargar_pagos_dia((cierre.get('sucursales') or {}).get('sucursal'), cierre['fecha_operacion'])
+        if err:
+            st.warning(f"Error Pagos: {err}")
+        snapshot['pagos'] = pagos or []
+    return snapshot
+
+def aplicar_escritura(cierre_id, filas=None, eliminados=None, cierre=None):
+    """
+    Tras una escritura confirmada, aplica al almacén local las filas que devolvió database
+    (ver AlmacenCierre.aplicar) en lugar de recargar el cierre, y descarta el dashboard,
+    que se recalcula en local.
+    """
+    almacen = st.session_state.get('almacen_cierre')
+    if almacen is not None and almacen.cierre_id == cierre_id:
+        almacen.aplicar(database.version_cierre(cierre_id), filas, eliminados, cierre)
+    _CONTEXTO_RERUN.clear()
+    if 'dashboard_data' in st.session_state:
+        del st.session_state['dashboard_data']
+
+def errores_de_borrado(resultado, error, etiqueta):
+    """Lista de mensajes de un borrado masivo de database (error general o fallos por id)."""
+    if error:
+        return [error]
+    return [f"{etiqueta} {id_fila}: {motivo}" for id_fila, motivo in resultado["fallidos"].items()]
+
 # --- Módulo: form_caja_inicial (CORREGIDO) ---
 def render_form_inicial(usuario_id, sucursal_id):
     st.info("No se encontró ningún cierre para hoy. Se debe crear uno nuevo.")
@@ -199,12 +263,12 @@ def render_tab_inicial():
             st.session_state.cierre_actual_objeto["saldo_inicial_detalle"] = datos_conteo_actualizados
             st.session_state.cierre_actual_objeto["saldo_inicial_efectivo"] = datos_conteo_actualizados['total']
             st.success("¡Saldo inicial actualizado!")
-            if 'dashboard_data' in st.session_state:
-                del st.session_state['dashboard_data']
+            aplicar_escritura(cierre_id, cierre={
+                "saldo_inicial_detalle": datos_conteo_actualizados, "saldo_inicial_efectivo": datos_conteo_actualizados['total']
+            })
             st.rerun()
 
 # --- Módulo: tab_gastos ---
-@st.cache_data(ttl=600)
 def cargar_categorias_gastos_activas():
     categorias_data, err = database.obtener_categorias_gastos()
     if err:
@@ -213,12 +277,8 @@ def cargar_categorias_gastos_activas():
     opciones_cat = {c['nombre']: c['id'] for c in categorias_data}
     return opciones_cat
 
-@st.cache_data(ttl=15)
 def cargar_gastos_registrados(cierre_id):
-    gastos_data, err = database.obtener_gastos_del_cierre(cierre_id)
-    if err:
-        st.error(f"Error cargando gastos registrados: {err}")
-        return pd.DataFrame(), 0.0
+    gastos_data = obtener_contexto_cierre(cierre_id)['gastos']
 
     if not gastos_data:
         return pd.DataFrame(columns=["Categoría", "Monto", "Notas", "ID"]), 0.0
@@ -268,7 +328,7 @@ def render_tab_gastos():
         if monto_gasto and monto_gasto > 0:
             categoria_id_sel = categorias_dict.get(categoria_nombre_sel)
             with st.spinner("Registrando gasto..."):
-                _, error_db = database.registrar_gasto(
+                gasto_nuevo, error_db = database.registrar_gasto(
                     cierre_id=cierre_id, categoria_id=categoria_id_sel, monto=monto_gasto, notas=notas_gasto,
                     usuario_id=usuario_id, sucursal_id=sucursal_id, sucursal_nombre=sucursal_nombre
                 )
@@ -276,10 +336,7 @@ def render_tab_gastos():
                 st.error(f"Error al registrar gasto: {error_db}")
             else:
                 st.success(f"Gasto de ${monto_gasto:,.2f} en '{categoria_nombre_sel}' añadido.")
-                cargar_gastos_registrados.clear()
-                # Forzar recarga del dashboard de resumen
-                if 'dashboard_data' in st.session_state:
-                    del st.session_state['dashboard_data']
+                aplicar_escritura(cierre_id, filas={"gastos": gasto_nuevo})
                 st.rerun()
         else:
             st.warning("El monto del gasto debe ser mayor a cero.")
@@ -318,27 +375,23 @@ def render_tab_gastos():
                 st.info("No se seleccionó ningún gasto para eliminar.")
             else:
                 total_a_eliminar = len(filas_para_eliminar)
-                errores = []
                 with st.spinner(f"Eliminando {total_a_eliminar} gastos..."):
-                    for _, fila in filas_para_eliminar.iterrows():
-                        _, err_del = database.eliminar_gasto_caja(fila["ID"])
-                        if err_del:
-                            errores.append(f"Gasto ID {fila['ID']}: {err_del}")
+                    resultado_del, err_del = database.eliminar_gastos_caja(filas_para_eliminar["ID"].tolist())
+                errores = errores_de_borrado(resultado_del, err_del, "Gasto ID")
                 
                 if errores:
                     st.error("Ocurrieron errores durante la eliminación:")
                     st.json(errores)
+                    if resultado_del and resultado_del["eliminados"]:
+                        aplicar_escritura(cierre_id, eliminados={"gastos": resultado_del["eliminados"]})
                 else:
                     st.success(f"¡{total_a_eliminar} gastos eliminados con éxito!")
-                    cargar_gastos_registrados.clear()
-                    if 'dashboard_data' in st.session_state:
-                        del st.session_state['dashboard_data']
+                    aplicar_escritura(cierre_id, eliminados={"gastos": resultado_del["eliminados"]})
                     st.rerun()
 
         st.metric(label="Total Gastado (Efectivo)", value=f"${total_gastos:,.2f}")
 
 # --- Módulo: tab_ingresos_adic ---
-@st.cache_data(ttl=600)
 def cargar_datos_ingresos():
     socios, err_s = database.obtener_socios()
     metodos_pago, err_mp = database.obtener_metodos_pago()
@@ -346,18 +399,41 @@ def cargar_datos_ingresos():
         return None, None, f"Error Socios: {err_s} | Error MP: {err_mp}"
     return socios, metodos_pago, None
 
-@st.cache_data(ttl=15)
 def cargar_ingresos_existentes(cierre_id):
-    ingresos_existentes, err_ie = database.obtener_ingresos_adicionales_del_cierre(cierre_id)
-    if err_ie:
-        st.error(f"Error cargando ingresos existentes: {err_ie}")
-        return {}
+    ingresos_existentes = obtener_contexto_cierre(cierre_id)['ingresos_adicionales']
     lookup = {}
     for ingreso in ingresos_existentes:
         key = f"{ingreso['socio_id']}::{ingreso['metodo_pago']}"
         lookup[key] = float(ingreso['monto'])
     return lookup
 
+def construir_grilla_ingresos(socios, nombres_metodos, ingresos_lookup):
+    """
+    Grilla pivotada para el editor: una fila por socio (índice socio_id, oculto),
+    una columna por método de pago externo, con los montos ya guardados (0 si no hay).
+    """
+    montos = pd.Series(ingresos_lookup, dtype=float)
+    if montos.empty:
+        pivot = pd.DataFrame(dtype=float)
+    else:
+        montos.index = pd.MultiIndex.from_tuples([k.split('::', 1) for k in montos.index], names=['socio_id', 'metodo_pago'])
+        pivot = montos.unstack('metodo_pago')
+    grilla = pivot.reindex(index=[s['id'] for s in socios], columns=nombres_metodos).fillna(0.0)
+    grilla.index.name, grilla.columns.name = 'socio_id', None
+    grilla.insert(0, 'Socio', [s['nombre'] for s in socios])
+    return grilla
+
+def calcular_cambios_grilla(grilla_original, grilla_editada, nombres_metodos):
+    """Diff vectorizado entre la grilla original y la editada: lista de celdas modificadas."""
+    original = grilla_original[nombres_metodos].astype(float)
+    editada = grilla_editada[nombres_metodos].astype(float).fillna(0.0)
+    modificadas = editada.round(2).ne(original.round(2))
+    celdas = editada.where(modificadas).stack().dropna()
+    return [
+        {"socio_id": socio_id, "metodo_pago": metodo, "monto": round(float(monto), 2)}
+        for (socio_id, metodo), monto in celdas.items()
+    ]
+
 def render_tab_ingresos_adic():
     cierre_actual = st.session_state.get('cierre_actual_objeto')
     if not cierre_actual:
@@ -380,63 +456,51 @@ def render_tab_ingresos_adic():
     
     ingresos_lookup = cargar_ingresos_existentes(cierre_id)
     st.subheader("Registrar Ingresos Adicionales por Socio")
-    st.markdown("Registre los montos recibidos por cada socio y método de pago. Use los 'expanders' (▼) para ver cada socio.")
+    st.markdown("Registre los montos recibidos por cada socio (filas) y método de pago (columnas) directamente en la tabla.")
+
+    nombres_metodos = [mp['nombre'] for mp in metodos_pago_externos]
+    grilla_original = construir_grilla_ingresos(socios, nombres_metodos, ingresos_lookup)
 
     with st.form(key="form_ingresos_adicionales"):
-        widget_keys = []
-        for socio in socios:
-            with st.expander(f"Socio: {socio['nombre']}"):
-                for mp in metodos_pago_externos:
-                    socio_id = socio['id']
-                    mp_nombre = mp['nombre']
-                    widget_key = f"ing_{socio_id}_{mp_nombre}"
-                    lookup_key = f"{socio_id}::{mp_nombre}"
-                    valor_existente = ingresos_lookup.get(lookup_key, 0.0)
-                    st.number_input(
-                        f"Monto para {mp_nombre}:", key=widget_key, value=valor_existente,
-                        min_value=0.0, step=0.01, format="%.2f"
-                    )
-                    widget_keys.append({
-                        "widget_key": widget_key, "lookup_key": lookup_key, "socio_id": socio_id,
-                        "mp_nombre": mp_nombre, "valor_anterior": valor_existente
-                    })
+        grilla_editada = st.data_editor(
+            grilla_original,
+            key="grilla_ingresos_adicionales",
+            hide_index=True,
+            num_rows="fixed",
+            disabled=["Socio"],
+            column_config={
+                "Socio": st.column_config.TextColumn("Socio"),
+                **{nombre: st.column_config.NumberColumn(nombre, min_value=0.0, step=0.01, format="$%.2f") for nombre in nombres_metodos}
+            },
+            width='stretch'
+        )
         submitted = st.form_submit_button("Guardar Cambios de Ingresos Adicionales", type="primary")
 
     if submitted:
-        total_cambios = 0
-        with st.spinner("Guardando ingresos..."):
-            for key_info in widget_keys:
-                nuevo_valor = st.session_state[key_info['widget_key']]
-                valor_anterior = key_info['valor_anterior']
-                if nuevo_valor != valor_anterior:
-                    total_cambios += 1
-                    socio_id = key_info['socio_id']
-                    mp_nombre = key_info['mp_nombre']
-                    if valor_anterior > 0:
-                        _, err = database.actualizar_ingreso_adicional(cierre_id, socio_id, nuevo_valor, mp_nombre)
-                    elif nuevo_valor > 0:
-                        _, err = database.registrar_ingreso_adicional(cierre_id, socio_id, nuevo_valor, mp_nombre, notas="")
-                    else:
-                        err = None
-                    if err:
-                        st.error(f"Error guardando para {socio['nombre']}/{mp_nombre}: {err}")
-                        break
-        if total_cambios > 0:
-            st.success(f"¡{total_cambios} cambios guardados con éxito!")
-            cargar_ingresos_existentes.clear()
-            if 'dashboard_data' in st.session_state:
-                del st.session_state['dashboard_data']
-            st.rerun()
+        # Solo se envían las celdas modificadas, todas juntas en un único upsert atómico
+        cambios = calcular_cambios_grilla(grilla_original, grilla_editada, nombres_metodos)
+        # Las celdas ya guardadas conservan su nota; las nuevas se crean con nota vacía
+        notas_existentes = {
+            (ingreso['socio_id'], ingreso['metodo_pago']): ingreso.get('notas')
+            for ingreso in obtener_contexto_cierre(cierre_id)['ingresos_adicionales']
+        }
+        for cambio in cambios:
+            cambio['notas'] = notas_existentes.get((cambio['socio_id'], cambio['metodo_pago'])) or ""
+        if cambios:
+            with st.spinner("Guardando ingresos..."):
+                ingresos_guardados, err = database.guardar_ingresos_adicionales_lote(cierre_id, cambios)
+            if err:
+                st.error(f"No se guardó ningún cambio: {err}")
+            else:
+                st.success(f"¡{len(cambios)} cambios guardados con éxito!")
+                aplicar_escritura(cierre_id, filas={"ingresos_adicionales": ingresos_guardados})
+                st.rerun()
         else:
             st.info("No se detectaron cambios para guardar.")
 
 # --- Módulo: tab_delivery ---
-@st.cache_data(ttl=15)
 def cargar_deliveries_registrados(cierre_id):
-    delivery_data, err = database.obtener_deliveries_del_cierre(cierre_id)
-    if err:
-        st.error(f"Error cargando registros de delivery: {err}")
-        return pd.DataFrame(), 0.0, 0.0
+    delivery_data = obtener_contexto_cierre(cierre_id)['deliveries']
 
     if not delivery_data:
         return pd.DataFrame(columns=["Origen", "Cobrado", "Costo", "Ganancia", "Notas", "ID", "Gasto_ID"]), 0.0, 0.0
@@ -466,7 +530,6 @@ def cargar_deliveries_registrados(cierre_id):
     df = pd.DataFrame(df_data)
     return df, total_cobrado_delivery, total_costo_delivery
 
-@st.cache_data(ttl=600)
 def cargar_dependencias_delivery():
     socios_data, err_s = database.obtener_socios()
     if err_s:
@@ -507,25 +570,21 @@ def render_tab_delivery():
     
     if st.button("Añadir Registro de Delivery", type="primary"):
         with st.spinner("Registrando delivery..."):
-            gasto_generado_id = None
-            if costo_repartidor > 0:
-                nota_gasto = f"Delivery (Origen: {origen_sel}) - {notas_delivery}"
-                gasto_data, err_gasto = database.registrar_gasto(cierre_id, repartidor_cat_id, costo_repartidor, nota_gasto, usuario_id, sucursal_id, sucursal_nombre)
-                if err_gasto:
-                    st.error(f"Error al crear el Gasto asociado: {err_gasto}")
-                    st.stop()
-                gasto_generado_id = gasto_data[0]['id']
-            
-            _, err_delivery = database.registrar_delivery_completo(cierre_id, usuario_id, sucursal_id, monto_cobrado, costo_repartidor, origen_sel, notas_delivery, gasto_generado_id)
-                
+            # El gasto del repartidor (si costo > 0) y el delivery se crean en una sola transacción
+            nota_gasto = f"Delivery (Origen: {origen_sel}) - {notas_delivery}"
+            delivery_nuevo, err_delivery = database.registrar_delivery_con_gasto(
+                cierre_id, usuario_id, sucursal_id, sucursal_nombre, monto_cobrado, costo_repartidor,
+                origen_sel, notas_delivery, repartidor_cat_id, nota_gasto
+            )
+
         if err_delivery:
             st.error(f"Error al registrar el reporte de delivery: {err_delivery}")
         else:
             st.success("Delivery añadido con éxito.")
-            cargar_deliveries_registrados.clear()
-            cargar_gastos_registrados.clear()
-            if 'dashboard_data' in st.session_state:
-                del st.session_state['dashboard_data']
+            aplicar_escritura(cierre_id, filas={
+                "deliveries": [delivery_nuevo['delivery']],
+                "gastos": [delivery_nuevo['gasto']] if delivery_nuevo.get('gasto') else []
+            })
             st.rerun()
 
     # --- INICIO DEL CÓDIGO AÑADIDO ---
@@ -563,22 +622,19 @@ def render_tab_delivery():
                 st.info("No se seleccionó ningún registro para eliminar.")
             else:
                 total_a_eliminar = len(filas_para_eliminar)
-                errores = []
                 with st.spinner(f"Eliminando {total_a_eliminar} registros..."):
-                    for _, fila in filas_para_eliminar.iterrows():
-                        _, err_del = database.eliminar_delivery_completo(fila["ID"], fila["Gasto_ID"])
-                        if err_del:
-                            errores.append(f"Fila ID {fila['ID']}: {err_del}")
+                    # Cada delivery se borra junto con su gasto asociado, todos en una sola llamada
+                    resultado_del, err_del = database.eliminar_deliveries_completos(filas_para_eliminar["ID"].tolist())
+                errores = errores_de_borrado(resultado_del, err_del, "Fila ID")
                 
                 if errores:
                     st.error("Ocurrieron errores:")
                     st.json(errores)
+                    if resultado_del and resultado_del["eliminados"]:
+                        aplicar_escritura(cierre_id, eliminados={"deliveries": resultado_del["eliminados"], "gastos": resultado_del["gastos_eliminados"]})
                 else:
                     st.success(f"¡{total_a_eliminar} registros eliminados!")
-                    cargar_deliveries_registrados.clear()
-                    cargar_gastos_registrados.clear()
-                    if 'dashboard_data' in st.session_state:
-                        del st.session_state['dashboard_data'] 
+                    aplicar_escritura(cierre_id, eliminados={"deliveries": resultado_del["eliminados"], "gastos": resultado_del["gastos_eliminados"]})
                     st.rerun()
 
     st.metric("Total Cobrado (Informativo)", f"${total_cobrado:,.2f}")
@@ -592,12 +648,8 @@ def render_tab_delivery():
     )
 
 # --- Módulo: tab_compras ---
-@st.cache_data(ttl=15)
 def cargar_compras_registradas(cierre_id):
-    compras_data, err = database.obtener_compras_del_cierre(cierre_id)
-    if err:
-        st.error(f"Error cargando registros de compras: {err}")
-        return pd.DataFrame(), 0.0, 0.0
+    compras_data = obtener_contexto_cierre(cierre_id)['compras']
 
     if not compras_data:
         return pd.DataFrame(columns=["Calculado", "Costo Real", "Ahorro/Ganancia", "Notas", "ID"]), 0.0, 0.0
@@ -639,7 +691,7 @@ def render_tab_compras():
 
     if submit_compra:
         with st.spinner("Registrando compra..."):
-            _, error_db = database.registrar_compra(
+            compra_nueva, error_db = database.registrar_compra(
                 cierre_id, usuario_id, sucursal_id, 
                 valor_calculado, costo_real, notas_compra
             )
@@ -647,7 +699,7 @@ def render_tab_compras():
             st.error(f"Error al registrar compra: {error_db}")
         else:
             st.success("Registro de compra añadido.")
-            cargar_compras_registradas.clear()
+            aplicar_escritura(cierre_id, filas={"compras": compra_nueva})
             st.rerun()
 
     # --- INICIO DEL CÓDIGO AÑADIDO ---
@@ -683,19 +735,18 @@ def render_tab_compras():
                 st.info("No se seleccionó ningún registro para eliminar.")
             else:
                 total_a_eliminar = len(filas_para_eliminar)
-                errores = []
                 with st.spinner(f"Eliminando {total_a_eliminar} registros..."):
-                    for _, fila in filas_para_eliminar.iterrows():
-                        _, err_del = database.eliminar_compra_registro(fila["ID"])
-                        if err_del:
-                            errores.append(f"Fila ID {fila['ID']}: {err_del}")
+                    resultado_del, err_del = database.eliminar_compras_registro(filas_para_eliminar["ID"].tolist())
+                errores = errores_de_borrado(resultado_del, err_del, "Fila ID")
                 
                 if errores:
                     st.error("Ocurrieron errores durante la eliminación:")
                     st.json(errores)
+                    if resultado_del and resultado_del["eliminados"]:
+                        aplicar_escritura(cierre_id, eliminados={"compras": resultado_del["eliminados"]})
                 else:
                     st.success(f"¡{total_a_eliminar} registros eliminados con éxito!")
-                    cargar_compras_registradas.clear()
+                    aplicar_escritura(cierre_id, eliminados={"compras": resultado_del["eliminados"]})
                     st.rerun()
     
     st.metric("Total Calculado (Estimado)", f"${total_calc:,.2f}")
@@ -709,7 +760,6 @@ def render_tab_compras():
     )
 
 # --- Módulo: tab_resumen ---
-@st.cache_data(ttl=600)
 def cargar_info_metodos_pago():
     metodos, err = database.obtener_metodos_pago()
     if err:
@@ -719,19 +769,14 @@ def cargar_info_metodos_pago():
     internos = {m['nombre'] for m in metodos if m.get('tipo') == 'interno'}
     return internos
 
-def render_tab_resumen():
-    cierre_actual = st.session_state.get('cierre_actual_objeto')
-    if not cierre_actual:
-        st.error("Error: No hay ningún cierre cargado en la sesión.")
-        st.stop()
-    cierre_id = cierre_actual['id']
-
-    st.subheader("Dashboard de Movimientos del Día")
-    
-    # --- MODIFICACIÓN: Se elimina el botón de refresco y la lógica de bandera ---
+def asegurar_resumen_del_dia(cierre_id):
+    """
+    Calcula el dashboard (si no está en sesión) y guarda el resumen del día en la BD.
+    Lo usan el paso Resumen y la verificación final, ya que solo se renderiza el paso activo.
+    """
     if 'dashboard_data' not in st.session_state:
         with st.spinner("Calculando totales del día..."):
-            data, err = database.get_dashboard_resumen_data(cierre_id)
+            data, err = database.get_dashboard_resumen_data(cierre_id, snapshot=obtener_contexto_cierre(cierre_id, con_pagos=True))
             if err:
                 st.error(err)
                 st.stop()
@@ -749,9 +794,19 @@ def render_tab_resumen():
                 "totales_por_socio": [{"socio": socio, "total": float(sum(Decimal(str(v)) for v in metodos.values())), "desglose": [{"metodo": m, "total": float(t)} for m, t in metodos.items()]} for socio, metodos in data.get('socios', {}).items()]
             }
             database.guardar_resumen_del_dia(cierre_id, resumen_json)
+    return st.session_state['dashboard_data']
 
+def render_tab_resumen():
+    cierre_actual = st.session_state.get('cierre_actual_objeto')
+    if not cierre_actual:
+        st.error("Error: No hay ningún cierre cargado en la sesión.")
+        st.stop()
+    cierre_id = cierre_actual['id']
 
-    data = st.session_state['dashboard_data']
+    st.subheader("Dashboard de Movimientos del Día")
+    
+    # --- MODIFICACIÓN: Se elimina el botón de refresco y la lógica de bandera ---
+    data = asegurar_resumen_del_dia(cierre_id)
     totales_rayo = data.get('rayo', {})
     totales_socios = data.get('socios', {})
     metodos_internos = cargar_info_metodos_pago()
@@ -872,29 +927,29 @@ def calcular_saldo_teorico_efectivo(cierre_id, saldo_inicial_efectivo):
     """
     Calcula el saldo de efectivo esperado sumando ingresos y restando gastos.
     """
-    # Esta función depende de otras funciones de carga de datos que se asume existen.
-    # Por ejemplo: cargar_gastos_registrados, etc.
+    # Los datos salen del contexto del cierre (almacén de la sesión + pagos con TTL de
+    # cargar_pagos_dia): no hace falta otra caché, y una global (etiquetas.cache_data) no puede
+    # depender de session_state ni del contexto del rerun.
+    snapshot = obtener_contexto_cierre(cierre_id, con_pagos=True)
+    _, total_gastos = cargar_gastos_registrados(cierre_id) # Usamos la función que ya existe
+    return _calcular_saldo_teorico(saldo_inicial_efectivo, snapshot['pagos'], snapshot['ingresos_adicionales'], total_gastos)
+
+def _calcular_saldo_teorico(saldo_inicial_efectivo, pagos_venta, ingresos_adicionales, total_gastos):
     saldo_inicial = Decimal(str(saldo_inicial_efectivo))
     
     # 1. Sumar Ingresos (Ventas POS + Adicionales que afecten efectivo)
-    # Esta parte requiere lógica para obtener y sumar todos los ingresos en efectivo.
-    # Placeholder para la suma de ingresos:
     total_ingresos_efectivo = Decimal('0.0') 
-    pagos_venta, _ = database.obtener_pagos_del_cierre(cierre_id)
     if pagos_venta:
         for pago in pagos_venta:
             if pago.get('metodo_pago', {}).get('nombre', '').lower() == 'efectivo':
                  total_ingresos_efectivo += Decimal(str(pago.get('monto', 0)))
 
-    ingresos_adicionales, _ = database.obtener_ingresos_adicionales_del_cierre(cierre_id)
     if ingresos_adicionales:
         for ingreso in ingresos_adicionales:
-            if ingreso.get('metodo_pago', '').lower() == 'efectivo' and ingreso.get('socios', {}).get('afecta_conteo_efectivo'):
+            if ingreso.get('metodo_pago', '').lower() == 'efectivo' and (ingreso.get('socios') or {}).get('afecta_conteo_efectivo'):
                 total_ingresos_efectivo += Decimal(str(ingreso.get('monto', 0)))
 
     # 2. Restar Gastos
-    _, total_gastos = cargar_gastos_registrados(cierre_id) # Usamos la función que ya existe
-    
     saldo_teorico = saldo_inicial + total_ingresos_efectivo - Decimal(str(total_gastos))
     return saldo_teorico
 
@@ -1017,14 +1072,13 @@ def render_tab_caja_final():
             st.metric("Total Saldo Siguiente:", f"${float(saldo_sig_guardado.get('total', 0)):,.2f}")
 
 # --- Módulo: tab_verificacion ---
-@st.cache_data(ttl=15)
 def cargar_datos_verificacion(cierre_id):
-    pagos_ventas_raw, err_p = database.obtener_pagos_del_cierre(cierre_id)
+    snapshot = obtener_contexto_cierre(cierre_id, con_pagos=True)
+    pagos_ventas_raw = snapshot['pagos']
+    ingresos_adic_raw = snapshot['ingresos_adicionales']
     metodos_maestros_raw, err_m = database.obtener_metodos_pago_con_flags()
-    ingresos_adic_raw, err_i = database.obtener_ingresos_adicionales_del_cierre(cierre_id)
 
     if err_m: st.error(f"Error Crítico: {err_m}"); st.stop()
-    if err_p or err_i: st.warning(f"Error Pagos: {err_p} | Error Ingresos: {err_i}")
 
     metodos_maestros = {mp['nombre']: mp for mp in metodos_maestros_raw if mp.get('is_activo')}
     set_maestros_verificables = {
@@ -1159,13 +1213,13 @@ def render_tab_verificacion():
             }
 
             # 2. Crear el nuevo desglose de ingresos adicionales en efectivo
-            ingresos_adicionales_raw, _ = database.obtener_ingresos_adicionales_del_cierre(cierre_id)
+            ingresos_adicionales_raw = obtener_contexto_cierre(cierre_id)['ingresos_adicionales']
             desglose_ingresos_efectivo = []
             if ingresos_adicionales_raw:
                 for ing in ingresos_adicionales_raw:
                     if ing.get('metodo_pago', '').lower() == 'efectivo':
                         desglose_ingresos_efectivo.append({
-                            "socio": ing.get('socios', {}).get('nombre', 'N/A'),
+                            "socio": (ing.get('socios') or {}).get('nombre', 'N/A'),
                             "monto": float(ing.get('monto', 0)),
                             "notas": ing.get('notas', '')
                         })
@@ -1192,7 +1246,7 @@ def render_tab_verificacion():
             else:
                 st.success("¡Verificación guardada con éxito!")
                 st.session_state.cierre_actual_objeto['verificacion_pagos_detalle'] = final_data_json
-                cargar_datos_verificacion.clear()
+                aplicar_escritura(cierre_id, cierre={"verificacion_pagos_detalle": final_data_json})
                 st.rerun()
 
 
@@ -1226,6 +1280,8 @@ def render_tab_verificacion():
     if st.button("FINALIZAR CIERRE DEL DÍA", type="primary", disabled=not boton_finalizar_habilitado):
         with st.spinner("Finalizando cierre..."):
             nota_a_guardar = nota_admin if not match_completo_ok and usuario_es_admin else None
+            # El resumen del día se guarda al abrir el PASO 6; si no se visitó, se guarda aquí
+            asegurar_resumen_del_dia(cierre_id)
             _, err_final = database.finalizar_cierre_en_db(cierre_id, nota_discrepancia=nota_a_guardar)
             if err_final:
                 st.error(f"Error al finalizar: {err_final}")
@@ -1234,7 +1290,6 @@ def render_tab_verificacion():
                 st.balloons()
                 st.session_state['cierre_actual_objeto'] = None
                 st.session_state['cierre_sucursal_seleccionada_nombre'] = None
-                st.cache_data.clear()
                 st.rerun()
 
 # =============================================================================
@@ -1244,7 +1299,6 @@ def render_tab_verificacion():
 st.set_page_config(page_title="Cierre de Caja Operativo", layout="wide")
 st.title("Espacio de Trabajo: Cierre de Caja 🧾")
 
-@st.cache_data(ttl=600)
 def cargar_sucursales_data():
     sucursales_data, err = database.obtener_sucursales()
     if err:
@@ -1346,29 +1400,34 @@ if st.session_state.get('cierre_actual_objeto') is None:
              else:
                 st.stop()
 
-# Renderizado de las pestañas (sin cambios)
+# Renderizado del paso activo
+# Solo se ejecuta el render del paso seleccionado (st.tabs ejecutaba los 8 en cada rerun).
+PASOS_CIERRE = {
+    "PASO 1: Caja Inicial": render_tab_inicial,
+    "PASO 2: Gastos": render_tab_gastos,
+    "PASO 3: Ingresos Adic.": render_tab_ingresos_adic,
+    "PASO 4: Delivery": render_tab_delivery,
+    "PASO 5: Compras (Info)": render_tab_compras,
+    "PASO 6: Resumen": render_tab_resumen,
+    "PASO 7: Caja Final": render_tab_caja_final,
+    "PASO 8: Verificación y Finalizar": render_tab_verificacion,
+}
+
+def al_cambiar_paso():
+    # Los totales "en vivo" de los conteos no guardados no deben sobrevivir al cambio de paso
+    st.session_state.pop('live_total_inicial_edit', None)
+    st.session_state.pop('live_total_fisico_final', None)
+
 if st.session_state.get('cierre_actual_objeto'):
     st.markdown("---")
     st.header(f"Estás trabajando en: {st.session_state.cierre_sucursal_seleccionada_nombre}")
     
-    tab1, tab2, tab3, tab_del, tab_compra, tab4, tab5, tab6 = st.tabs([
-        "PASO 1: Caja Inicial", "PASO 2: Gastos", "PASO 3: Ingresos Adic.",
-        "PASO 4: Delivery", "PASO 5: Compras (Info)", "PASO 6: Resumen",
-        "PASO 7: Caja Final", "PASO 8: Verificación y Finalizar"
-    ])
-
-    with tab1: render_tab_inicial()
-    with tab2: render_tab_gastos()
-    with tab3: render_tab_ingresos_adic()
-    with tab_del: render_tab_delivery()
-    with tab_compra: render_tab_compras()
-    with tab4: render_tab_resumen()
-    with tab5: render_tab_caja_final()
-    with tab6: render_tab_verificacion()
-
-
-
-
-
-
-
+    paso_activo = st.radio(
+        "Paso del cierre:",
+        options=list(PASOS_CIERRE.keys()),
+        horizontal=True,
+        key="paso_cierre_activo",
+        on_change=al_cambiar_paso,
+        label_visibility="collapsed"
+    )
+    PASOS_CIERRE[paso_activo]()
@@ -2,7 +2,7 @@
 # VERSIÓN FINAL (Lógica de Resumen y Verificación basada en reglas 'interno'/'externo' y 'requiere_conteo')
 
 import streamlit as st
-import sys, os, database, pytz, tempfile, json
+import sys, os, database, catalogos, etiquetas, pytz, tempfile, json
 from datetime import datetime
 from decimal import Decimal
 
@@ -31,7 +31,6 @@ st.set_page_config(page_title="Cierre CDE", layout="wide")
 st.title("Módulo de Verificación de Cierre CDE 🏦")
 
 # --- 1. SELECCIÓN DE SUCURSAL ---
-@st.cache_data(ttl=600)
 def cargar_sucursales_cde_data():
     sucursales_data, err = database.obtener_sucursales_cde()
     if err:
@@ -59,15 +58,11 @@ fecha_hoy_str = datetime.now(tz_panama).strftime('%Y-%m-%d')
 st.header(f"Verificación para: {sucursal_nombre_sel} | Fecha: {fecha_hoy_str}")
 
 # --- 2. CARGAR TOTALES Y DEPENDENCIAS ---
-@st.cache_data(ttl=60) 
+# Los pagos vienen del POS (la app no los escribe): sin etiquetas, solo TTL y recarga en segundo plano
+@etiquetas.cache_data(lambda *_: [], ttl=60, ttl_obsoleto=60)
 def cargar_totales_sistema(fecha, sucursal_nombre):
-    totales_metodos, total_efectivo, err = database.calcular_totales_pagos_dia_sucursal(fecha, sucursal_nombre)
-    if err:
-        st.error(f"Error fatal al calcular totales de pagos: {err}")
-        st.stop()
-    return totales_metodos, total_efectivo
+    return database.calcular_totales_pagos_dia_sucursal(fecha, sucursal_nombre)
 
-@st.cache_data(ttl=600)
 def cargar_metodos_cde_activos():
     metodos, err = database.obtener_metodos_pago_cde()
     if err:
@@ -75,7 +70,10 @@ def cargar_metodos_cde_activos():
         return []
     return metodos
 
-totales_sistema_metodos_dict, total_sistema_efectivo = cargar_totales_sistema(fecha_hoy_str, sucursal_nombre_sel)
+totales_sistema_metodos_dict, total_sistema_efectivo, err_totales = cargar_totales_sistema(fecha_hoy_str, sucursal_nombre_sel)
+if err_totales:
+    st.error(f"Error fatal al calcular totales de pagos: {err_totales}")
+    st.stop()
 metodos_pago_cde_lista = cargar_metodos_cde_activos()
 
 # --- 3. RESUMEN DE INGRESOS DEL SISTEMA (ARRIBA) ---
@@ -91,7 +89,7 @@ for i, (metodo, total) in enumerate(col_data.items()):
 
 if st.button("🔄 Refrescar Totales del Sistema"):
     cargar_totales_sistema.clear()
-    cargar_metodos_cde_activos.clear()
+    catalogos.invalidar('metodos_pago')
     st.rerun()
 st.divider()
 
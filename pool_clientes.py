@@ -0,0 +1,154 @@
+# pool_clientes.py
+# Pool de clientes de Supabase, uno por sesión de Streamlit.
+#
+# Antes había un único cliente global para todo el proceso: todas las sesiones (cajeros)
+# compartían el mismo token de auth y el mismo cliente HTTP. Con el pool, cada sesión
+# tiene su propio cliente (su propio token, que se refresca solo en segundo plano, y su
+# propia conexión HTTP keep-alive), y los clientes se reutilizan entre reruns.
+# El pool se limita por tamaño (LRU) y por inactividad, y expone métricas de uso.
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+CLAVE_SIN_SESION = "__sin_sesion__"
+
+_LOCAL_HILO = threading.local()
+
+
+def clave_sesion_actual():
+    """
+    Clave de la sesión que está ejecutando el código: la fijada con usar_sesion() en hilos
+    de trabajo, o el id de la sesión de Streamlit del hilo del script.
+    """
+    clave = getattr(_LOCAL_HILO, 'clave_sesion', None)
+    if clave:
+        return clave
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else CLAVE_SIN_SESION
+
+
+def hay_contexto_streamlit():
+    return get_script_run_ctx() is not None
+
+
+@contextmanager
+def usar_sesion(clave):
+    """Hace que el hilo actual use el cliente de la sesión 'clave' (para hilos de trabajo)."""
+    anterior = getattr(_LOCAL_HILO, 'clave_sesion', None)
+    _LOCAL_HILO.clave_sesion = clave
+    try:
+        yield
+    finally:
+        _LOCAL_HILO.clave_sesion = anterior
+
+
+def en_sesion_actual(funcion):
+    """
+    Envuelve 'funcion' para ejecutarla en otro hilo (p. ej. un ThreadPoolExecutor) con el
+    cliente de la sesión que la envolvió: los hilos de trabajo no tienen contexto de Streamlit.
+    """
+    clave = clave_sesion_actual()
+
+    def envoltura(*args, **kwargs):
+        with usar_sesion(clave):
+            return funcion(*args, **kwargs)
+    return envoltura
+
+
+class _EntradaPool:
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.ultimo_uso = time.monotonic()
+        self.token_aplicado = None      # access_token que se aplicó/obtuvo en este cliente
+        self.sesion_refrescada = None   # sesión nueva emitida por el auto-refresh (pendiente de sincronizar)
+        self.token_en_estado = False    # el token ya está guardado en st.session_state (para detectar el logout)
+
+
+class PoolClientes:
+    """
+    Clientes por clave de sesión. crear_cliente() construye un cliente nuevo.
+    max_clientes: al superarlo se descarta el menos usado recientemente (LRU).
+    inactividad_s: los clientes sin uso durante ese tiempo se descartan.
+    """
+
+    def __init__(self, crear_cliente, max_clientes=50, inactividad_s=1800):
+        self._crear_cliente = crear_cliente
+        self.max_clientes = max_clientes
+        self.inactividad_s = inactividad_s
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._metricas = {"creados": 0, "reutilizados": 0, "descartados": 0, "espera_total_ms": 0.0, "espera_max_ms": 0.0, "solicitudes": 0}
+
+    def entrada(self, clave):
+        """Devuelve (creando si hace falta) la entrada del pool para la clave de sesión."""
+        inicio = time.perf_counter()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                self._metricas["reutilizados"] += 1
+            else:
+                entrada = _EntradaPool(self._crear_cliente())
+                self._suscribir_refresco(entrada)
+                self._entradas[clave] = entrada
+                self._metricas["creados"] += 1
+                self._purgar()
+            entrada.ultimo_uso = time.monotonic()
+            espera_ms = (time.perf_counter() - inicio) * 1000
+            self._metricas["solicitudes"] += 1
+            self._metricas["espera_total_ms"] += espera_ms
+            self._metricas["espera_max_ms"] = max(self._metricas["espera_max_ms"], espera_ms)
+        return entrada
+
+    def cliente(self, clave):
+        return self.entrada(clave).cliente
+
+    def descartar(self, clave):
+        with self._lock:
+            entrada = self._entradas.pop(clave, None)
+            if entrada is not None:
+                self._cerrar(entrada)
+
+    def metricas(self):
+        """Tamaño del pool y tiempos de espera para obtener un cliente (en ms)."""
+        with self._lock:
+            m = dict(self._metricas)
+            tamano = len(self._entradas)
+        return {
+            "tamano": tamano,
+            "max_clientes": self.max_clientes,
+            "creados": m["creados"],
+            "reutilizados": m["reutilizados"],
+            "descartados": m["descartados"],
+            "espera_promedio_ms": m["espera_total_ms"] / m["solicitudes"] if m["solicitudes"] else 0.0,
+            "espera_max_ms": m["espera_max_ms"],
+        }
+
+    # --- Internos (se llaman con el lock tomado) ---
+    def _purgar(self):
+        ahora = time.monotonic()
+        for clave in [c for c, e in self._entradas.items() if ahora - e.ultimo_uso > self.inactividad_s]:
+            self._cerrar(self._entradas.pop(clave))
+        while len(self._entradas) > self.max_clientes:
+            _, entrada = self._entradas.popitem(last=False)
+            self._cerrar(entrada)
+
+    def _cerrar(self, entrada):
+        # No se llama a sign_out(): revocaría el token del usuario en el servidor.
+        # Solo se detiene el timer de auto-refresh del cliente descartado.
+        timer = getattr(entrada.cliente.auth, '_refresh_token_timer', None)
+        if timer is not None:
+            timer.cancel()
+        self._metricas["descartados"] += 1
+
+    @staticmethod
+    def _suscribir_refresco(entrada):
+        def al_cambiar_auth(evento, sesion):
+            if evento == "TOKEN_REFRESHED" and sesion is not None:
+                entrada.token_aplicado = sesion.access_token
+                entrada.sesion_refrescada = sesion   # Session, el mismo tipo que guarda App_Web tras el login
+        entrada.cliente.auth.on_auth_state_change(al_cambiar_auth)
@@ -0,0 +1,29 @@
+-- Totales de la tabla 'pagos' (Rayo / POS) agrupados por método de pago
+-- para una sucursal y una ventana de tiempo [p_desde, p_hasta).
+-- Reemplaza la descarga de todas las filas del día para sumarlas en la app:
+-- la respuesta es una fila por método de pago.
+
+create index if not exists pagos_sucursal_created_at_idx
+    on public.pagos (sucursal, created_at);
+
+create or replace function public.totales_pagos_por_metodo(
+    p_sucursal text,
+    p_desde timestamptz,
+    p_hasta timestamptz
+)
+returns table (metodo_pago text, total numeric, cantidad bigint)
+language sql
+stable
+as $$
+    select p.metodo_pago,
+           coalesce(sum(p.monto), 0) as total,
+           count(*) as cantidad
+    from public.pagos p
+    where p.sucursal = p_sucursal
+      and p.created_at >= p_desde
+      and p.created_at < p_hasta
+    group by p.metodo_pago
+    order by p.metodo_pago;
+$$;
+
+grant execute on function public.totales_pagos_por_metodo(text, timestamptz, timestamptz) to authenticated;
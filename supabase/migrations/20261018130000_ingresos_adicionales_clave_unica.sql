@@ -0,0 +1,33 @@
+-- Clave única (cierre_id, socio_id, metodo_pago) en ingresos_adicionales.
+-- Permite guardar el formulario de ingresos adicionales con un solo upsert
+-- (on_conflict = 'cierre_id,socio_id,metodo_pago'), ver guardar_ingresos_adicionales_lote.
+
+-- Si existen filas duplicadas para la misma celda se fusionan en la más reciente: el saldo
+-- teórico y el resumen del día sumaban todas las filas, así que la fila conservada pasa a
+-- tener la suma de los montos (y las notas no vacías, unidas) y los totales no cambian.
+update public.ingresos_adicionales a
+set monto = d.monto_total,
+    notas = coalesce(d.notas, a.notas)
+from (
+    select distinct on (cierre_id, socio_id, metodo_pago)
+           id,
+           sum(monto) over celda as monto_total,
+           string_agg(nullif(notas, ''), ' | ') over celda as notas,
+           count(*) over celda as filas
+    from public.ingresos_adicionales
+    window celda as (partition by cierre_id, socio_id, metodo_pago)
+    order by cierre_id, socio_id, metodo_pago, created_at desc, id::text desc
+) d
+where a.id = d.id
+  and d.filas > 1;
+
+delete from public.ingresos_adicionales a
+using public.ingresos_adicionales b
+where a.cierre_id = b.cierre_id
+  and a.socio_id = b.socio_id
+  and a.metodo_pago = b.metodo_pago
+  and (a.created_at, a.id::text) < (b.created_at, b.id::text);
+
+alter table public.ingresos_adicionales
+    add constraint ingresos_adicionales_cierre_socio_metodo_key
+    unique (cierre_id, socio_id, metodo_pago);
@@ -0,0 +1,63 @@
+-- Totales de 'pagos' por método posteriores a una marca de agua (created_at, id).
+-- La app guarda el agregado del día por (sucursal, ventana) y en cada refresco solo
+-- pide los pagos nuevos desde la última marca: el costo es proporcional a las ventas
+-- nuevas y no al día completo. Con p_marca_created_at null se agrega toda la ventana.
+--
+-- Los pagos con created_at anterior a now() - p_margen_s quedan "consolidados": se suman
+-- al agregado y mueven la marca. Los más recientes (una transacción del POS aún abierta
+-- podría insertar filas con un created_at menor) se devuelven aparte, con
+-- consolidado = false, y la app los suma sin guardarlos.
+--
+-- Cada fila lleva la nueva marca (la del último pago consolidado, o null si no hay).
+
+create or replace function public.totales_pagos_delta(
+    p_sucursal text,
+    p_desde timestamptz,
+    p_hasta timestamptz,
+    p_marca_created_at timestamptz default null,
+    p_marca_id text default null,
+    p_margen_s integer default 30
+)
+returns table (
+    metodo_pago text,
+    consolidado boolean,
+    total numeric,
+    cantidad bigint,
+    marca_created_at timestamptz,
+    marca_id text
+)
+language sql
+stable
+as $$
+    with nuevos as (
+        select p.metodo_pago,
+               p.monto,
+               p.created_at,
+               p.id::text as id,
+               p.created_at < now() - make_interval(secs => p_margen_s) as consolidado
+        from public.pagos p
+        where p.sucursal = p_sucursal
+          and p.created_at >= greatest(p_desde, coalesce(p_marca_created_at, p_desde))
+          and p.created_at < p_hasta
+          and (p_marca_created_at is null or (p.created_at, p.id::text) > (p_marca_created_at, p_marca_id))
+    ),
+    marca as (
+        select n.created_at, n.id
+        from nuevos n
+        where n.consolidado
+        order by n.created_at desc, n.id desc
+        limit 1
+    )
+    select n.metodo_pago,
+           n.consolidado,
+           coalesce(sum(n.monto), 0) as total,
+           count(*) as cantidad,
+           m.created_at as marca_created_at,
+           m.id as marca_id
+    from nuevos n
+    left join marca m on true
+    group by n.metodo_pago, n.consolidado, m.created_at, m.id
+    order by n.metodo_pago;
+$$;
+
+grant execute on function public.totales_pagos_delta(text, timestamptz, timestamptz, timestamptz, text, integer) to authenticated;
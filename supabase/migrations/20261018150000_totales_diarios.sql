@@ -0,0 +1,150 @@
+-- Totales diarios normalizados: una fila por (cierre, fuente, método de pago, tipo), con la
+-- fecha, la sucursal y el usuario del cierre. Se escriben al finalizar un cierre de caja
+-- (desde resumen_del_dia) o un cierre CDE (desde verificacion_metodos) y se borran al
+-- reabrir el cierre, así que los reportes históricos consultan una tabla angosta e indexada
+-- en lugar de expandir JSON.
+--
+--   fuente = 'Rayo (POS)'  -> tipo 'interno' / 'externo' (desglose_rayo del resumen)
+--   fuente = <socio>       -> tipo 'externo'              (totales_por_socio del resumen)
+--   fuente = 'CDE'         -> tipo 'verificado' / 'informativo' / 'efectivo';
+--                             total_reportado es el conteo manual
+--
+-- La clave incluye el cierre: varios cierres de la misma sucursal y día tienen cada uno sus
+-- filas (los reportes suman por fecha y sucursal). El cambio de estado y los totales se
+-- escriben en la misma transacción con cambiar_estado_cierre / finalizar_cierre_cde_con_totales:
+-- no puede quedar un cierre CERRADO sin totales ni totales de un cierre reabierto.
+
+create table if not exists public.totales_diarios (
+    id bigint generated always as identity primary key,
+    fecha date not null,
+    sucursal_id uuid not null references public.sucursales (id),
+    usuario_id uuid,
+    fuente text not null,
+    metodo_pago text not null,
+    tipo text,
+    total numeric(14, 2) not null default 0,
+    total_reportado numeric(14, 2),
+    cierre_id uuid references public.cierres_caja (id) on delete cascade,
+    cierre_cde_id uuid references public.cierres_cde (id) on delete cascade,
+    actualizado_en timestamptz not null default now(),
+    constraint totales_diarios_un_origen check (num_nonnulls(cierre_id, cierre_cde_id) = 1)
+);
+
+create unique index if not exists totales_diarios_cierre_key
+    on public.totales_diarios (cierre_id, fuente, metodo_pago, tipo) nulls not distinct
+    where cierre_id is not null;
+create unique index if not exists totales_diarios_cierre_cde_key
+    on public.totales_diarios (cierre_cde_id, fuente, metodo_pago, tipo) nulls not distinct
+    where cierre_cde_id is not null;
+create index if not exists totales_diarios_sucursal_fecha_idx on public.totales_diarios (sucursal_id, fecha);
+
+alter table public.totales_diarios enable row level security;
+
+drop policy if exists "totales_diarios_autenticados" on public.totales_diarios;
+create policy "totales_diarios_autenticados" on public.totales_diarios
+    for all to authenticated using (true) with check (true);
+
+-- Reemplaza los totales de un cierre de caja: borra los anteriores y, si está CERRADO,
+-- escribe los de su resumen_del_dia (sumando los ítems repetidos de la misma celda).
+create or replace function public.escribir_totales_diarios_cierre(p_cierre_id uuid)
+returns void
+language sql
+as $$
+    delete from public.totales_diarios where cierre_id = p_cierre_id;
+
+    insert into public.totales_diarios (fecha, sucursal_id, usuario_id, fuente, metodo_pago, tipo, total, cierre_id)
+    select c.fecha_operacion, c.sucursal_id, c.usuario_id, i.fuente, i.metodo, i.tipo, sum(i.total), c.id
+    from public.cierres_caja c
+    cross join lateral (
+        select 'Rayo (POS)'::text as fuente,
+               r ->> 'metodo' as metodo,
+               r ->> 'tipo' as tipo,
+               coalesce((r ->> 'total')::numeric, 0) as total
+        from jsonb_array_elements(coalesce(c.resumen_del_dia::jsonb -> 'desglose_rayo', '[]'::jsonb)) r
+        union all
+        select so ->> 'socio', d ->> 'metodo', 'externo', coalesce((d ->> 'total')::numeric, 0)
+        from jsonb_array_elements(coalesce(c.resumen_del_dia::jsonb -> 'totales_por_socio', '[]'::jsonb)) so
+        cross join lateral jsonb_array_elements(coalesce(so -> 'desglose', '[]'::jsonb)) d
+    ) i
+    where c.id = p_cierre_id
+      and c.estado = 'CERRADO'
+      and i.fuente is not null
+      and i.metodo is not null
+    group by c.fecha_operacion, c.sucursal_id, c.usuario_id, c.id, i.fuente, i.metodo, i.tipo;
+$$;
+
+-- Igual para un cierre CDE: una fila de efectivo y una por método de verificacion_metodos.
+create or replace function public.escribir_totales_diarios_cierre_cde(p_cierre_cde_id uuid)
+returns void
+language sql
+as $$
+    delete from public.totales_diarios where cierre_cde_id = p_cierre_cde_id;
+
+    insert into public.totales_diarios (fecha, sucursal_id, usuario_id, fuente, metodo_pago, tipo, total, total_reportado, cierre_cde_id)
+    select c.fecha_operacion, c.sucursal_id, c.usuario_id, 'CDE', 'Efectivo', 'efectivo',
+           coalesce(c.total_efectivo_sistema, 0), c.total_efectivo_contado, c.id
+    from public.cierres_cde c
+    where c.id = p_cierre_cde_id and c.estado = 'CERRADO'
+    union all
+    select c.fecha_operacion, c.sucursal_id, c.usuario_id, 'CDE', m.key, m.value ->> 'tipo',
+           coalesce((m.value ->> 'total_sistema')::numeric, 0), (m.value ->> 'total_manual')::numeric, c.id
+    from public.cierres_cde c
+    cross join lateral jsonb_each(coalesce(c.verificacion_metodos::jsonb, '{}'::jsonb)) m
+    where c.id = p_cierre_cde_id and c.estado = 'CERRADO' and m.key <> 'Efectivo';
+$$;
+
+-- Finalizar (p_estado = 'CERRADO') o reabrir (p_estado = 'ABIERTO') un cierre de caja junto
+-- con sus totales. Devuelve la fila actualizada (vacío si el cierre no existe).
+create or replace function public.cambiar_estado_cierre(
+    p_cierre_id uuid,
+    p_estado text,
+    p_fecha_hora_cierre_real timestamptz default null,
+    p_nota_discrepancia text default null
+)
+returns setof public.cierres_caja
+language plpgsql
+as $$
+begin
+    if p_estado = 'CERRADO' then
+        update public.cierres_caja
+        set estado = p_estado,
+            fecha_hora_cierre_real = p_fecha_hora_cierre_real,
+            nota_discrepancia = p_nota_discrepancia
+        where id = p_cierre_id;
+    else
+        update public.cierres_caja set estado = p_estado where id = p_cierre_id;
+    end if;
+
+    if found then
+        perform public.escribir_totales_diarios_cierre(p_cierre_id);
+    end if;
+    return query select * from public.cierres_caja where id = p_cierre_id;
+end;
+$$;
+
+create or replace function public.finalizar_cierre_cde_con_totales(
+    p_cierre_cde_id uuid,
+    p_discrepancia boolean default false
+)
+returns setof public.cierres_cde
+language plpgsql
+as $$
+begin
+    update public.cierres_cde
+    set estado = 'CERRADO',
+        discrepancia = p_discrepancia
+    where id = p_cierre_cde_id;
+
+    if found then
+        perform public.escribir_totales_diarios_cierre_cde(p_cierre_cde_id);
+    end if;
+    return query select * from public.cierres_cde where id = p_cierre_cde_id;
+end;
+$$;
+
+grant execute on function public.cambiar_estado_cierre(uuid, text, timestamptz, text) to authenticated;
+grant execute on function public.finalizar_cierre_cde_con_totales(uuid, boolean) to authenticated;
+
+-- Carga inicial con los cierres ya cerrados
+select public.escribir_totales_diarios_cierre(id) from public.cierres_caja where estado = 'CERRADO';
+select public.escribir_totales_diarios_cierre_cde(id) from public.cierres_cde where estado = 'CERRADO';
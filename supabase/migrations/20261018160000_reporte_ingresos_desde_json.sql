@@ -0,0 +1,121 @@
+-- Reporte de ingresos (pestaña "Análisis de Ingresos" de 1_Reportes_Admin.py, a través del
+-- cubo de ingresos) calculado en la base de datos: los cierres CERRADOS se leen de
+-- totales_diarios y solo se expande resumen_del_dia de los que siguen abiertos.
+--
+-- Todos los filtros se aplican aquí (fechas, una o varias sucursales, usuario, fuente,
+-- método de pago y socio) y solo viajan filas ya agregadas por
+-- (fecha, sucursal, usuario, fuente, método, tipo), o también por cierre si p_por_cierre
+-- (el cubo necesita la contribución de cada cierre para actualizarlo de forma incremental):
+--   fuente = 'Rayo (POS)' para desglose_rayo, o el nombre del socio para totales_por_socio.
+-- total_filas repite en cada fila el total del resultado (para paginar con
+-- p_limite / p_desplazamiento y mostrar el progreso).
+
+-- Se eliminan las versiones anteriores (con otra firma) para no dejar sobrecargas ambiguas
+do $$
+declare
+    funcion regprocedure;
+begin
+    for funcion in
+        select p.oid::regprocedure
+        from pg_proc p
+        join pg_namespace n on n.oid = p.pronamespace
+        where n.nspname = 'public' and p.proname = 'reporte_ingresos_desde_json'
+    loop
+        execute format('drop function %s', funcion);
+    end loop;
+end $$;
+
+create index if not exists cierres_caja_fecha_resumen_idx
+    on public.cierres_caja (fecha_operacion)
+    where resumen_del_dia is not null;
+
+create or replace function public.reporte_ingresos_desde_json(
+    fecha_inicio date default null,
+    fecha_fin date default null,
+    p_sucursal_id uuid default null,
+    p_usuario_id uuid default null,
+    p_metodo_pago text default null,
+    p_socio_id uuid default null,
+    p_sucursal_ids uuid[] default null,
+    p_fuente text default null,
+    p_por_cierre boolean default false,
+    p_limite integer default null,
+    p_desplazamiento integer default 0
+)
+returns table (
+    fecha date,
+    sucursal_id uuid,
+    sucursal text,
+    usuario_id uuid,
+    usuario text,
+    cierre_id uuid,
+    fuente text,
+    metodo text,
+    tipo text,
+    total numeric,
+    total_filas bigint
+)
+language sql
+stable
+as $$
+    with cierres as (
+        select c.id, c.fecha_operacion, c.sucursal_id, c.usuario_id, c.estado,
+               c.resumen_del_dia::jsonb as resumen
+        from public.cierres_caja c
+        where c.resumen_del_dia is not null
+          and (fecha_inicio is null or c.fecha_operacion >= fecha_inicio)
+          and (fecha_fin is null or c.fecha_operacion <= fecha_fin)
+          and (p_sucursal_id is null or c.sucursal_id = p_sucursal_id)
+          and (p_sucursal_ids is null or c.sucursal_id = any (p_sucursal_ids))
+          and (p_usuario_id is null or c.usuario_id = p_usuario_id)
+    ),
+    items as (
+        -- Cierres cerrados: totales ya materializados al finalizar
+        select c.id, c.fecha_operacion, c.sucursal_id, c.usuario_id,
+               t.fuente, t.metodo_pago as metodo, t.tipo, t.total
+        from cierres c
+        join public.totales_diarios t on t.cierre_id = c.id
+        where c.estado = 'CERRADO'
+        union all
+        select c.id, c.fecha_operacion, c.sucursal_id, c.usuario_id,
+               'Rayo (POS)'::text,
+               r ->> 'metodo',
+               r ->> 'tipo',
+               (r ->> 'total')::numeric
+        from cierres c
+        cross join lateral jsonb_array_elements(coalesce(c.resumen -> 'desglose_rayo', '[]'::jsonb)) r
+        where c.estado <> 'CERRADO'
+        union all
+        select c.id, c.fecha_operacion, c.sucursal_id, c.usuario_id,
+               so ->> 'socio',
+               d ->> 'metodo',
+               'externo',
+               (d ->> 'total')::numeric
+        from cierres c
+        cross join lateral jsonb_array_elements(coalesce(c.resumen -> 'totales_por_socio', '[]'::jsonb)) so
+        cross join lateral jsonb_array_elements(coalesce(so -> 'desglose', '[]'::jsonb)) d
+        where c.estado <> 'CERRADO'
+    ),
+    agregado as (
+        select i.fecha_operacion, i.sucursal_id, i.usuario_id,
+               case when p_por_cierre then i.id end as cierre_id,
+               i.fuente, i.metodo, i.tipo, sum(i.total) as total
+        from items i
+        where (p_metodo_pago is null or i.metodo = p_metodo_pago)
+          and (p_fuente is null or i.fuente = p_fuente)
+          and (p_socio_id is null or i.fuente = (select so.nombre from public.socios so where so.id = p_socio_id))
+        group by 1, 2, 3, 4, 5, 6, 7
+    )
+    select a.fecha_operacion, a.sucursal_id, coalesce(s.sucursal, 'N/A'), a.usuario_id, coalesce(u.nombre, 'N/A'),
+           a.cierre_id, a.fuente, a.metodo, a.tipo, a.total,
+           count(*) over () as total_filas
+    from agregado a
+    left join public.sucursales s on s.id = a.sucursal_id
+    left join public.perfiles u on u.id = a.usuario_id
+    order by a.fecha_operacion desc, s.sucursal, u.nombre, a.fuente, a.metodo, a.tipo,
+             a.sucursal_id, a.usuario_id, a.cierre_id
+    limit p_limite
+    offset p_desplazamiento;
+$$;
+
+grant execute on function public.reporte_ingresos_desde_json(date, date, uuid, uuid, text, uuid, uuid[], text, boolean, integer, integer) to authenticated;
@@ -0,0 +1,76 @@
+-- Registro y eliminación de un delivery junto con su gasto de repartidor en una sola
+-- llamada (y una sola transacción). Antes la app hacía dos peticiones seguidas
+-- (gastos_caja y luego cierre_delivery): si fallaba la segunda, quedaba un gasto sin
+-- delivery (o al revés al eliminar).
+--
+-- Ambas devuelven {"delivery": <fila de cierre_delivery>, "gasto": <fila de gastos_caja o null>}.
+
+create or replace function public.registrar_delivery_con_gasto(
+    p_cierre_id uuid,
+    p_usuario_id uuid,
+    p_sucursal_id uuid,
+    p_sucursal_nombre text,
+    p_monto_cobrado numeric,
+    p_costo_repartidor numeric,
+    p_origen_nombre text,
+    p_notas text,
+    p_categoria_gasto_id uuid,
+    p_nota_gasto text
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_gasto public.gastos_caja;
+    v_delivery public.cierre_delivery;
+begin
+    -- El gasto en efectivo solo se crea si el repartidor cobró algo
+    if coalesce(p_costo_repartidor, 0) > 0 then
+        insert into public.gastos_caja (cierre_id, categoria_id, monto, notas, usuario_id, sucursal_id, sucursal)
+        values (p_cierre_id, p_categoria_gasto_id, p_costo_repartidor, p_nota_gasto, p_usuario_id, p_sucursal_id, p_sucursal_nombre)
+        returning * into v_gasto;
+    end if;
+
+    insert into public.cierre_delivery (
+        cierre_id, usuario_id, sucursal_id, monto_cobrado, costo_repartidor, origen_nombre, notas, gasto_asociado_id
+    )
+    values (
+        p_cierre_id, p_usuario_id, p_sucursal_id, p_monto_cobrado, p_costo_repartidor, p_origen_nombre, p_notas, v_gasto.id
+    )
+    returning * into v_delivery;
+
+    return jsonb_build_object(
+        'delivery', to_jsonb(v_delivery),
+        'gasto', case when v_gasto.id is null then null else to_jsonb(v_gasto) end
+    );
+end;
+$$;
+
+-- Borra el delivery y su gasto asociado. El gasto se toma de la fila del delivery; si el
+-- delivery ya no existe se usa p_gasto_asociado_id (limpia un gasto que quedó huérfano).
+create or replace function public.eliminar_delivery_con_gasto(
+    p_delivery_id uuid,
+    p_gasto_asociado_id uuid default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_gasto public.gastos_caja;
+    v_delivery public.cierre_delivery;
+begin
+    delete from public.cierre_delivery where id = p_delivery_id
+    returning * into v_delivery;
+
+    delete from public.gastos_caja where id = coalesce(v_delivery.gasto_asociado_id, p_gasto_asociado_id)
+    returning * into v_gasto;
+
+    return jsonb_build_object(
+        'delivery', case when v_delivery.id is null then null else to_jsonb(v_delivery) end,
+        'gasto', case when v_gasto.id is null then null else to_jsonb(v_gasto) end
+    );
+end;
+$$;
+
+grant execute on function public.registrar_delivery_con_gasto(uuid, uuid, uuid, text, numeric, numeric, text, text, uuid, text) to authenticated;
+grant execute on function public.eliminar_delivery_con_gasto(uuid, uuid) to authenticated;
@@ -0,0 +1,47 @@
+-- Borrado masivo de deliveries (con su gasto de repartidor) en una sola llamada.
+-- Cada delivery se borra en su propio subbloque (savepoint): si uno falla, los demás
+-- se borran igual y la función devuelve una fila por id con el resultado:
+--   eliminado = false y motivo = null  -> el delivery no existe (o no es visible)
+--   eliminado = false y motivo <> null -> el borrado falló (mensaje de Postgres)
+-- cierre_id permite a la app invalidar las cachés de los cierres afectados.
+
+create or replace function public.eliminar_deliveries_con_gasto(
+    p_delivery_ids uuid[]
+)
+returns table (
+    delivery_id uuid,
+    cierre_id uuid,
+    gasto_id uuid,
+    eliminado boolean,
+    motivo text
+)
+language plpgsql
+as $$
+declare
+    v_id uuid;
+    v_delivery public.cierre_delivery;
+begin
+    foreach v_id in array coalesce(p_delivery_ids, '{}'::uuid[]) loop
+        delivery_id := v_id;
+        cierre_id := null;
+        gasto_id := null;
+        eliminado := false;
+        motivo := null;
+        begin
+            delete from public.cierre_delivery d where d.id = v_id
+            returning * into v_delivery;
+            if found then
+                delete from public.gastos_caja g where g.id = v_delivery.gasto_asociado_id;
+                cierre_id := v_delivery.cierre_id;
+                gasto_id := v_delivery.gasto_asociado_id;
+                eliminado := true;
+            end if;
+        exception when others then
+            motivo := sqlerrm;
+        end;
+        return next;
+    end loop;
+end;
+$$;
+
+grant execute on function public.eliminar_deliveries_con_gasto(uuid[]) to authenticated;
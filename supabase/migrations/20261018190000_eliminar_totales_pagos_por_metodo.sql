@@ -0,0 +1,5 @@
+-- totales_pagos_por_metodo quedó sin uso: la app pide los totales de 'pagos' con
+-- totales_pagos_delta (agregado incremental por marca de agua). Se conserva el índice
+-- pagos_sucursal_created_at_idx, que también usa totales_pagos_delta.
+
+drop function if exists public.totales_pagos_por_metodo(text, timestamptz, timestamptz);
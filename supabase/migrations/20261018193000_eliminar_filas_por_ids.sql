@@ -0,0 +1,48 @@
+-- Borrado masivo de gastos (gastos_caja) o compras (cierre_compras) en una sola llamada,
+-- con el mismo contrato que eliminar_deliveries_con_gasto: cada fila se borra en su propio
+-- subbloque (savepoint), así que si una falla (p. ej. un gasto referenciado por un delivery)
+-- las demás se borran igual, y la función devuelve una fila por id:
+--   eliminado = false y motivo = null  -> la fila no existe (o no es visible)
+--   eliminado = false y motivo <> null -> el borrado falló (mensaje de Postgres)
+-- cierre_id permite a la app invalidar las cachés de los cierres afectados.
+
+create or replace function public.eliminar_filas_por_ids(
+    p_tabla text,
+    p_ids uuid[]
+)
+returns table (
+    id uuid,
+    cierre_id uuid,
+    eliminado boolean,
+    motivo text
+)
+language plpgsql
+as $$
+declare
+    v_id uuid;
+begin
+    -- El nombre de la tabla va en SQL dinámico: solo se aceptan las tablas de los borrados masivos
+    if p_tabla not in ('gastos_caja', 'cierre_compras') then
+        raise exception 'eliminar_filas_por_ids: tabla no permitida: %', p_tabla;
+    end if;
+
+    foreach v_id in array coalesce(p_ids, '{}'::uuid[]) loop
+        id := v_id;
+        cierre_id := null;
+        eliminado := false;
+        motivo := null;
+        begin
+            execute format('delete from public.%I t where t.id = $1 returning t.cierre_id', p_tabla)
+            into cierre_id
+            using v_id;
+            eliminado := found;
+        exception when others then
+            cierre_id := null;
+            motivo := sqlerrm;
+        end;
+        return next;
+    end loop;
+end;
+$$;
+
+grant execute on function public.eliminar_filas_por_ids(text, uuid[]) to authenticated;
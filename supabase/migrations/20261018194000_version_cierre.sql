@@ -0,0 +1,80 @@
+-- Versión de un cierre de caja en el servidor (ver almacen_cierre.py y database.version_cierre).
+-- Avanza en uno por cada TRANSACCIÓN que escribe en el cierre o en sus tablas hijas (gastos,
+-- ingresos adicionales, delivery y compras): una petición de PostgREST o una llamada RPC es
+-- una transacción, así que cada escritura de la app avanza la versión exactamente en uno,
+-- sin importar cuántas filas toque. version_transaccion guarda el txid que la avanzó por
+-- última vez para no contar dos veces la misma transacción.
+--
+-- Si tras una escritura propia la versión avanzó más de uno, otra sesión (de este u otro
+-- servidor de la app) escribió en medio y la página recarga el cierre.
+
+alter table public.cierres_caja
+    add column if not exists version bigint not null default 0,
+    add column if not exists version_transaccion bigint;
+
+-- Escrituras sobre la propia fila del cierre
+create or replace function public.avanzar_version_cierre()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- Si ya cambió la versión en esta sentencia (lo hace avanzar_version_cierre_hijas) no se suma otra vez
+    if new.version is not distinct from old.version
+       and old.version_transaccion is distinct from txid_current() then
+        new.version := old.version + 1;
+        new.version_transaccion := txid_current();
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists cierres_caja_version on public.cierres_caja;
+create trigger cierres_caja_version
+    before update on public.cierres_caja
+    for each row execute function public.avanzar_version_cierre();
+
+-- Escrituras sobre las tablas hijas: avanzan el cierre viejo y el nuevo (si cambió cierre_id)
+create or replace function public.avanzar_version_cierre_hijas()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_cierres uuid[];
+begin
+    if tg_op = 'INSERT' then
+        v_cierres := array[new.cierre_id];
+    elsif tg_op = 'DELETE' then
+        v_cierres := array[old.cierre_id];
+    else
+        v_cierres := array[old.cierre_id, new.cierre_id];
+    end if;
+
+    update public.cierres_caja
+    set version = version + 1,
+        version_transaccion = txid_current()
+    where id = any(v_cierres)
+      and version_transaccion is distinct from txid_current();
+
+    return null;
+end;
+$$;
+
+drop trigger if exists gastos_caja_version_cierre on public.gastos_caja;
+create trigger gastos_caja_version_cierre
+    after insert or update or delete on public.gastos_caja
+    for each row execute function public.avanzar_version_cierre_hijas();
+
+drop trigger if exists ingresos_adicionales_version_cierre on public.ingresos_adicionales;
+create trigger ingresos_adicionales_version_cierre
+    after insert or update or delete on public.ingresos_adicionales
+    for each row execute function public.avanzar_version_cierre_hijas();
+
+drop trigger if exists cierre_delivery_version_cierre on public.cierre_delivery;
+create trigger cierre_delivery_version_cierre
+    after insert or update or delete on public.cierre_delivery
+    for each row execute function public.avanzar_version_cierre_hijas();
+
+drop trigger if exists cierre_compras_version_cierre on public.cierre_compras;
+create trigger cierre_compras_version_cierre
+    after insert or update or delete on public.cierre_compras
+    for each row execute function public.avanzar_version_cierre_hijas();
@@ -0,0 +1,7 @@
+# tests/conftest.py
+# Los módulos de la app están en la raíz del repositorio (sin paquete): se agregan al path.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
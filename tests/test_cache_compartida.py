@@ -0,0 +1,100 @@
+# tests/test_cache_compartida.py
+# Pruebas de la caché compartida (cache_compartida.py) y de etiquetas.cache_data, que la usa:
+# versiones, single-flight y stale-while-revalidate.
+#
+# Uso:  python -m pytest -q
+
+import threading
+import time
+
+import pytest
+
+import etiquetas
+from cache_compartida import CacheCompartida
+
+
+def contador(resultado=("datos", None), espera=0.0):
+    llamadas = []
+
+    def cargar():
+        llamadas.append(1)
+        time.sleep(espera)
+        return resultado
+    return cargar, llamadas
+
+
+def test_acierto_y_version_distinta():
+    cache = CacheCompartida("la prueba", ttl_obsoleto=0)
+    cargar, llamadas = contador()
+    assert cache.obtener('k', (1,), cargar, ttl=60) == ("datos", None)
+    assert cache.obtener('k', (1,), cargar, ttl=60) == ("datos", None)
+    assert len(llamadas) == 1
+    cache.obtener('k', (2,), cargar, ttl=60)
+    assert len(llamadas) == 2
+
+
+def test_los_errores_no_se_guardan():
+    cache = CacheCompartida("la prueba", ttl_obsoleto=0)
+    cargar, llamadas = contador(resultado=(None, "falló"))
+    assert cache.obtener('k', (), cargar, ttl=60) == (None, "falló")
+    cache.obtener('k', (), cargar, ttl=60)
+    assert len(llamadas) == 2
+
+
+def test_single_flight_una_carga_para_lecturas_simultaneas():
+    cache = CacheCompartida("la prueba", ttl_obsoleto=0)
+    cargar, llamadas = contador(espera=0.2)
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(cache.obtener('k', (), cargar, ttl=60))) for _ in range(10)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(llamadas) == 1 and resultados == [("datos", None)] * 10
+    assert cache.estadisticas()["coalescidas"] == 9
+
+
+def test_entrada_expirada_se_sirve_mientras_se_recarga():
+    cache = CacheCompartida("la prueba", ttl_obsoleto=60)
+    cache.obtener('k', (), lambda: ("viejo", None), ttl=0)
+    cargar, llamadas = contador(resultado=("nuevo", None), espera=0.1)
+    assert cache.obtener('k', (), cargar, ttl=60) == ("viejo", None)
+    assert cache.obtener('k', (), cargar, ttl=60) == ("viejo", None)   # la recarga sigue en curso
+    time.sleep(0.3)
+    assert cache.obtener('k', (), cargar, ttl=60) == ("nuevo", None)
+    assert len(llamadas) == 1 and cache.estadisticas()["recargas"] == 1
+
+
+def test_max_entradas():
+    cache = CacheCompartida("la prueba", ttl_obsoleto=0, max_entradas=2)
+    for clave in ('a', 'b', 'c'):
+        cache.obtener(clave, (), lambda: (clave, None), ttl=60)
+    cargar, llamadas = contador()
+    cache.obtener('a', (), cargar, ttl=60)
+    assert len(llamadas) == 1
+
+
+def test_cache_data_por_etiquetas():
+    llamadas = []
+
+    @etiquetas.cache_data(lambda cierre_ids: [etiquetas.cierre(i) for i in cierre_ids], ttl=60)
+    def detalles(cierre_ids):
+        llamadas.append(list(cierre_ids))
+        return {i: len(llamadas) for i in cierre_ids}, None
+
+    assert detalles(['x1', 'x2']) == ({'x1': 1, 'x2': 1}, None)
+    assert detalles(['x1', 'x2']) == ({'x1': 1, 'x2': 1}, None)
+    etiquetas.invalidar(etiquetas.cierre('x2'))
+    assert detalles(['x1', 'x2']) == ({'x1': 2, 'x2': 2}, None)
+    detalles.clear()
+    detalles(['x1', 'x2'])
+    assert len(llamadas) == 3
+
+
+def test_cache_data_relanza_las_excepciones():
+    @etiquetas.cache_data(lambda: [])
+    def falla():
+        raise ValueError("sin conexión")
+
+    with pytest.raises(ValueError):
+        falla()
@@ -0,0 +1,414 @@
+# tests/test_db_local.py
+# Pruebas del backend local (db_local.py): el constructor de consultas debe comportarse como
+# postgrest-py contra Supabase (filtros, embebidos, claves únicas, FKs) y las funciones RPC
+# locales como sus equivalentes SQL de supabase/migrations/.
+#
+# Uso:  python -m pytest -q
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from supabase_auth.types import AuthResponse, Session
+
+import db_local
+from db_local import ClienteLocal, ErrorLocal
+
+
+@pytest.fixture
+def cliente(tmp_path):
+    cliente = ClienteLocal(':memory:', carpeta_storage=str(tmp_path))
+    cliente.cargar_datos({
+        'sucursales': [{'id': 's1', 'sucursal': 'Centro'}, {'id': 's2', 'sucursal': 'Norte'}],
+        'perfiles': [{'id': 'u1', 'nombre': 'Ana', 'rol': 'admin'}],
+        'gastos_categorias': [{'id': 'g1', 'nombre': 'Repartidores'}, {'id': 'g2', 'nombre': 'Limpieza'}],
+        'socios': [{'id': 'so1', 'nombre': 'Socio A'}],
+        'cierres_caja': [
+            {'id': 'c1', 'sucursal_id': 's1', 'usuario_id': 'u1', 'fecha_operacion': '2026-10-01', 'estado': 'CERRADO', 'resumen_del_dia': None},
+            {'id': 'c2', 'sucursal_id': 's1', 'usuario_id': 'u1', 'fecha_operacion': '2026-10-02', 'estado': 'ABIERTO', 'resumen_del_dia': {'x': 1}},
+            {'id': 'c3', 'sucursal_id': 's2', 'usuario_id': 'u1', 'fecha_operacion': '2026-10-02', 'estado': 'ABIERTO', 'resumen_del_dia': None},
+        ],
+        'gastos_caja': [
+            {'id': 'ga1', 'cierre_id': 'c1', 'categoria_id': 'g1', 'monto': 5, 'notas': 'Pedido 12', 'created_at': '2026-10-01T10:00:00+00:00'},
+            {'id': 'ga2', 'cierre_id': 'c1', 'categoria_id': 'g2', 'monto': 7.5, 'notas': 'escoba', 'created_at': '2026-10-01T11:00:00+00:00'},
+            {'id': 'ga3', 'cierre_id': 'c2', 'categoria_id': 'g1', 'monto': 3, 'notas': None, 'created_at': '2026-10-02T09:00:00+00:00'},
+        ],
+        'auth_usuarios': [{'id': 'u1', 'email': 'ana@x', 'password': 'secreta'}],
+    })
+    return cliente
+
+
+def ids(respuesta):
+    return [fila['id'] for fila in respuesta.data]
+
+
+# --- Filtros ---
+
+def test_filtros_de_comparacion(cliente):
+    def gastos():
+        return cliente.table('gastos_caja')
+    assert ids(gastos().select('id').eq('cierre_id', 'c1').order('id').execute()) == ['ga1', 'ga2']
+    assert ids(gastos().select('id').neq('cierre_id', 'c1').execute()) == ['ga3']
+    assert ids(gastos().select('id').gt('monto', 5).execute()) == ['ga2']
+    assert ids(gastos().select('id').gte('monto', 5).order('id').execute()) == ['ga1', 'ga2']
+    assert ids(gastos().select('id').lt('monto', 5).execute()) == ['ga3']
+    assert ids(gastos().select('id').lte('monto', 3).execute()) == ['ga3']
+
+
+def test_in_vacio_no_devuelve_filas(cliente):
+    assert cliente.table('gastos_caja').select('id').in_('id', []).execute().data == []
+    assert ids(cliente.table('gastos_caja').select('id').in_('id', ['ga1', 'ga3']).order('id').execute()) == ['ga1', 'ga3']
+
+
+def test_is_null_y_not(cliente):
+    assert ids(cliente.table('cierres_caja').select('id').is_('resumen_del_dia', None).order('id').execute()) == ['c1', 'c3']
+    assert ids(cliente.table('cierres_caja').select('id').not_.is_('resumen_del_dia', None).execute()) == ['c2']
+
+
+def test_like_e_ilike(cliente):
+    assert ids(cliente.table('gastos_caja').select('id').like('notas', 'Pedido*').execute()) == ['ga1']
+    assert ids(cliente.table('gastos_caja').select('id').ilike('notas', '%ESCOBA%').execute()) == ['ga2']
+
+
+def test_or_con_and_anidado_como_la_paginacion_keyset(cliente):
+    # Mismo filtro que database._paginar_keyset: filas "anteriores" a (fecha, id)
+    filtro = 'fecha_operacion.lt."2026-10-02",and(fecha_operacion.eq."2026-10-02",id.lt."c3")'
+    respuesta = cliente.table('cierres_caja').select('id').or_(filtro).order('id').execute()
+    assert ids(respuesta) == ['c1', 'c2']
+
+
+def test_filtros_de_timestamp_comparan_en_utc(cliente):
+    # 06:00-05:00 es 11:00 UTC: incluye ga2 aunque el texto sea "menor"
+    respuesta = cliente.table('gastos_caja').select('id').gte('created_at', '2026-10-01T06:00:00-05:00').order('id').execute()
+    assert ids(respuesta) == ['ga2', 'ga3']
+
+
+def test_columna_invalida(cliente):
+    with pytest.raises(ErrorLocal) as error:
+        cliente.table('gastos_caja').select('id').eq('monto; drop', 1).execute()
+    assert error.value.code == '42703'
+
+
+# --- Orden, paginación, conteo y single ---
+
+def test_orden_rango_y_conteo(cliente):
+    respuesta = cliente.table('gastos_caja').select('id', count='exact').order('monto', desc=True).range(0, 1).execute()
+    assert ids(respuesta) == ['ga2', 'ga1']
+    assert respuesta.count == 3
+    assert ids(cliente.table('gastos_caja').select('id').order('monto').limit(1).offset(1).execute()) == ['ga1']
+
+
+def test_single_y_maybe_single(cliente):
+    assert cliente.table('sucursales').select('*').eq('id', 's1').single().execute().data['sucursal'] == 'Centro'
+    assert cliente.table('sucursales').select('*').eq('id', 'nope').maybe_single().execute() is None
+    with pytest.raises(ErrorLocal) as error:
+        cliente.table('sucursales').select('*').eq('id', 'nope').single().execute()
+    assert error.value.code == 'PGRST116'
+    with pytest.raises(ErrorLocal):
+        cliente.table('sucursales').select('*').maybe_single().execute()
+
+
+# --- Embebidos ---
+
+def test_embebido_a_uno(cliente):
+    respuesta = cliente.table('gastos_caja').select('id, monto, gastos_categorias(nombre)').eq('id', 'ga2').single().execute()
+    assert respuesta.data == {'id': 'ga2', 'monto': 7.5, 'gastos_categorias': {'nombre': 'Limpieza'}}
+
+
+def test_embebido_a_muchos_desde_el_cierre(cliente):
+    respuesta = cliente.table('cierres_caja').select('id, gastos_caja(id, monto)').in_('id', ['c1', 'c3']).order('id').execute()
+    assert respuesta.data == [
+        {'id': 'c1', 'gastos_caja': [{'id': 'ga1', 'monto': 5}, {'id': 'ga2', 'monto': 7.5}]},
+        {'id': 'c3', 'gastos_caja': []},
+    ]
+
+
+def test_embebido_sin_relacion(cliente):
+    with pytest.raises(ErrorLocal) as error:
+        cliente.table('gastos_caja').select('id, cierres_cde(id)').execute()
+    assert error.value.code == 'PGRST200'
+
+
+# --- Escrituras ---
+
+def test_insert_devuelve_filas_con_id_y_select(cliente):
+    respuesta = cliente.table('gastos_caja').insert({'cierre_id': 'c2', 'categoria_id': 'g2', 'monto': 1}) \
+        .select('id, monto, gastos_categorias(nombre)').execute()
+    fila = respuesta.data[0]
+    assert fila['id'] and fila['monto'] == 1 and fila['gastos_categorias'] == {'nombre': 'Limpieza'}
+    assert set(fila) == {'id', 'monto', 'gastos_categorias'}
+
+
+def test_update_y_delete_devuelven_las_filas_afectadas(cliente):
+    actualizados = cliente.table('cierres_caja').update({'estado': 'CERRADO'}).eq('sucursal_id', 's1').execute()
+    assert sorted(ids(actualizados)) == ['c1', 'c2']
+    assert {f['estado'] for f in cliente.table('cierres_caja').select('estado').eq('sucursal_id', 's1').execute().data} == {'CERRADO'}
+    eliminados = cliente.table('gastos_caja').delete().in_('id', ['ga3', 'nope']).execute()
+    assert ids(eliminados) == ['ga3']
+
+
+def test_clave_unica_en_insert(cliente):
+    cliente.table('ingresos_adicionales').insert({'cierre_id': 'c1', 'socio_id': 'so1', 'metodo_pago': 'Yappy', 'monto': 1}).execute()
+    with pytest.raises(ErrorLocal) as error:
+        cliente.table('ingresos_adicionales').insert({'cierre_id': 'c1', 'socio_id': 'so1', 'metodo_pago': 'Yappy', 'monto': 2}).execute()
+    assert error.value.code == '23505'
+
+
+def test_upsert_sobre_clave_unica_actualiza(cliente):
+    tabla = cliente.table
+    primera = tabla('ingresos_adicionales').upsert(
+        [{'cierre_id': 'c1', 'socio_id': 'so1', 'metodo_pago': 'Yappy', 'monto': 1, 'notas': 'n'}],
+        on_conflict='cierre_id,socio_id,metodo_pago').execute().data[0]
+    segunda = tabla('ingresos_adicionales').upsert(
+        [{'cierre_id': 'c1', 'socio_id': 'so1', 'metodo_pago': 'Yappy', 'monto': 4},
+         {'cierre_id': 'c1', 'socio_id': 'so1', 'metodo_pago': 'Efectivo', 'monto': 2}],
+        on_conflict='cierre_id,socio_id,metodo_pago').execute().data
+    assert segunda[0]['id'] == primera['id'] and segunda[0]['monto'] == 4 and segunda[0]['notas'] == 'n'
+    assert len(tabla('ingresos_adicionales').select('id').execute().data) == 2
+
+
+def test_delete_bloqueado_por_referencia(cliente):
+    with pytest.raises(ErrorLocal) as error:
+        cliente.table('gastos_categorias').delete().eq('id', 'g1').execute()
+    assert error.value.code == '23503'
+    assert len(cliente.table('gastos_categorias').select('id').execute().data) == 2
+
+
+def test_estadisticas_cuentan_peticiones(cliente):
+    cliente.reiniciar_estadisticas()
+    cliente.table('sucursales').select('*').execute()
+    cliente.table('sucursales').select('*').eq('id', 's1').execute()
+    cliente.rpc('eliminar_deliveries_con_gasto', {'p_delivery_ids': []}).execute()
+    assert cliente.estadisticas() == {
+        'total': 3, 'detalle': {('sucursales', 'select'): 2, ('rpc:eliminar_deliveries_con_gasto', 'rpc'): 1}
+    }
+
+
+def test_sesion_propia_comparte_la_base(cliente):
+    otro = cliente.con_sesion_propia()
+    otro.table('sucursales').insert({'id': 's3', 'sucursal': 'Sur'}).execute()
+    assert cliente.table('sucursales').select('id').eq('id', 's3').single().execute().data == {'id': 's3'}
+    assert otro.auth is not cliente.auth
+
+
+# --- Auth ---
+
+def test_auth_devuelve_auth_response(cliente):
+    respuesta = cliente.auth.sign_in_with_password({'email': 'ana@x', 'password': 'secreta'})
+    assert isinstance(respuesta, AuthResponse) and isinstance(respuesta.session, Session)
+    assert respuesta.user.id == 'u1' and respuesta.session.access_token
+    assert not hasattr(respuesta, 'access_token')
+    with pytest.raises(ErrorLocal):
+        cliente.auth.sign_in_with_password({'email': 'ana@x', 'password': 'mala'})
+
+
+# --- RPC ---
+
+def test_rpc_inexistente(cliente):
+    with pytest.raises(ErrorLocal) as error:
+        cliente.rpc('no_existe', {}).execute()
+    assert error.value.code == 'PGRST202'
+
+
+def test_rpc_totales_pagos_delta_consolida_y_avanza_la_marca(cliente):
+    ahora = datetime.now(timezone.utc)
+    viejo = (ahora - timedelta(minutes=10)).isoformat()
+    reciente = (ahora - timedelta(seconds=5)).isoformat()
+    cliente.cargar_datos({'pagos': [
+        {'id': 'p1', 'sucursal': 'Centro', 'metodo_pago': 'Efectivo', 'monto': 10, 'created_at': viejo},
+        {'id': 'p2', 'sucursal': 'Centro', 'metodo_pago': 'Efectivo', 'monto': 2.5, 'created_at': viejo},
+        {'id': 'p3', 'sucursal': 'Centro', 'metodo_pago': 'Yappy', 'monto': 4, 'created_at': reciente},
+        {'id': 'p4', 'sucursal': 'Norte', 'metodo_pago': 'Yappy', 'monto': 99, 'created_at': viejo},
+    ]})
+    params = {'p_sucursal': 'Centro', 'p_desde': (ahora - timedelta(hours=1)).isoformat(), 'p_hasta': (ahora + timedelta(hours=1)).isoformat()}
+    filas = cliente.rpc('totales_pagos_delta', params).execute().data
+    por_metodo = {(f['metodo_pago'], f['consolidado']): (f['total'], f['cantidad']) for f in filas}
+    assert por_metodo == {('Efectivo', True): (12.5, 2), ('Yappy', False): (4.0, 1)}
+    marca = (filas[0]['marca_created_at'], filas[0]['marca_id'])
+    assert marca[1] == 'p2'
+
+    # Desde la marca solo vuelven los pagos no consolidados
+    filas = cliente.rpc('totales_pagos_delta', {**params, 'p_marca_created_at': marca[0], 'p_marca_id': marca[1]}).execute().data
+    assert [(f['metodo_pago'], f['consolidado'], f['total']) for f in filas] == [('Yappy', False, 4.0)]
+
+
+def test_rpc_registrar_delivery_con_gasto(cliente):
+    params = {'p_cierre_id': 'c2', 'p_usuario_id': 'u1', 'p_sucursal_id': 's1', 'p_sucursal_nombre': 'Centro',
+              'p_monto_cobrado': 10, 'p_costo_repartidor': 3, 'p_origen_nombre': 'Socio A', 'p_notas': 'n',
+              'p_categoria_gasto_id': 'g1', 'p_nota_gasto': 'Delivery'}
+    resultado = cliente.rpc('registrar_delivery_con_gasto', params).execute().data
+    assert resultado['delivery']['gasto_asociado_id'] == resultado['gasto']['id']
+    assert resultado['gasto']['monto'] == 3 and resultado['gasto']['cierre_id'] == 'c2'
+
+    sin_costo = cliente.rpc('registrar_delivery_con_gasto', {**params, 'p_costo_repartidor': 0}).execute().data
+    assert sin_costo['gasto'] is None and sin_costo['delivery']['gasto_asociado_id'] is None
+
+
+def test_rpc_eliminar_delivery_con_gasto(cliente):
+    params = {'p_cierre_id': 'c2', 'p_usuario_id': 'u1', 'p_sucursal_id': 's1', 'p_sucursal_nombre': 'Centro',
+              'p_monto_cobrado': 10, 'p_costo_repartidor': 3, 'p_origen_nombre': 'Socio A', 'p_notas': '',
+              'p_categoria_gasto_id': 'g1', 'p_nota_gasto': ''}
+    creado = cliente.rpc('registrar_delivery_con_gasto', params).execute().data
+    resultado = cliente.rpc('eliminar_delivery_con_gasto', {'p_delivery_id': creado['delivery']['id']}).execute().data
+    assert resultado['delivery']['id'] == creado['delivery']['id'] and resultado['gasto']['id'] == creado['gasto']['id']
+    assert cliente.table('gastos_caja').select('id').eq('id', creado['gasto']['id']).execute().data == []
+
+    repetido = cliente.rpc('eliminar_delivery_con_gasto', {'p_delivery_id': creado['delivery']['id']}).execute().data
+    assert repetido == {'delivery': None, 'gasto': None}
+
+
+def test_rpc_eliminar_deliveries_con_gasto_informa_por_id(cliente):
+    params = {'p_cierre_id': 'c2', 'p_usuario_id': 'u1', 'p_sucursal_id': 's1', 'p_sucursal_nombre': 'Centro',
+              'p_monto_cobrado': 10, 'p_origen_nombre': 'Socio A', 'p_notas': '', 'p_categoria_gasto_id': 'g1', 'p_nota_gasto': ''}
+    con_gasto = cliente.rpc('registrar_delivery_con_gasto', {**params, 'p_costo_repartidor': 3}).execute().data
+    sin_gasto = cliente.rpc('registrar_delivery_con_gasto', {**params, 'p_costo_repartidor': 0}).execute().data
+    filas = cliente.rpc('eliminar_deliveries_con_gasto', {
+        'p_delivery_ids': [con_gasto['delivery']['id'], sin_gasto['delivery']['id'], 'nope']
+    }).execute().data
+    assert [(f['eliminado'], f['cierre_id'], f['gasto_id'], f['motivo']) for f in filas] == [
+        (True, 'c2', con_gasto['gasto']['id'], None),
+        (True, 'c2', None, None),
+        (False, None, None, None),
+    ]
+    assert cliente.table('cierre_delivery').select('id').execute().data == []
+    assert cliente.table('gastos_caja').select('id').eq('id', con_gasto['gasto']['id']).execute().data == []
+
+
+def test_rpc_eliminar_filas_por_ids_informa_por_id(cliente, monkeypatch):
+    # ga2 queda referenciado: su borrado falla y los demás se borran igual
+    monkeypatch.setitem(db_local.REFERENCIAS, 'gastos_caja', [('cierre_delivery', 'gasto_asociado_id')])
+    cliente.table('cierre_delivery').insert({'cierre_id': 'c1', 'gasto_asociado_id': 'ga2'}).execute()
+    filas = cliente.rpc('eliminar_filas_por_ids', {'p_tabla': 'gastos_caja', 'p_ids': ['ga1', 'ga2', 'nope']}).execute().data
+    assert [(f['id'], f['cierre_id'], f['eliminado'], f['motivo'] is not None) for f in filas] == [
+        ('ga1', 'c1', True, False),
+        ('ga2', None, False, True),
+        ('nope', None, False, False),
+    ]
+    assert ids(cliente.table('gastos_caja').select('id').order('id').execute()) == ['ga2', 'ga3']
+
+    with pytest.raises(ErrorLocal):
+        cliente.rpc('eliminar_filas_por_ids', {'p_tabla': 'sucursales', 'p_ids': ['s1']}).execute()
+
+
+def test_todas_las_rpc_de_las_migraciones_estan_registradas():
+    import glob
+    import os
+    import re
+    carpeta = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'supabase', 'migrations')
+    creadas, eliminadas = set(), set()
+    for ruta in sorted(glob.glob(os.path.join(carpeta, '*.sql'))):
+        with open(ruta, encoding='utf-8') as f:
+            sql = f.read()
+        for nombre, encabezado in re.findall(r'create or replace function public\.(\w+)(.*?)\$\$', sql, re.S):
+            if re.search(r'returns\s+trigger', encabezado):
+                continue   # funciones de trigger: no se llaman por RPC
+            creadas.add(nombre)
+            eliminadas.discard(nombre)
+        for nombre in re.findall(r"drop function if exists public\.(\w+)|proname = '(\w+)'", sql):
+            nombre = next(n for n in nombre if n)
+            if nombre not in re.findall(r'create or replace function public\.(\w+)', sql):
+                eliminadas.add(nombre)
+                creadas.discard(nombre)
+    assert creadas <= set(db_local.FUNCIONES_RPC)
+
+
+def test_version_del_cierre_avanza_una_vez_por_peticion(cliente):
+    def versiones():
+        filas = cliente.table('cierres_caja').select('id, version').order('id').execute().data
+        return {f['id']: f['version'] for f in filas}
+
+    inicial = versiones()
+    filas = [{'cierre_id': 'c2', 'socio_id': 'so1', 'metodo_pago': m, 'monto': 1} for m in ('Yappy', 'Tarjeta')]
+    cliente.table('ingresos_adicionales').upsert(filas, on_conflict='cierre_id,socio_id,metodo_pago').execute()
+    assert versiones()['c2'] == inicial['c2'] + 1
+    cliente.rpc('registrar_delivery_con_gasto', {
+        'p_cierre_id': 'c2', 'p_usuario_id': 'u1', 'p_sucursal_id': 's1', 'p_sucursal_nombre': 'Centro',
+        'p_monto_cobrado': 10, 'p_costo_repartidor': 3, 'p_origen_nombre': 'Socio A', 'p_notas': '',
+        'p_categoria_gasto_id': 'g1', 'p_nota_gasto': ''}).execute()
+    assert versiones()['c2'] == inicial['c2'] + 2
+    actualizado = cliente.table('cierres_caja').update({'saldo_inicial': 5}).eq('id', 'c2').execute().data[0]
+    assert actualizado['version'] == versiones()['c2'] == inicial['c2'] + 3
+    cliente.rpc('cambiar_estado_cierre', {'p_cierre_id': 'c2', 'p_estado': 'CERRADO'}).execute()
+    assert versiones()['c2'] == inicial['c2'] + 4
+
+    # Un borrado que toca dos cierres avanza cada uno una vez; los demás no cambian
+    antes = versiones()
+    cliente.table('gastos_caja').delete().in_('id', ['ga1', 'ga2', 'ga3']).execute()
+    assert versiones() == {'c1': antes['c1'] + 1, 'c2': antes['c2'] + 1, 'c3': antes['c3']}
+
+
+def test_rpc_cambiar_estado_cierre_escribe_y_borra_totales(cliente):
+    resumen = {
+        'desglose_rayo': [{'metodo': 'Efectivo', 'tipo': 'externo', 'total': 10}, {'metodo': 'Efectivo', 'tipo': 'externo', 'total': 2.5}],
+        'totales_por_socio': [{'socio': 'Socio A', 'desglose': [{'metodo': 'Yappy', 'total': 4}]}],
+    }
+    cliente.table('cierres_caja').update({'resumen_del_dia': resumen}).eq('id', 'c2').execute()
+
+    def totales():
+        filas = cliente.table('totales_diarios').select('*').eq('cierre_id', 'c2').order('fuente').execute().data
+        return [(f['fuente'], f['metodo_pago'], f['tipo'], f['total'], f['fecha'], f['usuario_id']) for f in filas]
+
+    cerrado = cliente.rpc('cambiar_estado_cierre', {
+        'p_cierre_id': 'c2', 'p_estado': 'CERRADO', 'p_fecha_hora_cierre_real': '2026-10-02T20:00:00-05:00', 'p_nota_discrepancia': 'n'
+    }).execute().data
+    assert cerrado[0]['estado'] == 'CERRADO' and cerrado[0]['nota_discrepancia'] == 'n'
+    esperado = [('Rayo (POS)', 'Efectivo', 'externo', 12.5, '2026-10-02', 'u1'), ('Socio A', 'Yappy', 'externo', 4.0, '2026-10-02', 'u1')]
+    assert totales() == esperado
+
+    # Finalizar dos veces deja las mismas filas; reabrir las borra
+    cliente.rpc('cambiar_estado_cierre', {'p_cierre_id': 'c2', 'p_estado': 'CERRADO'}).execute()
+    assert totales() == esperado
+    reabierto = cliente.rpc('cambiar_estado_cierre', {'p_cierre_id': 'c2', 'p_estado': 'ABIERTO'}).execute().data
+    assert reabierto[0]['estado'] == 'ABIERTO'
+    assert totales() == []
+    assert cliente.rpc('cambiar_estado_cierre', {'p_cierre_id': 'nope', 'p_estado': 'CERRADO'}).execute().data == []
+
+
+def test_totales_de_dos_cierres_del_mismo_dia_no_se_pisan(cliente):
+    resumen = {'desglose_rayo': [{'metodo': 'Efectivo', 'tipo': 'externo', 'total': 5}]}
+    cliente.table('cierres_caja').update({'resumen_del_dia': resumen}).in_('id', ['c2', 'c3']).execute()
+    cliente.table('cierres_caja').update({'sucursal_id': 's1'}).eq('id', 'c3').execute()
+    for cierre_id in ('c2', 'c3'):
+        cliente.rpc('cambiar_estado_cierre', {'p_cierre_id': cierre_id, 'p_estado': 'CERRADO'}).execute()
+    filas = cliente.table('totales_diarios').select('cierre_id, total').eq('fecha', '2026-10-02').order('cierre_id').execute().data
+    assert filas == [{'cierre_id': 'c2', 'total': 5.0}, {'cierre_id': 'c3', 'total': 5.0}]
+
+
+def test_rpc_finalizar_cierre_cde_con_totales(cliente):
+    cliente.cargar_datos({'cierres_cde': [{
+        'id': 'cde1', 'fecha_operacion': '2026-10-02', 'sucursal_id': 's1', 'usuario_id': 'u1', 'estado': 'ABIERTO',
+        'total_efectivo_sistema': 20, 'total_efectivo_contado': 19,
+        'verificacion_metodos': {'Yappy': {'tipo': 'verificado', 'total_sistema': 7, 'total_manual': 6}, 'Efectivo': {'total_sistema': 20}},
+    }]})
+    cierre = cliente.rpc('finalizar_cierre_cde_con_totales', {'p_cierre_cde_id': 'cde1', 'p_discrepancia': True}).execute().data[0]
+    assert cierre['estado'] == 'CERRADO' and cierre['discrepancia'] is True
+    filas = cliente.table('totales_diarios').select('fuente, metodo_pago, tipo, total, total_reportado') \
+        .eq('cierre_cde_id', 'cde1').order('metodo_pago').execute().data
+    assert filas == [
+        {'fuente': 'CDE', 'metodo_pago': 'Efectivo', 'tipo': 'efectivo', 'total': 20, 'total_reportado': 19},
+        {'fuente': 'CDE', 'metodo_pago': 'Yappy', 'tipo': 'verificado', 'total': 7, 'total_reportado': 6},
+    ]
+
+
+def test_rpc_reporte_ingresos_desde_json_lee_totales_de_los_cerrados(cliente):
+    resumen = {'desglose_rayo': [{'metodo': 'Efectivo', 'tipo': 'externo', 'total': 5}],
+               'totales_por_socio': [{'socio': 'Socio A', 'desglose': [{'metodo': 'Yappy', 'total': 2}]}]}
+    cliente.table('cierres_caja').update({'resumen_del_dia': resumen}).in_('id', ['c2', 'c3']).execute()
+    cliente.rpc('cambiar_estado_cierre', {'p_cierre_id': 'c2', 'p_estado': 'CERRADO'}).execute()
+    # Un cierre cerrado se reporta desde totales_diarios, no desde su resumen
+    cliente.table('cierres_caja').update({'resumen_del_dia': {'desglose_rayo': []}}).eq('id', 'c2').execute()
+
+    filas = cliente.rpc('reporte_ingresos_desde_json', {'fecha_inicio': '2026-10-02'}).execute().data
+    assert [(f['sucursal'], f['fuente'], f['metodo'], f['total'], f['cierre_id'], f['total_filas']) for f in filas] == [
+        ('Centro', 'Rayo (POS)', 'Efectivo', 5.0, None, 4),
+        ('Centro', 'Socio A', 'Yappy', 2.0, None, 4),
+        ('Norte', 'Rayo (POS)', 'Efectivo', 5.0, None, 4),
+        ('Norte', 'Socio A', 'Yappy', 2.0, None, 4),
+    ]
+
+    por_cierre = cliente.rpc('reporte_ingresos_desde_json', {
+        'p_sucursal_ids': ['s1'], 'p_fuente': 'Rayo (POS)', 'p_por_cierre': True
+    }).execute().data
+    assert [(f['cierre_id'], f['sucursal_id'], f['usuario_id'], f['total']) for f in por_cierre] == [('c2', 's1', 'u1', 5.0)]
+
+    pagina = cliente.rpc('reporte_ingresos_desde_json', {'p_limite': 1, 'p_desplazamiento': 1}).execute().data
+    assert len(pagina) == 1 and pagina[0]['fuente'] == 'Socio A' and pagina[0]['sucursal'] == 'Centro'
@@ -0,0 +1,153 @@
+# trabajos.py
+# Ejecutor de trabajos en segundo plano para los reportes pesados de 1_Reportes_Admin.py.
+#
+# Una búsqueda grande (un año de gastos o deliveries, la construcción del cubo de ingresos)
+# no corre en el hilo del script de Streamlit: lanzar() la envía a un pool de hilos y devuelve
+# un Trabajo con id, progreso y resultado. La página guarda el id en st.session_state y
+# sondea el trabajo con un st.fragment(run_every=...) en lugar de volver a ejecutar la
+# consulta en cada rerun.
+#
+# Los trabajos se identifican por (tipo, filtros normalizados, versiones de las etiquetas de
+# las que dependen): lanzar la misma búsqueda mientras corre, o poco después de terminar
+# (TRABAJOS_RESULTADOS_TTL_S), devuelve el mismo trabajo en lugar de repetir la consulta,
+# salvo que una escritura haya invalidado alguna de sus etiquetas (ver etiquetas.py). Se usan hilos y no procesos para que el trabajo
+# comparta la caché en disco, el cubo de ingresos y los clientes de Supabase del proceso.
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+
+import etiquetas
+import pool_clientes
+
+TRABAJOS_HILOS_MAX = int(os.environ.get("TRABAJOS_HILOS_MAX", 4))
+TRABAJOS_RESULTADOS_TTL_S = float(os.environ.get("TRABAJOS_RESULTADOS_TTL_S", 120))  # reutilización por filtros
+TRABAJOS_RETENCION_S = float(os.environ.get("TRABAJOS_RETENCION_S", 1800))           # luego se descartan
+MAX_TRABAJOS = 50
+
+EN_COLA, EJECUTANDO, LISTO, ERROR = "en_cola", "ejecutando", "listo", "error"
+
+_ejecutor = ThreadPoolExecutor(max_workers=TRABAJOS_HILOS_MAX, thread_name_prefix="trabajos")
+_lock = threading.Lock()
+_trabajos = {}    # id -> Trabajo (en orden de creación)
+_por_clave = {}   # clave de filtros -> id del último trabajo
+
+
+class Trabajo:
+    def __init__(self, tipo, clave, texto):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.clave = clave
+        self.texto = texto
+        self.estado = EN_COLA
+        self.recibidos = 0
+        self.total = None
+        self.resultado = None
+        self.error = None
+        self.creado_en = time.monotonic()
+        self.terminado_en = None
+
+    def informar(self, recibidos, total=None):
+        """Lo llama la función del trabajo para publicar su progreso."""
+        self.recibidos, self.total = recibidos, total
+
+    @property
+    def progreso(self):
+        if self.estado in (LISTO, ERROR):
+            return 1.0
+        return min(self.recibidos / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def terminado(self):
+        return self.estado in (LISTO, ERROR)
+
+    def reutilizable(self):
+        return not self.terminado or (self.estado == LISTO and time.monotonic() - self.terminado_en < TRABAJOS_RESULTADOS_TTL_S)
+
+
+def clave_filtros(tipo, filtros, depende_de=()):
+    """
+    Clave estable de una búsqueda: ignora los filtros None y el orden de las listas, e
+    incluye las versiones actuales de las etiquetas depende_de.
+    """
+    normalizados = {
+        k: sorted(map(str, v)) if isinstance(v, (list, tuple, set)) else str(v)
+        for k, v in (filtros or {}).items() if v is not None and v != []
+    }
+    versiones = [list(par) for par in etiquetas.versiones(depende_de)]
+    return hashlib.sha1(json.dumps([tipo, normalizados, versiones], sort_keys=True).encode()).hexdigest()
+
+
+def _purgar():
+    ahora = time.monotonic()
+    for trabajo_id, trabajo in list(_trabajos.items()):
+        vencido = trabajo.terminado and ahora - trabajo.terminado_en > TRABAJOS_RETENCION_S
+        if vencido or (len(_trabajos) > MAX_TRABAJOS and trabajo.terminado):
+            del _trabajos[trabajo_id]
+            if _por_clave.get(trabajo.clave) == trabajo_id:
+                del _por_clave[trabajo.clave]
+
+
+def _ejecutar(trabajo, funcion):
+    trabajo.estado = EJECUTANDO
+    try:
+        resultado, err = funcion(trabajo)
+    except Exception as e:
+        resultado, err = None, f"Error inesperado en el trabajo '{trabajo.tipo}': {e}"
+    # Se publica bajo _lock y con terminado_en antes que el estado: reutilizable() y _purgar()
+    # usan terminado_en en cuanto ven el trabajo terminado.
+    with _lock:
+        trabajo.terminado_en = time.monotonic()
+        trabajo.resultado, trabajo.error = resultado, err
+        trabajo.estado = ERROR if err else LISTO
+
+
+def lanzar(tipo, filtros, funcion, texto="Procesando...", forzar=False, depende_de=()):
+    """
+    Ejecuta funcion(trabajo) -> (resultado, error) en segundo plano y devuelve el Trabajo.
+    Si ya hay uno con los mismos filtros corriendo o recién terminado, y ninguna etiqueta
+    de depende_de se invalidó desde entonces, devuelve ese.
+    Se ejecuta con el cliente de Supabase de la sesión que lo lanza.
+    """
+    clave = clave_filtros(tipo, filtros, depende_de)
+    with _lock:
+        _purgar()
+        existente = _trabajos.get(_por_clave.get(clave))
+        if existente and not forzar and existente.reutilizable():
+            return existente
+        trabajo = Trabajo(tipo, clave, texto)
+        _trabajos[trabajo.id] = trabajo
+        _por_clave[clave] = trabajo.id
+    _ejecutor.submit(pool_clientes.en_sesion_actual(_ejecutar), trabajo, funcion)
+    return trabajo
+
+
+def lanzar_paginado(tipo, filtros, iterar, procesar_pagina=None, texto="Buscando...", forzar=False, depende_de=()):
+    """
+    Atajo para las búsquedas paginadas de database (generadores de (filas, total, error)):
+    el trabajo llama iterar(**filtros), transforma cada página con procesar_pagina y
+    deja como resultado la lista acumulada, o una sola tabla Arrow si las páginas son tablas.
+    """
+    def funcion(trabajo):
+        paginas = []
+        for filas, total, err in iterar(**filtros):
+            if err:
+                return None, err
+            paginas.append(procesar_pagina(filas) if procesar_pagina else filas)
+            trabajo.informar(trabajo.recibidos + len(filas), total)
+        if paginas and all(isinstance(p, pa.Table) for p in paginas):
+            return pa.concat_tables(paginas, promote_options="permissive"), None
+        return [fila for pagina in paginas for fila in pagina], None
+    return lanzar(tipo, filtros, funcion, texto=texto, forzar=forzar, depende_de=depende_de)
+
+
+def obtener(trabajo_id):
+    """El Trabajo con ese id, o None si no existe o ya se descartó."""
+    with _lock:
+        return _trabajos.get(trabajo_id) if trabajo_id else None